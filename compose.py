@@ -56,6 +56,9 @@ for p in (up_parser, stop_parser, ps_parser):
 	p.add_argument('--embedded-ilias-port', help='port to run embedded ILIAS on', nargs='?', const=1, type=int, default=11145)
 
 up_parser.add_argument('n', nargs='?', type=int, default=1)
+up_parser.add_argument('--runners', help='number of concurrent exam runners per machine', type=int, default=1)
+up_parser.add_argument('--http-runners', help='number of concurrent http participants per machine', type=int)
+up_parser.add_argument('--compress-frames', help='compress large results and screenshots inside machines', action='store_true')
 up_parser.add_argument('--fork', help='fork up.py', action='store_true')
 up_parser.add_argument('--rebuild', help='rebuild docker containers', action='store_true')
 up_parser.add_argument('--rebuild-no-cache', help='rebuild docker containers without cache', action='store_true')
@@ -164,6 +167,15 @@ def set_argument_environ(args):
 
 	entrypoint_args.extend(['--tiltr-port', str(args.port)])
 
+	if getattr(args, 'runners', 1) > 1:
+		entrypoint_args.extend(['--machine-runners', str(args.runners)])
+
+	if getattr(args, 'http_runners', None) is not None:
+		entrypoint_args.extend(['--machine-http-runners', str(args.http_runners)])
+
+	if getattr(args, 'compress_frames', False):
+		entrypoint_args.append('--compress-frames')
+
 	if args.ilias:
 		embedded_ilias = False
 
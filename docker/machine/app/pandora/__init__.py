@@ -5,10 +5,32 @@
 # GPLv3, see LICENSE
 #
 
+import time
+import threading
+import traceback
+from collections import defaultdict
+
 import selenium
 from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
 
 
+# driver-wide timeout for asynchronous scripts. scripts that wait for something in the
+# browser (e.g. tiltr's page load waits) enforce their own, shorter deadline and only rely
+# on this as an upper bound.
+script_timeout = 300
+
+
+class _Remote(selenium.webdriver.Remote):
+	# counts the commands it sends (element commands go through here too), so that callers
+	# can tell how many roundtrips something took, see tiltr's dom.count_commands.
+
+	n_commands = 0
+
+	def execute(self, driver_command, params=None):
+		self.n_commands += 1
+		return super().execute(driver_command, params)
+
+
 class Browser:
 	@staticmethod
 	def _configure_driver(driver, resolution):
@@ -25,28 +47,191 @@ class Browser:
 			driver.set_window_size(w, h)
 
 			driver.set_page_load_timeout(30)
+			driver.set_script_timeout(script_timeout)
 
 		except:
 			driver.quit()
 			raise
 
-	def __init__(self, browser='firefox', **kwargs):
+	@staticmethod
+	def _create_driver(browser, resolution):
 		capabilities = dict(
 			chrome=DesiredCapabilities.CHROME,
 			firefox=DesiredCapabilities.FIREFOX)
 
-		self._driver = selenium.webdriver.Remote(
+		driver = _Remote(
 			command_executor='http://selenium-%s:%d/wd/hub' % (browser, 4444),
 			desired_capabilities=capabilities.get(browser))
 
-		Browser._configure_driver(self._driver, kwargs.get('resolution'))
+		Browser._configure_driver(driver, resolution)
+		return driver
+
+	def __init__(self, browser='firefox', pool=None, **kwargs):
+		self._pool = pool
+		resolution = kwargs.get('resolution')
+
+		if pool is not None:
+			self._session = pool.acquire(browser, resolution)
+			self._driver = self._session.driver
+		else:
+			self._session = None
+			self._driver = Browser._create_driver(browser, resolution)
 
 	def __enter__(self):
 		return self
 
-	def __exit__(self, *args):
-		self._driver.quit()
+	def __exit__(self, exc_type, *args):
+		if self._session is not None:
+			# never hand out sessions that were in use when something went wrong.
+			self._pool.release(self._session, reuse=exc_type is None)
+		else:
+			self._driver.quit()
 
 	@property
 	def driver(self):
 		return self._driver
+
+
+class _Session:
+	def __init__(self, browser, resolution, driver):
+		self.browser = browser
+		self.resolution = resolution
+		self.driver = driver
+		self.uses = 0
+		self.idle_since = time.time()
+
+
+class BrowserPool:
+	# keeps warm selenium sessions around, so that we don't pay the browser startup for
+	# each use. sessions get reset between uses and replaced after max_uses uses.
+
+	def __init__(self, max_uses=20, max_idle=4, max_idle_time=120):
+		self.max_uses = max_uses
+		self.max_idle = max_idle
+		self.max_idle_time = max_idle_time
+
+		self._mutex = threading.Lock()
+		self._idle = defaultdict(list)  # (browser, resolution) -> [_Session]
+
+		self.hits = 0
+		self.misses = 0
+		self.discarded = 0
+		self.startup_time = 0.0
+
+	@staticmethod
+	def _quit(session):
+		try:
+			session.driver.quit()
+		except:
+			pass  # session is probably dead already
+
+	@staticmethod
+	def _is_healthy(session):
+		try:
+			session.driver.execute_script('return 1')
+			return True
+		except:
+			return False
+
+	@staticmethod
+	def _reset(session):
+		driver = session.driver
+
+		# close all windows but one.
+		handles = driver.window_handles
+		for handle in handles[1:]:
+			driver.switch_to.window(handle)
+			driver.close()
+		driver.switch_to.window(handles[0])
+
+		try:
+			driver.switch_to.alert.dismiss()
+		except:
+			pass  # no alert
+
+		# cookies and storage are bound to the current site, so clear them before leaving it.
+		driver.delete_all_cookies()
+		try:
+			driver.execute_script('window.localStorage.clear(); window.sessionStorage.clear();')
+		except:
+			pass  # no storage on this page
+
+		driver.get('about:blank')
+		Browser._configure_driver(driver, session.resolution)
+
+	def acquire(self, browser, resolution):
+		key = (browser, resolution)
+
+		while True:
+			with self._mutex:
+				idle = self._idle[key]
+				session = idle.pop() if idle else None
+
+			if session is None:
+				break
+
+			if time.time() - session.idle_since < self.max_idle_time and self._is_healthy(session):
+				with self._mutex:
+					self.hits += 1
+				session.uses += 1
+				return session
+
+			with self._mutex:
+				self.discarded += 1
+			self._quit(session)
+
+		t0 = time.time()
+		session = _Session(browser, resolution, Browser._create_driver(browser, resolution))
+		session.uses = 1
+
+		with self._mutex:
+			self.misses += 1
+			self.startup_time += time.time() - t0
+
+		return session
+
+	def release(self, session, reuse=True):
+		if reuse and session.uses < self.max_uses:
+			try:
+				self._reset(session)
+			except:
+				traceback.print_exc()
+				reuse = False
+		else:
+			reuse = False
+
+		if reuse:
+			session.idle_since = time.time()
+			with self._mutex:
+				idle = self._idle[(session.browser, session.resolution)]
+				if len(idle) < self.max_idle:
+					idle.append(session)
+					return
+
+		with self._mutex:
+			self.discarded += 1
+		self._quit(session)
+
+	def clear(self):
+		with self._mutex:
+			sessions = [s for idle in self._idle.values() for s in idle]
+			self._idle.clear()
+		for session in sessions:
+			self._quit(session)
+
+	def get_stats(self):
+		with self._mutex:
+			return dict(
+				hits=self.hits,
+				misses=self.misses,
+				discarded=self.discarded,
+				idle=sum(len(idle) for idle in self._idle.values()),
+				mean_startup_time=self.startup_time / self.misses if self.misses > 0 else 0.0)
+
+	def print_status(self, report):
+		stats = self.get_stats()
+		n = stats["hits"] + stats["misses"]
+		report("browser pool: %d sessions handed out, %d hits (%.0f%%), %d misses, %d discarded, %d idle." % (
+			n, stats["hits"], 100 * stats["hits"] / n if n > 0 else 0,
+			stats["misses"], stats["discarded"], stats["idle"]))
+		report("mean browser startup time %.2fs." % stats["mean_startup_time"])
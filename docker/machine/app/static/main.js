@@ -484,7 +484,7 @@ $(function() {
 	function machineIndex(machine) {
 		return (machine == "master" ?
 			0 :
-			parseInt(machine.replace("machine_", "")));
+			parseInt(machine.replace("participant_", "")));
 	}
 
 	function setScreenshot(machine, src) {
@@ -553,7 +553,8 @@ $(function() {
 	var screenshots = {
 		updating: false,
 		dirty: {},
-		machines: []
+		machines: [],
+		batchId: null
 	};
 
     var connected = false;
@@ -571,11 +572,19 @@ $(function() {
 		screenshots.dirty[machine] = false;
 
 		screenshots.updating = true;
+		var url = host + "/screenshot/" + machine;
+		if (screenshots.batchId) {
+			url += "?batch=" + encodeURIComponent(screenshots.batchId);
+		}
+
 		$.ajax({
-			url: host + "/screenshot/" + machine,
+			url: url,
 		}).done(function(data) {
 			if (data) {
-				setScreenshot(machine, "data:image/png;base64," + data);
+				if (!data.startsWith("data:")) {
+					data = "data:image/png;base64," + data;
+				}
+				setScreenshot(machine, data);
 			}
 		}).always(function() {
 			screenshots.updating = false;
@@ -644,7 +653,7 @@ $(function() {
 			log.scrollTop(log[0].scrollHeight - log.height());
 		}
 
-		if (machine == "master" || machineNo > 0) {
+		if (machine == "master" || machine.startsWith("participant_")) {
 			if (!screenshots.dirty[machine]) {
 				screenshots.dirty[machine] = true;
 				screenshots.machines.push(machine);
@@ -673,6 +682,7 @@ $(function() {
 
 		console.log("connecting to batch " + batchId);
 		connected = true;
+		screenshots.batchId = batchId;
 
 		var ws = new WebSocket(
 			"ws://" + window.location.hostname + ":" + port + "/websocket/" + batchId);
@@ -809,7 +819,7 @@ $(function() {
 
 	setScreenshot("master", "/static/default/screen.png");
 	for (var i = 1; i <= NUM_MACHINES; i++) {
-		setScreenshot("machine_" + i.toString(), "/static/default/screen.png");
+		setScreenshot("participant_" + i.toString(), "/static/default/screen.png");
 	}
 
 	$("[data-workarounds-content]").hide();
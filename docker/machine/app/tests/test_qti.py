@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+import os
+import glob
+import unittest
+from html import escape
+from zipfile import ZipFile
+
+from selenium.common.exceptions import NoSuchElementException
+
+from tiltr.data.settings import Settings
+from tiltr.driver.catalog import find_xml, qti_xml_pattern
+from tiltr.driver.document import parse_document, select
+from tiltr.question.qti import parse_qti_questions, get_definition
+from tiltr.question.questions.single_choice import SingleChoiceQuestion
+from tiltr.question.questions.multiple_choice import MultipleChoiceQuestion
+from tiltr.question.questions.kprim import KPrimQuestion
+from tiltr.question.questions.cloze import ClozeQuestion
+from tiltr.question.questions.matching import MatchingQuestion
+from tiltr.question.questions.longtext import LongTextQuestion
+
+
+# checks that questions read from the QTI of the test archives in data/tests are the same
+# as those that TestDriver.parse_question_definitions builds from the ILIAS UI. the UI is
+# given as the edit forms ILIAS shows for the questions, as far as the questions read them.
+
+
+tests_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "..", "data", "tests")
+
+
+class _Element:
+	# the parts of selenium's WebElement that question constructors use.
+	def __init__(self, element):
+		self.element = element
+
+	def get_attribute(self, name):
+		if name == "value":
+			return self.element.value
+		return self.element.get(name)
+
+	def is_selected(self):
+		return self.element.checked
+
+	def click(self):
+		self.element.click()
+
+
+class _Driver:
+	# the parts of selenium's WebDriver that question constructors use, on a static page.
+	def __init__(self, html):
+		self.document = parse_document(html)
+
+	def _find(self, elements):
+		elements = list(elements)
+		if not elements:
+			raise NoSuchElementException()
+		return _Element(elements[0])
+
+	def find_elements_by_name(self, name):
+		return [_Element(e) for e in self.document.iter() if e.get("name") == name]
+
+	def find_element_by_name(self, name):
+		return self._find(e for e in self.document.iter() if e.get("name") == name)
+
+	def find_element_by_id(self, id):
+		return self._find(e for e in self.document.iter() if e.get("id") == id)
+
+	def find_element_by_css_selector(self, css):
+		return self._find(select(self.document, css))
+
+	def execute_script(self, script, css):
+		# MatchingQuestion._ui_get_pairs, which gets the values of the matched elements.
+		def values(css):
+			if css.count('"') % 2 == 1:
+				css += '"]'  # the browser closes unterminated selectors at their end.
+			return [e.value for e in select(self.document, css)]
+		return [values(selector) for selector, _ in css]
+
+
+def _input(name, value, type="text", checked=False, id=None):
+	return '<input type="%s" name="%s"%s value="%s"%s>' % (
+		type, name, ' id="%s"' % id if id else '', escape(str(value)), ' checked="checked"' if checked else '')
+
+
+def _select(name, options, selected, id=None):
+	return '<select name="%s"%s>%s</select>' % (name, ' id="%s"' % id if id else '', "".join(
+		'<option value="%s"%s>%s</option>' % (
+			escape(value), ' selected="selected"' if value == selected else '', escape(value))
+		for value in options))
+
+
+def _choices_form(choices, unchecked=False):
+	html = []
+	for i, choice in enumerate(choices):
+		html.append(_input("choice[answer][%d]" % i, choice[0]))
+		html.append(_input("choice[points][%d]" % i, choice[1]))
+		if unchecked:
+			html.append(_input("choice[points_unchecked][%d]" % i, choice[2]))
+	return html
+
+
+def _kprim_form(halfpoints, points, choices):
+	html = [
+		_input("score_partsol_enabled", "1", type="checkbox", checked=halfpoints),
+		_input("points", points)]
+	for i, (name, is_correct) in enumerate(choices):
+		html.append(_input("kprim_answers[answer][%d]" % i, name))
+		html.append(_input("kprim_answers[correctness][%d]" % i, "1", type="radio", checked=is_correct))
+		html.append(_input("kprim_answers[correctness][%d]" % i, "0", type="radio", checked=not is_correct))
+	return html
+
+
+def _cloze_form(identical_scoring, rating, gaps):
+	# gaps are ("text" or "select", [(answer, points)]) or ("numeric", value, lower, upper, points).
+	types = dict(text=0, select=1, numeric=2)
+	html = [_input("fixedTextLength", "")]
+	for i, gap in enumerate(gaps):
+		html.append(_input("clozetype_%d" % i, types[gap[0]], type="hidden"))
+		if gap[0] != "select":
+			html.append(_input("gap_%d_gapsize" % i, ""))
+		if gap[0] == "numeric":
+			for suffix, value in zip(("numeric", "numeric_lower", "numeric_upper", "numeric_points"), gap[1:]):
+				html.append(_input("gap_%d_%s" % (i, suffix), value))
+		else:
+			for j, (answer, points) in enumerate(gap[1]):
+				html.append(_input("gap_%d[answer][%d]" % (i, j), answer, id="gap_%d[answer][%d]" % (i, j)))
+				html.append(_input("gap_%d[points][%d]" % (i, j), points, id="gap_%d[points][%d]" % (i, j)))
+	html.append(_input("identical_scoring", "1", type="checkbox", checked=identical_scoring))
+	html.append(_select("textgap_rating", ("ci", "cs", "l1", "l2", "l3", "l4", "l5"), rating, id="textgap_rating"))
+	return html
+
+
+def _matching_form(mode, definitions, terms, pairs):
+	html = [_input("matching_mode", value, type="radio", checked=value == mode) for value in ("1:1", "n:n")]
+	for what, items in (("definitions", definitions), ("terms", terms)):
+		for i, (identifier, answer) in enumerate(items):
+			html.append(_input("%s[identifier][%d]" % (what, i), identifier, type="hidden"))
+			html.append(_input("%s[answer][%d]" % (what, i), answer))
+	html.append('<table class="matchingpairwizard"><tbody>')
+	for i, (definition, term, points) in enumerate(pairs):
+		html.append("<tr><td>%s</td><td>%s</td><td>%s</td></tr>" % (
+			_select("pairs[definition][%d]" % i, [d for d, _ in definitions], definition),
+			_select("pairs[term][%d]" % i, [t for t, _ in terms], term),
+			_input("pairs[points][%d]" % i, points)))
+	html.append('</tbody></table>')
+	return html
+
+
+# the edit forms of the questions in data/tests, by question title.
+_ui = {
+	"Pumuckl": (SingleChoiceQuestion, _choices_form([
+		("Rot", "1"), ("Grün", "0"), ("Gelb", "0"), ("Orange", "0.5")])),
+
+	"Astrid Lindgren": (MultipleChoiceQuestion, _choices_form([
+		("Michel aus Lönneberga", "1", "-1"),
+		("Karlsson vom Dach", "1", "-1"),
+		("Räuber Hotzenplotz", "-1", "1"),
+		("Das Sams", "-1", "1")], unchecked=True)),
+
+	"Mattisburg": (KPrimQuestion, _kprim_form(True, "2", [
+		("Ronja Räubertochter", True),
+		("Birk Borkason", False),
+		("Lovis", True),
+		(" Die Rumpelwichte", False)])),
+
+	"Schneewittchen": (LongTextQuestion, [
+		_input("scoring_mode", "non", type="radio", checked=True, id="scoring_mode_non"),
+		_input("non_keyword_points", "2", id="non_keyword_points")]),
+
+	"Märchenfiguren": (MatchingQuestion, _matching_form("1:1", [
+		("60252", "Aschenputtel"),
+		("22882", "Schneewittchen"),
+		("78840", "Die Bremer Stadtmusikanten"),
+		("87483", "Die zertanzten Schuhe")], [
+		("37333", "pick, pick, pick, pick"),
+		("85824", "Spieglein, Spieglein an der Wand"),
+		("61511", "Kikeriki!"),
+		("19378", "Du bist eine Schneegans")], [
+		("60252", "37333", "1"),
+		("22882", "85824", "1"),
+		("78840", "61511", "1"),
+		("87483", "19378", "1")])),
+
+	"Identische Bewertung A": (ClozeQuestion, _cloze_form(False, "ci", [
+		("text", [("Aschenputtel", "1"), ("Schneewittchen", "1")]),
+		("text", [("Schneewittchen", "1"), ("Aschenputtel", "1")])])),
+
+	"Identische Bewertung B": (ClozeQuestion, _cloze_form(False, "cs", [
+		("text", [("A", "1")]),
+		("text", [("a", "1"), ("b", "1")])])),
+
+	"Konstanten": (ClozeQuestion, _cloze_form(True, "ci", [
+		("numeric", "3.14159", "3.1", "3.15", "1"),
+		("numeric", "-1", "-1", "-1", "0.5")])),
+
+	"Aschenputtel": (ClozeQuestion, _cloze_form(True, "ci", [
+		("select", [("Vogel", "1"), ("Kämmerer", "0"), ("Prinz", "0")]),
+		("select", [("Pantoffeln", "1"), ("Handschuhe", "0"), ("Kulturbeutel", "0")]),
+		("text", [("Hochzeit", "1"), ("Feier", "0.5")]),
+		("text", [("fremde", "1"), ("reiche", "0"), ("weitgereiste", "0")])])),
+}
+
+
+def _read_qti(path):
+	with ZipFile(path, 'r') as zf:
+		return zf.read(find_xml(zf, qti_xml_pattern))
+
+
+class QTITest(unittest.TestCase):
+	def test_qti_matches_ui(self):
+		settings = Settings()
+
+		paths = sorted(glob.glob(os.path.join(tests_path, "*.zip")))
+		self.assertTrue(paths)
+
+		for path in paths:
+			questions = parse_qti_questions(_read_qti(path), settings)
+			self.assertEqual(set(questions.keys()), set(_ui.keys()), os.path.basename(path))
+
+			for title, (cls, form) in _ui.items():
+				ui_question = cls(_Driver("<form>%s</form>" % "".join(form)), title, settings)
+				self.assertEqual(
+					get_definition(questions[title]), get_definition(ui_question),
+					'"%s" in %s' % (title, os.path.basename(path)))
+
+
+if __name__ == '__main__':
+	unittest.main()
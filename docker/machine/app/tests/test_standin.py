@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+import unittest
+
+from tiltr.http.standin import StandIn
+
+
+# runs an http participant (see driver/http_engine.py) against the local stand-in for ILIAS
+# and checks that the answers it recorded are the ones the stand-in received.
+
+
+class TestStandIn(unittest.TestCase):
+	def setUp(self):
+		self.standin = StandIn()
+
+	def tearDown(self):
+		self.standin.stop()
+
+	def test_http_participant(self):
+		result = self.standin.create_command().run(None, lambda *args: None)
+
+		self.assertIsNotNone(result)
+		self.assertEqual(result.errors, dict())
+		self.assertTrue(self.standin.is_finished())
+
+		recorded = dict((title, dict(dimensions)) for title, dimensions in result.get_answers().items())
+		stored = self.standin.stored_answers()
+		for title in self.standin.questions.keys():
+			self.assertEqual(recorded.get(title), stored.get(title), title)
+
+		self.assertTrue(any(key.startswith("http ") for key in result.metrics["timings"].keys()))
+		self.assertTrue(any(key.startswith("commands ") for key in result.metrics["counters"].keys()))
+
+
+if __name__ == '__main__':
+	unittest.main()
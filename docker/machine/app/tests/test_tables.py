@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+import unittest
+
+from tiltr.driver.tables import parse_elements
+
+
+# checks that parse_elements finds the end of an element also if html closes some of the
+# tags inside it (or before it) implicitly.
+
+
+class TestParseElements(unittest.TestCase):
+	def texts(self, html, class_name="x"):
+		return [element.text for element in parse_elements(html, class_name)]
+
+	def test_nested(self):
+		self.assertEqual(
+			self.texts('<div class="x">a <div>b</div> c</div> d'), ["a b c"])
+
+	def test_implicit_li(self):
+		self.assertEqual(
+			self.texts('<ul><li class="x">a<li class="x">b</ul> c'), ["a", "b"])
+
+	def test_implicit_p(self):
+		self.assertEqual(
+			self.texts('<div><p class="x">a<div>b</div> c</div><span class="x">d</span>'), ["a", "d"])
+
+	def test_implicit_option(self):
+		self.assertEqual(
+			self.texts('<div class="x"><select><option>a <option>b</select></div> c'), ["a b"])
+
+	def test_implicit_cells(self):
+		elements = parse_elements(
+			'<table><tr><td class="x">1<td class="x"><a href="u">2</a><tr><td>3</table>'
+			'<div class="x">4</div>', "x")
+		self.assertEqual([element.text for element in elements], ["1", "2", "4"])
+		self.assertEqual(elements[1].links, [("u", "2")])
+
+	def test_stray_end_tag(self):
+		self.assertEqual(
+			self.texts('<div class="x">a</span> b</div> c'), ["a b"])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -30,9 +30,13 @@ class DB:
 		c.execute("CREATE TABLE IF NOT EXISTS coverage_cases (id INTEGER PRIMARY KEY AUTOINCREMENT, question VARCHAR(255), name TEXT, UNIQUE(name))")
 		c.execute("CREATE TABLE IF NOT EXISTS coverage_occurrences (id INTEGER PRIMARY KEY AUTOINCREMENT, question VARCHAR(255), name TEXT, UNIQUE(name))")
 		c.execute("CREATE TABLE IF NOT EXISTS longterm (created TIMESTAMP, success INTEGER, detail TEXT, nusers INTEGER)")
+		c.execute("CREATE TABLE IF NOT EXISTS events (created TIMESTAMP, nmachines INTEGER, nevents INTEGER, elapsed REAL, lag_mean REAL, lag_max REAL)")
+		c.execute("CREATE TABLE IF NOT EXISTS pool_users (username TEXT PRIMARY KEY, password TEXT, ilias_url TEXT, lease TEXT, created TIMESTAMP)")
+		c.execute("CREATE TABLE IF NOT EXISTS test_copies (title TEXT PRIMARY KEY, ref_id INTEGER, ilias_url TEXT, created TIMESTAMP)")
 
 		c.execute("CREATE INDEX IF NOT EXISTS index_results_created ON results(created)")
 		c.execute("CREATE INDEX IF NOT EXISTS index_longterm_created ON longterm(created)")
+		c.execute("CREATE INDEX IF NOT EXISTS index_pool_users_lease ON pool_users(ilias_url, lease)")
 
 		self.db.commit()
 		c.close()
@@ -69,6 +73,31 @@ class DB:
 		self.db.commit()
 		c.close()
 
+	def put_event_data(self, num_machines, events):
+		total = events.summary()
+		c = self.db.cursor()
+		c.execute("INSERT INTO events (created, nmachines, nevents, elapsed, lag_mean, lag_max) VALUES (?, ?, ?, ?, ?, ?)",
+			(datetime.datetime.now(), num_machines, total.n, events.elapsed, total.mean, total.max))
+		self.db.commit()
+		c.close()
+
+	def get_event_data(self):
+		# event lag and throughput, grouped by number of machines. the lag should
+		# stay flat as the number of machines grows.
+		c = self.db.cursor()
+		c.execute("SELECT nmachines, COUNT(*), SUM(nevents), SUM(elapsed), AVG(lag_mean), MAX(lag_max) "
+			"FROM events GROUP BY nmachines ORDER BY nmachines")
+		rows = c.fetchall()
+		c.close()
+
+		return [dict(
+			machines=n_machines,
+			runs=n_runs,
+			events=n_events,
+			events_per_second=(n_events / elapsed) if elapsed else 0,
+			lag_mean=lag_mean,
+			lag_max=lag_max) for n_machines, n_runs, n_events, elapsed, lag_mean, lag_max in rows]
+
 	def put_coverage_data(self, coverage):
 		c = self.db.cursor()
 		c.executemany("INSERT OR IGNORE INTO coverage_cases(question, name) VALUES (?, ?)",
@@ -183,12 +212,79 @@ class DB:
 		c.close()
 		return files
 
+	# the user pool (see drivers.UserPool). users in the pool exist in ILIAS, so clear() keeps them.
+
+	def put_pool_users(self, ilias_url, users, lease=None):
+		c = self.db.cursor()
+		now = datetime.datetime.now()
+		c.executemany("INSERT OR REPLACE INTO pool_users (username, password, ilias_url, lease, created) VALUES (?, ?, ?, ?, ?)",
+			[(username, password, ilias_url, lease, now) for username, password in users])
+		self.db.commit()
+		c.close()
+
+	def lease_pool_users(self, ilias_url, lease, n):
+		# leases up to n free users and returns all users leased under lease as (username, password).
+		c = self.db.cursor()
+		c.execute("UPDATE pool_users SET lease=? WHERE rowid IN "
+			"(SELECT rowid FROM pool_users WHERE ilias_url=? AND lease IS NULL ORDER BY created, username LIMIT ?)",
+			(lease, ilias_url, n))
+		self.db.commit()
+		c.execute("SELECT username, password FROM pool_users WHERE ilias_url=? AND lease=? ORDER BY created, username",
+			(ilias_url, lease))
+		rows = c.fetchall()
+		c.close()
+		return rows
+
+	def release_pool_users(self, ilias_url, lease=None):
+		# releases the users leased under lease, or all users if lease is None.
+		c = self.db.cursor()
+		if lease is None:
+			c.execute("UPDATE pool_users SET lease=NULL WHERE ilias_url=?", (ilias_url,))
+		else:
+			c.execute("UPDATE pool_users SET lease=NULL WHERE ilias_url=? AND lease=?", (ilias_url, lease))
+		self.db.commit()
+		c.close()
+
+	def count_pool_users(self, ilias_url):
+		# returns the number of all and of free users.
+		c = self.db.cursor()
+		c.execute("SELECT COUNT(*), COUNT(*) - COUNT(lease) FROM pool_users WHERE ilias_url=?", (ilias_url,))
+		total, free = c.fetchone()
+		c.close()
+		return total, free
+
+	# temporary test copies this TiltR imported into ILIAS (see batch.TestCopyPool). like pool
+	# users, they exist in ILIAS, so clear() keeps them.
+
+	def put_test_copy(self, ilias_url, title, ref_id):
+		c = self.db.cursor()
+		c.execute("INSERT OR REPLACE INTO test_copies (title, ref_id, ilias_url, created) VALUES (?, ?, ?, ?)",
+			(title, ref_id, ilias_url, datetime.datetime.now()))
+		self.db.commit()
+		c.close()
+
+	def get_test_copies(self, ilias_url, before):
+		# returns (title, ref_id) of all copies that were imported before the given time.
+		c = self.db.cursor()
+		c.execute("SELECT title, ref_id FROM test_copies WHERE ilias_url=? AND created<? ORDER BY created",
+			(ilias_url, before))
+		rows = c.fetchall()
+		c.close()
+		return rows
+
+	def remove_test_copy(self, ilias_url, title):
+		c = self.db.cursor()
+		c.execute("DELETE FROM test_copies WHERE ilias_url=? AND title=?", (ilias_url, title))
+		self.db.commit()
+		c.close()
+
 	def clear(self):
 		c = self.db.cursor()
 		c.execute("DELETE FROM results")
 		c.execute("DELETE FROM performance")
 		c.execute("DELETE FROM coverage_cases")
 		c.execute("DELETE FROM coverage_occurrences")
+		c.execute("DELETE FROM events")
 		self.db.commit()
 		c.close()		
 
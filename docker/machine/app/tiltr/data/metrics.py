@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from texttable import Texttable
+
+
+class Timing:
+	def __init__(self, n=0, total=0.0, max_dt=0.0):
+		self.n = n
+		self.total = total
+		self.max = max_dt
+
+	def add(self, dt):
+		self.n += 1
+		self.total += dt
+		self.max = dt if self.n == 1 else max(self.max, dt)
+
+	def extend(self, timing):
+		self.n += timing.n
+		self.total += timing.total
+		self.max = max(self.max, timing.max)
+
+	@property
+	def mean(self):
+		return self.total / self.n if self.n > 0 else 0.0
+
+
+class _Aggregates:
+	# thread safe accumulation of named values. can be sent from machines to
+	# master via to_dict() and from_dict=....
+
+	def __init__(self, from_dict=None):
+		self._mutex = threading.Lock()
+		self._values = defaultdict(Timing)
+		if from_dict:
+			for key, (n, total, max_dt) in from_dict.items():
+				self._values[key] = Timing(n, total, max_dt)
+
+	def add(self, key, value):
+		with self._mutex:
+			self._values[key].add(value)
+
+	def extend(self, other):
+		with self._mutex:
+			for key, timing in other.items():
+				self._values[key].extend(timing)
+
+	def get(self, key):
+		with self._mutex:
+			return self._values.get(key)
+
+	def items(self, prefix=None):
+		# with a prefix, only the keys that start with it, without the prefix.
+		with self._mutex:
+			items = list(self._values.items())
+		if prefix is not None:
+			items = [(k[len(prefix):], t) for k, t in items if k.startswith(prefix)]
+		return items
+
+	def to_dict(self):
+		return dict((k, (t.n, t.total, t.max)) for k, t in self.items())
+
+	def print_status(self, report, title='key', prefix=None):
+		table = Texttable()
+		table.set_deco(Texttable.HEADER)
+		table.set_cols_dtype(['t', 'i', 'f', 'f', 'f'])
+		table.add_row([title, 'n', 'total', 'mean', 'max'])
+
+		for key, timing in sorted(self.items(prefix)):
+			table.add_row([key, timing.n, timing.total, timing.mean, timing.max])
+
+		for line in table.draw().split('\n'):
+			report(line)
+
+
+class Timings(_Aggregates):
+	# durations in seconds.
+
+	@contextmanager
+	def measure(self, key):
+		t0 = time.time()
+		try:
+			yield
+		finally:
+			self.add(key, time.time() - t0)
+
+
+class Counters(_Aggregates):
+	# values that are not durations, e.g. sizes or numbers of commands. their owners
+	# print them in tables of their own (e.g. downloads.print_download_status).
+	pass
+
+
+class Histograms:
+	# thread safe counts of how often each (integer) bucket occurred, per key, e.g. how
+	# often an operation needed 0, 1, 2, ... retries.
+
+	def __init__(self, from_dict=None):
+		self._mutex = threading.Lock()
+		self._counts = defaultdict(lambda: defaultdict(int))
+		if from_dict:
+			for key, counts in from_dict.items():
+				for bucket, n in counts:
+					self._counts[key][bucket] += n
+
+	def add(self, key, bucket, n=1):
+		with self._mutex:
+			self._counts[key][bucket] += n
+
+	def extend(self, other):
+		for key, counts in other.items():
+			for bucket, n in counts.items():
+				self.add(key, bucket, n)
+
+	def items(self):
+		with self._mutex:
+			return [(key, dict(counts)) for key, counts in self._counts.items()]
+
+	def to_dict(self):
+		# buckets are ints, so no JSON object keys.
+		return dict((key, sorted(counts.items())) for key, counts in self.items())
+
+	def print_status(self, report, title='key'):
+		items = sorted(self.items())
+		if not items:
+			return
+		buckets = list(range(max(max(counts.keys()) for _, counts in items) + 1))
+
+		table = Texttable()
+		table.set_deco(Texttable.HEADER)
+		table.set_cols_dtype(['t'] + ['i'] * len(buckets))
+		table.add_row([title] + [str(bucket) for bucket in buckets])
+
+		for key, counts in items:
+			table.add_row([key] + [counts.get(bucket, 0) for bucket in buckets])
+
+		for line in table.draw().split('\n'):
+			report(line)
+
+
+class Metrics:
+	# what gets recorded while running an exam or a batch (see record_metrics).
+
+	def __init__(self, from_dict=None):
+		from_dict = from_dict or dict()
+		self.timings = Timings(from_dict=from_dict.get("timings"))
+		self.counters = Counters(from_dict=from_dict.get("counters"))
+		self.histograms = Histograms(from_dict=from_dict.get("histograms"))
+
+	def extend(self, metrics):
+		self.timings.extend(metrics.timings)
+		self.counters.extend(metrics.counters)
+		self.histograms.extend(metrics.histograms)
+
+	def to_dict(self):
+		return dict(
+			timings=self.timings.to_dict(),
+			counters=self.counters.to_dict(),
+			histograms=self.histograms.to_dict())
+
+
+_recording = threading.local()
+
+
+@contextmanager
+def record_metrics(metrics):
+	# makes metrics the target of get_recorded_timings(), get_recorded_counters() and
+	# get_recorded_histograms() in this thread.
+	previous = getattr(_recording, 'metrics', None)
+	_recording.metrics = metrics
+	try:
+		yield metrics
+	finally:
+		_recording.metrics = previous
+
+
+def get_recorded_timings():
+	metrics = getattr(_recording, 'metrics', None)
+	return metrics.timings if metrics is not None else None
+
+
+def get_recorded_counters():
+	metrics = getattr(_recording, 'metrics', None)
+	return metrics.counters if metrics is not None else None
+
+
+def get_recorded_histograms():
+	metrics = getattr(_recording, 'metrics', None)
+	return metrics.histograms if metrics is not None else None
+
+
+class EventStats:
+	# measures the lag between a machine emitting an event (ECHO, DONE, ERROR)
+	# and the master receiving it, as well as the overall event throughput.
+
+	def __init__(self):
+		self.lags = Timings()
+		self.t0 = time.time()
+		self.t1 = None
+
+	def received(self, origin, sent_time):
+		self.lags.add(origin, max(0.0, time.time() - sent_time))
+
+	def stop(self):
+		self.t1 = time.time()
+
+	@property
+	def elapsed(self):
+		return (self.t1 or time.time()) - self.t0
+
+	def summary(self):
+		total = Timing()
+		for _, timing in self.lags.items():
+			total.extend(timing)
+		return total
+
+	def print_status(self, report):
+		total = self.summary()
+		elapsed = self.elapsed
+
+		report("%d events from %d sources in %.1fs (%.2f events/s)." % (
+			total.n, len(self.lags.items()), elapsed, total.n / elapsed if elapsed > 0 else 0))
+		report("event lag: mean %.3fs, max %.3fs." % (total.mean, total.max))
+		report("")
+
+		self.lags.print_status(report, title='source')
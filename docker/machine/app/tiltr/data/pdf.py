@@ -5,7 +5,6 @@
 # GPLv3, see LICENSE
 #
 
-import io
 import re
 
 from pdfminer3.layout import LAParams, LTTextBoxHorizontal
@@ -78,6 +77,9 @@ def _extract_pdf_scores(stream):
 
 
 class PDF:
-	def __init__(self, bytes):
-		self.bytes = bytes
-		self.scores = _extract_pdf_scores(io.BytesIO(bytes))
+	def __init__(self, f):
+		# f is a binary file, e.g. from DownloadManager.get_file. it gets closed.
+		with f:
+			self.scores = _extract_pdf_scores(f)
+			f.seek(0)
+			self.bytes = f.read()  # kept for the results archive
@@ -87,6 +87,7 @@ class Result:
 			self.protocol = data["protocol"]
 			self.files = dict((k, base64.b64decode(v)) for k, v in data["files"].items())
 			self.performance = data["performance"]
+			self.metrics = data.get("metrics", dict())
 			self.errors = data["errors"]
 			self.coverage = Coverage(from_dict=data["coverage"])
 		else:
@@ -96,17 +97,20 @@ class Result:
 			self.protocol = []
 			self.files = kwargs.get('files', dict())
 			self.performance = []
+			self.metrics = dict()
 			self.errors = dict()
 			self.coverage = Coverage()
 
-	def to_json(self):
+	def to_json(self, with_files=True):
+		# without files, they need to get passed on separately (see machine._run_job).
 		return json.dumps(dict(
 			origin=self.origin.name,
 			properties=list(self.properties.items()),
 			types=list(self.types.items()),
 			protocol=self.protocol,
-			files=dict((k, base64.b64encode(v).decode('utf8')) for k, v in self.files.items()),
+			files=dict((k, base64.b64encode(v).decode('utf8')) for k, v in self.files.items()) if with_files else dict(),
 			performance=self.performance,
+			metrics=self.metrics,
 			errors=self.errors,
 			coverage=self.coverage.as_dict()))
 
@@ -160,6 +164,9 @@ class Result:
 	def attach_performance_measurements(self, performance):
 		self.performance = performance
 
+	def attach_metrics(self, metrics):
+		self.metrics = metrics.to_dict()
+
 	def attach_coverage(self, coverage):
 		self.coverage = coverage
 
@@ -58,6 +58,27 @@ class Settings(ValueBag):
 				"""Pixel resolution of virtual browser windows.""",
 				"1024x1600"
 			),
+			(
+				'participants',
+				"""Number of simulated examinees. 0 means one examinee per machine.""",
+				0
+			),
+			(
+				'max_participants_per_machine',
+				"""Maximum number of browser examinees a machine runs concurrently. 0 means as many as the machine allows. HTTP examinees are only limited by the machine.""",
+				0
+			),
+			(
+				'http_participants',
+				"""Number of examinees that take the exam through plain HTTP requests instead of a browser. Supports single choice, multiple choice, KPrim and cloze questions only, and never simulates crashes.""",
+				0
+			),
+			(
+				'pipeline_batches',
+				"""When looping, prepare the next batch as soon as the exams of the current batch are done (1),
+				or only after the current batch is completely finished (0).""",
+				1
+			),
 			(
 				'num_deterministic_machines',
 				"""Number of deterministic/regression test machines - these always do the same things.""",
@@ -130,11 +151,31 @@ class Settings(ValueBag):
 				"""Maximum number of characters to enter into cloze text gaps.""",
 				7
 			),
+			(
+				'qti_cross_check',
+				"""Number of questions read from the test's QTI that get compared to their definition in the ILIAS UI. On any difference, all questions get parsed from the UI.""",
+				1
+			),
+			(
+				'test_copies',
+				"""Number of imported copies of the test to keep ready for following batches. Copies get imported and deleted in the background.""",
+				1
+			),
 			(
 				'screenshot_refresh_time',
-				"""Number of seconds after which to refresh browser screenshots.""",
+				"""Number of seconds after which to refresh browser screenshots. Screenshots are only taken while someone watches them.""",
 				10
 			),
+			(
+				'screenshot_max_width',
+				"""Pixel width to which browser screenshots get downscaled. 0 keeps the full resolution.""",
+				800
+			),
+			(
+				'screenshot_jpeg_quality',
+				"""JPEG quality (1 to 95) of browser screenshots. 0 keeps them as PNG.""",
+				80
+			),
 			(
 				'numbers_in_text_fields_p',
 				"""Probability of entering numeric values in text fields.""",
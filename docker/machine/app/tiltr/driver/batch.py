@@ -6,7 +6,6 @@
 #
 
 import asyncio
-import requests
 import json
 import traceback
 import random as rnd
@@ -14,14 +13,14 @@ import time
 import datetime
 import uuid
 import base64
-import io
 import tempfile
 import itertools
+import copy
 from decimal import *
 
-from multiprocessing.dummy import Pool as ThreadPool
 from multiprocessing import Lock
 import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
 
 from collections import defaultdict
 from contextlib import contextmanager
@@ -32,10 +31,11 @@ from openpyxl import load_workbook
 from texttable import Texttable
 
 from tiltr.data.exceptions import *
-from tiltr.data.result import Result, Origin
+from tiltr.data.result import Result
 from tiltr.data.result import open_results
 from tiltr.data.workbook import workbook_to_result, check_workbook_consistency
 from tiltr.data.context import RandomContext
+from tiltr.data.metrics import EventStats, Metrics, record_metrics
 from tiltr.question.coverage import Coverage
 
 from tiltr.question import *  # needed for pickling
@@ -44,97 +44,25 @@ from tiltr.driver.exam_configuration import * # needed for pickling
 import pandora
 
 from .commands import TakeExamCommand
-from .drivers import UsersBackend, UsersFactory, UserDriver, verify_admin_settings, ImportedTest, Marks
+from .drivers import UsersBackend, UsersFactory, UserPool, UserDriver, verify_admin_settings, ImportedTest, Marks, \
+	is_password_change_on_first_login, TestCache
 from .utils import wait_for_page_load, run_interaction
-
-
-monitor_mutex = Lock()
+from .screenshots import Screenshots, screenshot_data_uri
+from .downloads import print_download_status
 
 
 def encode_success(success):
 	return "/".join(success)
 
 
-def take_exam(args):
-	asyncio.set_event_loop(asyncio.new_event_loop())
-
-	command = args["command"]
-	machine = command.machine
-	batch_id = args["batch_id"]
-	report = args["report"]
-
-	result_json = None
-	report("master", "passing take_exam to %s." % machine)
-
-	try:
-		r = requests.post("http://%s:8888/start/%s" % (machine, batch_id),
-			data={"command_json": command.to_json()})
-		if r.status_code != 200:
-			raise InteractionException("start call failed: %s" % r.status_code)
-
-		report("master", "test started on %s." % machine)
-
-		index = 0
-
-		while result_json is None:
-			# we don't want too much traffic for updating machine states. only check
-			# one at a time.
-			monitor_mutex.acquire()
-			try:
-				time.sleep(1)
-				r = requests.get("http://%s:8888/monitor/%s/%d" % (machine, batch_id, index))
-			finally:
-				monitor_mutex.release()
-
-			if r.status_code != 200:
-				raise InteractionException("monitor call failed: %s" % r.status_code)
-		
-			messages = json.loads(r.text)
-
-			for command, payload in messages:
-				if command == "ECHO":
-					report(machine, payload)
-				elif command == "DONE":
-					result_json = payload
-				elif command == "ERROR":
-					raise Exception(payload)
-				else:
-					raise InteractionException("unknown command %s" % command)
-
-			index += len(messages)
-
-	except TiltrException as e:
-		traceback.print_exc()
-		try:
-			report("error", "machine %s failed." % machine)
-			report("traceback", traceback.format_exc())
-		except:
-			print("report failed.")
-		return Result.from_error(Origin.recorded, e.get_error_domain(), traceback.format_exc())
-
-	except requests.exceptions.ConnectionError:
-		traceback.print_exc()
-		try:
-			report("error", "machine %s failed." % machine)
-			report("traceback", traceback.format_exc())
-		except:
-			print("report failed.")
-		return Result.from_error(Origin.recorded, ErrorDomain.interaction, traceback.format_exc())
-
-	except:
-		traceback.print_exc()
-		try:
-			report("error", "machine %s failed." % machine)
-			report("traceback", traceback.format_exc())
-		except:
-			print("report failed.")
-		return Result.from_error(Origin.recorded, ErrorDomain.integrity, traceback.format_exc())
-
-	report("master", "received take_exam results from %s." % machine)
-	return Result(from_json=result_json)
+def _read_file(f):
+	# the whole contents of f, e.g. for the results archive.
+	f.seek(0)
+	return f.read()
 
 
 def _patch_exam_name(path, new_title, output_dir):
+	# path is a zip file's path or a binary file.
 	import zipfile
 	import os
 	import re
@@ -183,15 +111,11 @@ class MasterContext:
 		self.batch = batch
 		self.protocol = protocol
 		self.driver = None
-		self.screenshot_url = None
 		self.language = None
 
 	def report(self, message):
 		try:
-			url = self.driver.current_url
-			if url != self.screenshot_url:
-				self.batch.screenshot = self.driver.get_screenshot_as_base64()
-				self.screenshot_url = url
+			self.batch.screenshots.capture(self.driver, lambda: self.driver.current_url)
 		except:
 			self.batch.report("master", "failed to create screenshot.")
 
@@ -223,11 +147,154 @@ def create_temp_test_name():
 	return "TiltR_temp_%s_%d" % (now_str, now.microsecond)
 
 
+def import_temp_test(user_driver, path, title):
+	# imports a temporary test and records it, so that a restart can delete it should it
+	# get left behind (see TestCopyPool.delete_stale).
+	ref_id = user_driver.import_test(path)
+	with open_results() as db:
+		db.put_test_copy(user_driver.ilias_url, title, ref_id)
+
+
+def delete_temp_test(user_driver, title, ref_id=None):
+	user_driver.delete_test(title, ref_id)
+	with open_results() as db:
+		db.remove_test_copy(user_driver.ilias_url, title)
+
+
+class AdminContext:
+	# an admin session that belongs to no batch, see admin_session.
+	def __init__(self, report):
+		self.report = report
+		self.driver = None
+		self.user_driver = None
+		self.language = None
+
+
+@contextmanager
+def admin_session(ilias_url, ilias_admin_user, ilias_admin_password, settings, browser_pool, report):
+	# like Batch.in_master, but for background work that outlives batches.
+	context = AdminContext(report)
+
+	with run_interaction():
+		args = dict(
+			browser=settings.browser,
+			pool=browser_pool,
+			wait_time=0,
+			resolution=settings.resolution)
+
+		with pandora.Browser(**args) as browser:
+			context.driver = browser.driver
+			context.user_driver = UserDriver(browser.driver, ilias_url, context.report)
+
+			with context.user_driver.login(ilias_admin_user, ilias_admin_password) as login:
+				context.language = login.language
+
+				yield context
+
+
+class TestCopyPool:
+	# temporary copies of a packaged test that get imported ahead of time, so that batches need
+	# not wait for an import. used copies get deleted later. both happens in the background,
+	# one admin session at a time.
+
+	_pools = dict()  # (ilias url, test id, archive sha) -> TestCopyPool
+	_pools_mutex = threading.Lock()
+
+	@staticmethod
+	def for_test(ilias_url, test):
+		with TestCopyPool._pools_mutex:
+			key = (ilias_url, test.get_id(), test.get_sha())
+			pool = TestCopyPool._pools.get(key)
+			if pool is None:
+				pool = TestCopyPool(test)
+				# copies of an archive that got replaced under the same id are of no use anymore.
+				for old_key in [k for k in TestCopyPool._pools.keys() if k[:2] == key[:2]]:
+					old_pool = TestCopyPool._pools.pop(old_key)
+					with old_pool._mutex:
+						pool._used.extend(old_pool._ready + old_pool._used)
+						old_pool._ready, old_pool._used = [], []
+				TestCopyPool._pools[key] = pool
+			return pool
+
+	@staticmethod
+	def delete_stale(open_session, ilias_url, before):
+		# deletes the temporary tests this TiltR imported before the given time, i.e. that
+		# earlier runs of the master left behind. other TiltRs' tests in the same ILIAS stay.
+		with open_results() as db:
+			copies = db.get_test_copies(ilias_url, before)
+		if not copies:
+			return
+
+		with open_session() as master:
+			for title, ref_id in copies:
+				try:
+					delete_temp_test(master.user_driver, title, ref_id)
+				except:
+					master.report('could not delete stale test copy "%s".' % title)
+					traceback.print_exc()
+
+	def __init__(self, test):
+		self.test = test
+		self._ready = []  # titles of imported copies
+		self._used = []  # titles of copies to delete
+		self._mutex = threading.Lock()
+		self._executor = ThreadPoolExecutor(max_workers=1)
+
+	def _import(self, user_driver):
+		with tempfile.TemporaryDirectory() as tmpdir:
+			title = create_temp_test_name()
+			test_path = _patch_exam_name(self.test.get_path(), title, tmpdir)
+			import_temp_test(user_driver, test_path, title)
+		return title
+
+	def lease(self, user_driver, report):
+		# returns the title of a ready copy or imports a copy right now.
+		with self._mutex:
+			title = self._ready.pop(0) if self._ready else None
+		if title is None:
+			return self._import(user_driver)
+		report('using pre-imported test copy "%s".' % title)
+		return title
+
+	def release(self, title):
+		with self._mutex:
+			self._used.append(title)
+
+	def maintain(self, open_session, depth):
+		# deletes used copies and imports new ones until depth copies are ready.
+		self._executor.submit(self._maintain, open_session, depth)
+
+	def _maintain(self, open_session, depth):
+		with self._mutex:
+			used, self._used = self._used, []
+			n_missing = depth - len(self._ready)
+		if not used and n_missing <= 0:
+			return
+
+		try:
+			with open_session() as master:
+				for title in used:
+					try:
+						delete_temp_test(master.user_driver, title)
+					except:
+						master.report('could not delete test copy "%s".' % title)
+						traceback.print_exc()
+
+				for _ in range(n_missing):
+					title = self._import(master.user_driver)
+					with self._mutex:
+						self._ready.append(title)
+		except:
+			traceback.print_exc()
+
+
 class Run:
 	def __init__(self, batch):
 		self.success = ("FAIL", "unknown")
 
 		self.performance_data = []
+		self.events = EventStats()
+		self.metrics = Metrics()
 		self.coverage = Coverage()
 		self.users = []
 		self.users_factory = batch.users_factory
@@ -244,9 +311,12 @@ class Run:
 		self.ilias_version = batch.ilias_version
 		self.wait_time = batch.wait_time
 
+		# readjustments modify questions and exam configuration, so each run works on its
+		# own copy. otherwise a pipelined next batch would see another run's modifications.
 		self.test = batch.test
-		self.questions = self.test.cache.questions
-		self.exam_configuration = self.test.cache.exam_configuration
+		with TestCache.lock:
+			self.questions = copy.deepcopy(self.test.cache.questions)
+			self.exam_configuration = copy.deepcopy(self.test.cache.exam_configuration)
 
 	def _make_protocol(self):
 		sections = [
@@ -255,7 +325,13 @@ class Run:
 
 			"preferences/workarounds",
 			"preferences/settings",
-			"mark_schema"]
+			"mark_schema",
+			"events",
+			"timings",
+			"downloads",
+			"commands",
+			"retries",
+			"browsers"]
 
 		parts = list()
 
@@ -279,7 +355,8 @@ class Run:
 		gui_stats = test_driver.get_statistics_from_web_gui(
 			[user.get_username() for user in self.users])
 
-		pdfs = test_driver.export_pdf()
+		pdfs = test_driver.export_pdf(
+			[user.get_username() for user in self.users])
 		prefix = 'reimport/' if is_reimport else 'original/'
 
 		for user, recorded_result in zip(self.users, all_recorded_results):
@@ -531,7 +608,16 @@ class Run:
 				self.batch.ilias_url,
 				master.report))
 
-		self.users = self.users_factory.acquire(self._users_backend(master))
+		if self.users_factory.recycle and is_password_change_on_first_login(master.driver, self.batch.ilias_url):
+			# a pooled user's first login would change its password, and its next lease would fail.
+			master.report("not recycling users, as ILIAS changes passwords on first login.")
+			self.users_factory.recycle = False
+
+		self.users = self.users_factory.acquire(
+			self._users_backend(master), self.batch.get_id(), master.report)
+
+		if self.users_factory.needs_top_up():
+			self.batch.top_up_users(self.users_factory.n, self.protocol_master)
 
 		if not test_driver.goto_or_fail():
 			# if test does not exist, add it first.
@@ -539,15 +625,16 @@ class Run:
 		else:
 			test_driver.delete_all_participants()
 
-		# grab exam configuration from UI.
+		# grab exam configuration from UI. this goes into the cache of the test in use, from
+		# where _run transfers it back into a copied test's original.
 		if self.exam_configuration is None:
 			self.exam_configuration = test_driver.parse_exam_configuration()
-			self.test.cache.exam_configuration = self.exam_configuration
+			test_driver.test.cache.exam_configuration = copy.deepcopy(self.exam_configuration)
 
-		# grab question definitions from UI.
+		# grab question definitions from QTI or UI.
 		if self.questions is None:
-			self.questions = test_driver.parse_question_definitions(self.settings)
-			self.test.cache.questions = self.questions
+			self.questions = test_driver.parse_questions(self.settings)
+			test_driver.test.cache.questions = copy.deepcopy(self.questions)
 
 		# now configure test.
 		test_driver.configure_test(self.workarounds, self.exam_configuration)
@@ -568,36 +655,49 @@ class Run:
 		self.test_url = test_driver.get_test_url()
 
 	def run_exams(self):
-		# now run exams.
-		take_exam_args = []
-		for i, machine, user in zip(range(len(self.users)), self.machines.values(), self.users):
-			take_exam_args.append(
-				dict(
-					batch_id=self.batch_id,
-					report=self.report,
-					command=TakeExamCommand(
-						ilias_url=self.batch.ilias_url,
-						machine=machine,
-						machine_index=i + 1,
-						username=user.get_username(),
-						password=user.get_password(),
-						test_id=self.test.get_id(),
-						test_url=self.test_url,
-						questions=self.questions,
-						exam_configuration=self.exam_configuration,
-						settings=self.settings,
-						workarounds=self.workarounds,
-						wait_time=self.wait_time,
-						admin_lang=self.language)))
-
-		pool = ThreadPool(len(self.users))
+		# now run exams. participants are not bound to machines, the orchestrator
+		# assigns them to free machine runners.
+		commands = []
+		origins = []
+		n_http = min(int(self.settings.http_participants), len(self.users))
+		if n_http > 0:
+			self.report("master", "%d of %d participants take the exam over http." % (n_http, len(self.users)))
+		for i, user in enumerate(self.users):
+			origin = "participant_%d" % (i + 1)
+			origins.append(origin)
+			commands.append(
+				TakeExamCommand(
+					ilias_url=self.batch.ilias_url,
+					machine=None,
+					machine_index=i + 1,
+					username=user.get_username(),
+					password=user.get_password(),
+					test_id=self.test.get_id(),
+					test_url=self.test_url,
+					questions=self.questions,
+					exam_configuration=self.exam_configuration,
+					settings=self.settings,
+					workarounds=self.workarounds,
+					wait_time=self.wait_time,
+					admin_lang=self.language,
+					engine="http" if i >= len(self.users) - n_http else "browser"))
+
+		self.events = EventStats()  # only measure the exam phase.
+		future = self.batch.take_exams(commands, origins, self.report, self.events)
 		try:
-			all_recorded_results = pool.map(take_exam, take_exam_args)
 			self.report("master", "waiting for results.")
-			pool.close()
-			pool.join()
+			all_recorded_results = future.result()
+			self.events.stop()
 			self.report("master", "all results arrived.")
+
+			elapsed = self.events.elapsed
+			self.protocols["events"].append(
+				"%d participants on %d machines in %.1fs (%.2f participants/min)." % (
+					len(commands), len(self.machines), elapsed, 60 * len(commands) / elapsed if elapsed > 0 else 0))
+			self.events.print_status(self.protocols["events"].append)
 			return all_recorded_results
+		except CancelledError:
+			raise
 		except:
 			traceback.print_exc()
 			self.report("error", "one of the machines failed.")
@@ -605,38 +705,34 @@ class Run:
 			raise Exception("aborted due to error in machines %s." % traceback.format_exc())
 
 	def _verify_reimport(self, master, test_driver, all_recorded_results):
-		xmlres_zip = test_driver.export_xmlres()
-		self.files["original/xmlres.zip"] = xmlres_zip
-
-		with tempfile.NamedTemporaryFile() as temp:
-			temp.write(xmlres_zip)
-			temp.flush()
+		with test_driver.export_xmlres() as xmlres_zip:
+			self.files["original/xmlres.zip"] = _read_file(xmlres_zip)
 
 			with tempfile.TemporaryDirectory() as tmpdir:
 				temp_test_name = create_temp_test_name()
-				test_path = _patch_exam_name(temp.name, temp_test_name, tmpdir)
+				test_path = _patch_exam_name(xmlres_zip, temp_test_name, tmpdir)
 				self.report("master", "reimporting test as %s" % temp_test_name)
-				master.user_driver.import_test(test_path)
+				import_temp_test(master.user_driver, test_path, temp_test_name)
 				self.report("master", "reimport of test as %s done." % temp_test_name)
 
-			verify_result = None
-			try:
-				reimported_test = ImportedTest(temp_test_name)
-				reimported_test_driver = master.user_driver.create_test_driver(reimported_test)
+		verify_result = None
+		try:
+			reimported_test = ImportedTest(temp_test_name)
+			reimported_test_driver = master.user_driver.create_test_driver(reimported_test)
 
-				verify_result = self._verify_xls(
-					master, reimported_test_driver, all_recorded_results, is_reimport=True)
+			verify_result = self._verify_xls(
+				master, reimported_test_driver, all_recorded_results, is_reimport=True)
 
-			finally:
-				try:
-					master.user_driver.delete_test(temp_test_name)
-				except:
-					if verify_result is None:
-						# we got here through another exception. don't override it.
-						self.report("error", "could not delete test")
-						self.report("traceback", traceback.print_exc())
-					else:
-						raise
+		finally:
+			try:
+				delete_temp_test(master.user_driver, temp_test_name)
+			except:
+				if verify_result is None:
+					# we got here through another exception. don't override it.
+					self.report("error", "could not delete test")
+					self.report("traceback", traceback.print_exc())
+				else:
+					raise
 
 		return verify_result
 
@@ -656,17 +752,16 @@ class Run:
 		all_assertions_ok = False
 
 		for readjustment_round in range(num_readjustments + 1):
-			xls = test_driver.export_xls()
-			workbook = load_workbook(filename=io.BytesIO(xls))
+			with test_driver.export_xls() as xls:
+				workbook = load_workbook(filename=xls)
+				if readjustment_round == 0:
+					self.files[prefix + "exported_r%d.xlsx" % readjustment_round] = _read_file(xls)
 
 			try:
 				check_workbook_consistency(workbook, self.questions, self.workarounds, master.report)
 			except:
 				raise IntegrityException("failed to check workbook consistency")
 
-			if readjustment_round == 0:
-				self.files[prefix + "exported_r%d.xlsx" % readjustment_round] = xls
-
 			all_assertions_ok = self._check_results(
 				readjustment_round, master, test_driver, workbook, all_recorded_results, is_reimport)
 			if not all_assertions_ok:
@@ -682,8 +777,8 @@ class Run:
 				self._apply_readjustment(
 					readjustment_round, master, test_driver, all_recorded_results, is_reimport)
 
-				xmlres_zip = test_driver.export_xmlres()
-				self.files["readjustments/round%d.zip" % (1 + readjustment_round)] = xmlres_zip
+				with test_driver.export_xmlres() as xmlres_zip:
+					self.files["readjustments/round%d.zip" % (1 + readjustment_round)] = _read_file(xmlres_zip)
 
 		return "OK" if all_assertions_ok else "FAIL"
 
@@ -705,6 +800,7 @@ class Run:
 		# gather performance data.
 		for recorded_result in all_recorded_results:
 			self.performance_data.extend(recorded_result.performance)
+			self.metrics.extend(Metrics(from_dict=recorded_result.metrics))
 
 		# abort if any errors.
 		worst_domain = get_most_severe_error_domain(all_recorded_results)
@@ -749,12 +845,18 @@ class Run:
 				elapsed_time=elapsed_time)
 			db.put_performance_data(self.performance_data)
 			db.put_coverage_data(self.coverage)
+			if self.events.t1 is not None:
+				db.put_event_data(len(self.machines), self.events)
 
 	def cleanup(self, master):
 		self.users_factory.release(self._users_backend(master))
 		# keep self.users for storing some information on them later.
 
 	def run(self):
+		with record_metrics(self.metrics):
+			return self._run()
+
+	def _run(self):
 		t0 = time.time()
 
 		# we copy the test for each run, since checking readjustments will
@@ -764,17 +866,14 @@ class Run:
 		temp_test = None  # the temporary copy of the test (deleted soon).
 		used_test = None  # the test actually used (copied or not, depends).
 
+		copies = TestCopyPool.for_test(self.batch.ilias_url, self.test)
+		copies_depth = int(self.settings.test_copies)
+
 		try:
 			with self.batch.in_master(self.protocol_master) as master:
 				try:
 					if copy_test:
-						with tempfile.TemporaryDirectory() as tmpdir:
-							temp_test_name = create_temp_test_name()
-							test_path = _patch_exam_name(
-								self.test.get_path(), temp_test_name, tmpdir)
-							master.user_driver.import_test(test_path)
-
-						temp_test = ImportedTest(temp_test_name)
+						temp_test = ImportedTest(copies.lease(master.user_driver, master.report), source=self.test)
 						used_test = temp_test
 
 						temp_test.cache.transfer_invariants(self.test.cache)
@@ -786,6 +885,11 @@ class Run:
 
 					if temp_test:
 						self.test.cache.transfer_invariants(temp_test.cache)
+
+						# get the next copy ready while the exams run.
+						copies.maintain(self.batch.open_admin_session, copies_depth)
+
+					self.test.cache.save()
 				except Exception as e:
 					try:
 						self.files['error/master.png'] = base64.b64decode(
@@ -794,14 +898,20 @@ class Run:
 						pass  # ignore
 					raise e
 
+			self.batch.check_cancelled()
+
 			try:
 				all_recorded_results = self.run_exams()
+				self.batch.exams_done.set()
+			except CancelledError:
+				raise
 			except Exception as e:
 				# in case of an error, always try to export XLS for later analysis.
 				try:
 					with self.batch.in_master(self.protocol_master) as master:
 						test_driver = master.user_driver.create_test_driver(used_test)
-						self.files["error/exported.xlsx"] = test_driver.export_xls()
+						with test_driver.export_xls() as xls:
+							self.files["error/exported.xlsx"] = _read_file(xls)
 				except:
 					pass  # ignore
 				raise e  # original exception
@@ -812,7 +922,7 @@ class Run:
 					self.analyze(master, test_driver, all_recorded_results)
 
 					if temp_test:
-						master.user_driver.delete_test(temp_test.get_title())
+						copies.release(temp_test.get_title())
 						temp_test = None
 				except Exception as e:
 					try:
@@ -822,6 +932,11 @@ class Run:
 						pass  # ignore
 					raise e
 
+		except CancelledError:
+			self.success = ("FAIL", "cancelled")
+			self.report("master", "batch was cancelled.")
+			self.add_to_protocol("header", "Cancelled.")
+
 		except selenium.common.exceptions.WebDriverException as e:
 			self.success = ("FAIL", "interaction")
 			traceback.print_exc()
@@ -847,21 +962,30 @@ class Run:
 			self.add_to_protocol("header", "Finished with status %s." % encode_success(self.success))
 
 			if temp_test:
-				try:
-					with self.batch.in_master(self.protocol_master) as master:
-						master.user_driver.delete_test(temp_test.get_title())
-				except:
-					traceback.print_exc()
+				copies.release(temp_test.get_title())
+			if copy_test:
+				copies.maintain(self.batch.open_admin_session, copies_depth)
 
 			try:
 				if self.users:
-					with self.batch.in_master(self.protocol_master) as master:
-						self.cleanup(master)
+					if self.users_factory.lease is not None:
+						self.cleanup(None)  # pool users only get released, which needs no admin session.
+					else:
+						with self.batch.in_master(self.protocol_master) as master:
+							self.cleanup(master)
 			except:
 				self.report("error", "cleanup failed")
 				self.report("traceback", traceback.format_exc())
 				traceback.print_exc()
 
+			if self.batch.browser_pool:
+				self.batch.browser_pool.print_status(self.protocols["browsers"].append)
+
+			self.metrics.timings.print_status(self.protocols["timings"].append, title='operation')
+			print_download_status(self.metrics, self.protocols["downloads"].append)
+			self.metrics.counters.print_status(self.protocols["commands"].append, title='answer', prefix="commands ")
+			self.metrics.histograms.print_status(self.protocols["retries"].append, title='operation')
+
 			try:
 				self.store_into_database(time.time() - t0)
 			except:
@@ -879,7 +1003,10 @@ class Run:
 
 
 class Batch(threading.Thread):
-	def __init__(self, machines, ilias_version, test, settings, workarounds, wait_time):
+	def __init__(
+		self, machines, ilias_version, test, settings, workarounds, wait_time, orchestrator,
+		browser_pool=None, open_admin_session=None):
+
 		threading.Thread.__init__(self)
 		self._profiling = False
 
@@ -889,6 +1016,11 @@ class Batch(threading.Thread):
 
 		self.machines = machines
 		self.ilias_version = ilias_version
+		self.orchestrator = orchestrator
+		self.browser_pool = browser_pool
+
+		# opens an admin session for background work that outlives this batch, e.g. test copies.
+		self.open_admin_session = open_admin_session or self.in_background_master
 
 		self.settings = settings
 		self.workarounds = workarounds
@@ -900,14 +1032,28 @@ class Batch(threading.Thread):
 		self.machines_lookup["traceback"] = "traceback"
 
 		self.test = test
-		self.users_factory = UsersFactory(test, len(machines))
-
-		self.screenshot = None
+		self.num_participants = int(settings.participants) or len(machines)
+		self.users_factory = None  # see configure
+
+		self.screenshot = None  # data uri
+		self.screenshots = Screenshots(
+			self._set_screenshot,
+			float(settings.screenshot_refresh_time),
+			int(settings.screenshot_max_width),
+			int(settings.screenshot_jpeg_quality))
+		self.participants = dict()  # origin -> (machine, participant index)
+		self.participant_origins = set()  # reported as they are, next to machine names
 
 		self.batch_id = datetime.datetime.today().strftime('%Y%m%d%H%M%S-') + str(uuid.uuid4())
 		self._is_done = False
 		self._success = None
 
+		self.exams_done = threading.Event()  # machines are free for the next batch.
+
+		self._cancelled = False
+		self._exams = None
+		self._exams_mutex = threading.Lock()
+
 		self.debug = False
 		self.ilias_url = None
 		self.ilias_admin_user = None
@@ -922,6 +1068,7 @@ class Batch(threading.Thread):
 
 			args = dict(
 				browser=self.settings.browser,
+				pool=self.browser_pool,
 				wait_time=self.wait_time,
 				resolution=self.settings.resolution)
 
@@ -940,15 +1087,63 @@ class Batch(threading.Thread):
 	def get_id(self):
 		return self.batch_id
 
+	def take_exams(self, commands, origins, report, events):
+		def on_dispatch(origin, machine, index):
+			self.participants[origin] = (machine, index)
+
+		self.participant_origins.update(origins)
+
+		with self._exams_mutex:
+			self.check_cancelled()
+			self._exams = self.orchestrator.take_exams(
+				commands, origins, list(self.machines.values()), self.batch_id, report, events,
+				max_per_machine=int(self.settings.max_participants_per_machine),
+				on_dispatch=on_dispatch,
+				is_available=lambda machine: machine in self.machines.values())
+			return self._exams
+
+	def cancel(self):
+		# stops a running batch. exams running on machines get aborted, all other
+		# phases stop at the next check, i.e. cleanup still happens.
+		with self._exams_mutex:
+			self._cancelled = True
+			if self._exams is not None:
+				self._exams.cancel()
+
+	def check_cancelled(self):
+		if self._cancelled:
+			raise CancelledError()
+
 	def set_recycle_users(self, recycle):
-		#self.users_factory.recycle = recycle
-		pass
+		self.users_factory.recycle = recycle
+
+	def in_background_master(self, protocol=None):
+		# an admin session for work that happens next to the batch, e.g. in another thread.
+		return self.in_master(protocol or (lambda text: None))
+
+	def top_up_users(self, n, protocol):
+		# creates users for the pool in a separate admin session, while this batch goes on.
+		# protocol is the batch's master protocol, so that failures end up in its results.
+		def top_up():
+			try:
+				with self.in_background_master(protocol) as master:
+					self.users_factory.pool.top_up(
+						lambda: UsersBackend(master.driver, self.ilias_url, master.report), n, master.report)
+			except Exception as e:
+				message = "failed to top up user pool: %s" % str(e)
+				self.report("master", message)
+				protocol(message)
+				traceback.print_exc()
+
+		threading.Thread(target=top_up, daemon=True).start()
 
 	def configure(self, args):
 		self.debug = args.debug
 		self.ilias_url = args.ilias_url
+		self.test.load_cache(self.ilias_url, self.ilias_version)
 		self.ilias_admin_user = args.ilias_admin_user
 		self.ilias_admin_password = args.ilias_admin_password
+		self.users_factory = UsersFactory(self.num_participants, UserPool(self.ilias_url))
 
 	def run(self):
 		if self._profiling:
@@ -957,14 +1152,19 @@ class Batch(threading.Thread):
 			profiler.enable()
 
 		success = ("FAIL", "unknown")
+		loop = asyncio.new_event_loop()
 		try:
-			asyncio.set_event_loop(asyncio.new_event_loop())
+			asyncio.set_event_loop(loop)
 
 			self.report("master", "connecting to ILIAS %s." % self.ilias_version)
 
 			run = Run(self)
 			success = run.run()
 		finally:
+			self.exams_done.set()
+			self.screenshots.close()  # don't leak its thread into the next batches.
+			asyncio.set_event_loop(None)
+			loop.close()  # nor the loop's selector.
 			try:
 				self.report_done(success)
 			except:
@@ -974,12 +1174,23 @@ class Batch(threading.Thread):
 			profiler.disable()
 			profiler.print_stats(sort='time')
 
-	def get_screenshot_as_base64(self):
+	def _set_screenshot(self, data):
+		self.screenshot = screenshot_data_uri(data)
+
+	def get_screenshot(self):
+		# a UI client asks, so keep taking screenshots for a while.
+		self.screenshots.watch()
 		return self.screenshot
 
+	def get_participant(self, origin):
+		return self.participants.get(origin)
+
 	def is_done(self):
 		return self._is_done
 
+	def is_exams_done(self):
+		return self.exams_done.is_set()
+
 	def get_success(self):
 		return self._success
 
@@ -994,9 +1205,12 @@ class Batch(threading.Thread):
 			finally:
 				self.print_mutex.release()
 
+		if origin not in self.participant_origins:
+			origin = self.machines_lookup.get(origin, "machine_unknown")
+
 		encoded = json.dumps(dict(
 			command="report",
-			origin=self.machines_lookup.get(origin, "machine_unknown"),
+			origin=origin,
 			message=message))
 
 		self.buffered.append(encoded)
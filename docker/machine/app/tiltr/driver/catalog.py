@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import traceback
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from zipfile import ZipFile
+import xml.etree.ElementTree as ET
+
+from tiltr.question.qti import get_question_types
+
+
+tests_path = "/tiltr/tests"
+
+# names of the test xml and the QTI xml inside an ILIAS test export.
+test_xml_pattern = re.compile(r"^[^/]*/[^/]+_tst_[^/]+\.xml$")
+qti_xml_pattern = re.compile(r"^[^/]*/[^/]+_qti_[^/]+\.xml$")
+
+
+def find_xml(zf, pattern):
+	for name in zf.namelist():
+		if pattern.match(name):
+			return name
+	return None
+
+
+_shas = dict()  # path -> (mtime, size, sha)
+_shas_mutex = threading.Lock()
+
+
+def remember_sha(path, mtime, size, sha):
+	with _shas_mutex:
+		_shas[path] = (mtime, size, sha)
+
+
+def file_sha(path):
+	# sha256 of the file at path. hashing a large archive takes a while, so the sha is
+	# remembered (and the TestCatalog fills in the ones it knows) until mtime or size change.
+	stat = os.stat(path)
+	with _shas_mutex:
+		known = _shas.get(path)
+	if known is not None and known[:2] == (stat.st_mtime, stat.st_size):
+		return known[2]
+
+	h = hashlib.sha256()
+	with open(path, "rb") as f:
+		for chunk in iter(lambda: f.read(1 << 20), b""):
+			h.update(chunk)
+	sha = h.hexdigest()
+
+	remember_sha(path, stat.st_mtime, stat.st_size, sha)
+	return sha
+
+
+def _inspect(path):
+	with ZipFile(path, 'r') as zf:
+		main = find_xml(zf, test_xml_pattern)
+		if main is None:
+			raise RuntimeError("did not find test xml in zip")
+		title = ET.fromstring(zf.read(main)).findall(".//Title")[0].text
+
+		qti = find_xml(zf, qti_xml_pattern)
+		question_types = get_question_types(zf.read(qti)) if qti else []
+
+	return dict(
+		title=title,
+		questions=len(question_types),
+		question_types=dict(Counter(question_types)))
+
+
+def _is_valid_entry(test_id, entry):
+	# whether entry looks like one that refresh wrote for test_id.
+	return isinstance(entry, dict) and \
+		entry.get("id") == test_id and \
+		isinstance(entry.get("title"), str) and \
+		isinstance(entry.get("questions"), int) and \
+		isinstance(entry.get("question_types"), dict) and \
+		all(isinstance(k, str) and isinstance(v, int) for k, v in entry["question_types"].items()) and \
+		isinstance(entry.get("sha"), str) and \
+		isinstance(entry.get("mtime"), (int, float)) and \
+		isinstance(entry.get("size"), int)
+
+
+class TestCatalog:
+	# an index of the test archives in tests_path, persisted in index_path. archives only
+	# get opened when they are new or their mtime or size changed; listings are served
+	# from memory and refreshed at most every refresh_time seconds. refreshing happens on
+	# a background thread, as it unzips and hashes archives; until it is done, listings
+	# show the last index. without any index yet (i.e. on a fresh start), wait_for_index
+	# gives the first indexing to wait for.
+
+	index_path = "/tiltr/tmp/catalog.json"
+	refresh_time = 5
+
+	def __init__(self):
+		self._mutex = threading.Lock()
+		self._entries = dict()  # test id -> metadata
+		self._next_refresh = 0
+		self._executor = ThreadPoolExecutor(max_workers=1)
+		self._indexing = None  # future of the running _index
+		self._indexed = False  # whether an index was read or built
+
+		try:
+			with open(self.index_path, "r") as f:
+				entries = json.load(f)
+			if not isinstance(entries, dict):
+				raise ValueError("test catalog is not a dict")
+			# invalid entries get inspected again by the next refresh.
+			self._entries = dict((k, v) for k, v in entries.items() if _is_valid_entry(k, v))
+			self._indexed = bool(self._entries)  # an empty index might just be a broken one
+			for test_id, entry in self._entries.items():
+				self._remember_sha(test_id, entry)
+		except FileNotFoundError:
+			pass
+		except:
+			print("could not read test catalog %s." % self.index_path)
+			traceback.print_exc()
+
+		self.refresh()  # start indexing right away
+
+	@staticmethod
+	def _remember_sha(test_id, entry):
+		remember_sha(
+			os.path.abspath(os.path.join(tests_path, test_id + ".zip")),
+			entry["mtime"], entry["size"], entry["sha"])
+
+	def _save(self):
+		# only called from _index, i.e. from one thread at a time.
+		try:
+			tmp_path = self.index_path + ".tmp"
+			with open(tmp_path, "w") as f:
+				json.dump(self._entries, f)
+			os.replace(tmp_path, self.index_path)
+		except:
+			print("could not write test catalog %s." % self.index_path)
+			traceback.print_exc()
+
+	def refresh(self, force=False):
+		# starts an _index in the background, unless one is running or was done recently.
+		with self._mutex:
+			if not force and time.time() < self._next_refresh:
+				return self._indexing
+			if self._indexing is None or self._indexing.done():
+				self._indexing = self._executor.submit(self._index)
+			self._next_refresh = time.time() + self.refresh_time
+			return self._indexing
+
+	def _index(self):
+		old_entries = self._entries
+		entries = dict()
+		changed = False
+
+		try:
+			for e in os.scandir(tests_path):
+				if not e.name.endswith(".zip") or not e.is_file():
+					continue
+
+				test_id = os.path.splitext(e.name)[0]
+				stat = e.stat()
+
+				entry = old_entries.get(test_id)
+				if entry is None or entry["mtime"] != stat.st_mtime or entry["size"] != stat.st_size:
+					try:
+						entry = _inspect(e.path)
+						entry.update(
+							id=test_id,
+							sha=file_sha(e.path),
+							mtime=stat.st_mtime,
+							size=stat.st_size)
+					except:
+						print("could not inspect Test %s." % e.name)
+						traceback.print_exc()
+						continue
+
+					changed = True
+
+				entries[test_id] = entry
+		except:
+			print("could not index tests in %s." % tests_path)
+			traceback.print_exc()
+			self._indexed = True  # nothing to wait for
+			return
+
+		if changed or set(entries.keys()) != set(old_entries.keys()):
+			with self._mutex:
+				self._entries = entries  # replaced as a whole, so readers see one snapshot
+			self._save()
+		self._indexed = True
+
+	def wait_for_index(self):
+		# future to wait for before the first listing, or None if there is an index.
+		if self._indexed:
+			return None
+		return self.refresh(force=True)
+
+	def get(self, test_id):
+		self.refresh()
+		return self._entries.get(test_id)
+
+	def query(self, question_types=()):
+		# all entries of tests that contain each of the given QTI question types.
+		self.refresh()
+		return [entry for _, entry in sorted(self._entries.items())
+			if all(t in entry["question_types"] for t in question_types)]
+
+	def list(self, question_types=()):
+		# title -> test id, for the UI's test selection.
+		return dict((entry["title"], entry["id"]) for entry in self.query(question_types))
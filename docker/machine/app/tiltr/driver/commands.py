@@ -10,14 +10,17 @@ import traceback
 import json
 import base64
 
+import requests
 from selenium.common.exceptions import WebDriverException
 
 from .utils import get_driver_error_details, run_interaction
 from .drivers import UserDriver, PackagedTest
+from .http_engine import HttpDriver, HttpLogin, HttpExamDriver, start_or_resume
 from tiltr.data.result import Result, Origin
 from tiltr.data.context import RegressionContext, RandomContext
 from tiltr.data.exceptions import ErrorDomain, TiltrException, InteractionException
 from tiltr.data.settings import Settings, Workarounds
+from tiltr.data.metrics import Metrics, record_metrics
 from tiltr.question.answers.answer import Validness
 
 
@@ -114,6 +117,7 @@ class TakeExamCommand:
 		self.test_url = data["test_url"]
 		self.wait_time = data["wait_time"]
 		self.admin_lang = data["admin_lang"]
+		self.engine = data.get("engine", "browser")  # "browser" or "http", see http_engine.py
 
 		self.n_deterministic_machines = int(self.settings.num_deterministic_machines)
 
@@ -132,7 +136,8 @@ class TakeExamCommand:
 			settings=self.settings.to_dict(),
 			workarounds=self.workarounds.to_dict(),
 			wait_time=self.wait_time,
-			admin_lang=self.admin_lang))
+			admin_lang=self.admin_lang,
+			engine=self.engine))
 
 	def _create_result_with_details(self, driver, report, e, trace):
 		files = dict()
@@ -155,7 +160,111 @@ class TakeExamCommand:
 
 		return Result.from_error(Origin.recorded, e.get_error_domain(), error, files)
 
+	def _create_http_result_with_details(self, driver, report, e, trace):
+		files = dict()
+		files['error/trace.txt'] = trace.encode('utf8')
+		if driver.page_source:
+			files['error/page.html'] = driver.page_source.encode('utf8')
+
+		filenames = map(lambda s: '%s_%s' % (self.username, s), files.keys())
+		error = 'test failed on url %s. for details, see  %s.' % (driver.current_url, ', '.join(filenames))
+		report(error)
+
+		return Result.from_error(Origin.recorded, e.get_error_domain(), error, files)
+
+	def _create_context(self):
+		if self.machine_index <= self.n_deterministic_machines:
+			# some machines can operate deterministically as a well-defined baseline regression test
+			return RegressionContext(
+				self.machine_index * 73939133,
+				self.questions,
+				self.settings,
+				self.workarounds,
+				self.admin_lang)
+		else:
+			return RandomContext(
+				self.questions,
+				self.settings,
+				self.workarounds,
+				self.admin_lang)
+
+	def _take_exam(self, exam_driver, context, machine_info, master_report, create_error_result):
+		try:
+			exam_driver.add_protocol(machine_info)
+
+			def report(s):
+				master_report(s)
+				exam_driver.add_protocol(s)
+
+			robot = ExamRobot(exam_driver, context, report, self.questions, self.settings)
+			robot.run(self.settings.test_passes)
+
+		except TiltrException as e:
+			traceback.print_exc()
+			r = create_error_result(e, traceback.format_exc())
+			exam_driver.add_protocol_to_result(r)
+			return r
+
+		exam_driver.close()
+
+		result = exam_driver.get_expected_result(self.admin_lang)
+		result.attach_coverage(context.coverage)
+		return result
+
 	def run(self, browser, master_report):
+		# browser is None for the http engine.
+		with record_metrics(Metrics()) as metrics:
+			if self.engine == "http":
+				result = self._run_http(master_report)
+			else:
+				result = self._run(browser, master_report)
+		if result is not None:
+			result.attach_metrics(metrics)
+		return result
+
+	def _run_http(self, master_report):
+		machine_info = "running test over http on machine #%s (%s)." % (self.machine_index, self.machine)
+		master_report(machine_info)
+
+		driver = HttpDriver()
+
+		try:
+			with HttpLogin(driver, self.ilias_url, self.username, self.password, master_report):
+				driver.get(self.test_url)
+
+				context = self._create_context()
+
+				master_report("starting test.")
+				if not start_or_resume(driver):
+					raise InteractionException("user does not have rights to start this test. aborting.")
+
+				exam_driver = HttpExamDriver(
+					driver, self.ilias_url, self.username, master_report,
+					context, self.questions, self.exam_configuration)
+
+				result = self._take_exam(
+					exam_driver, context, machine_info, master_report,
+					lambda e, trace: self._create_http_result_with_details(driver, master_report, e, trace))
+
+		except TiltrException as e:
+			traceback.print_exc()
+			return self._create_http_result_with_details(driver, master_report, e, traceback.format_exc())
+		except (ConnectionError, IOError, requests.exceptions.RequestException):
+			e = InteractionException(traceback.format_exc())
+			traceback.print_exc()
+			master_report("test aborted: %s" % traceback.format_exc())
+			return Result.from_error(Origin.recorded, e.get_error_domain(), traceback.format_exc())
+		except:
+			traceback.print_exc()
+			master_report("test aborted with an unexpected error: %s" % traceback.format_exc())
+			return None
+		finally:
+			driver.quit()
+
+		master_report("done running test.")
+		return result
+
+	def _run(self, browser, master_report):
 		driver = browser.driver
 
 		machine_info = "running test on machine #%s (%s)." % (self.machine_index, self.machine)
@@ -171,44 +280,14 @@ class TakeExamCommand:
 					test_driver = user_driver.create_test_driver(PackagedTest(self.test_id))
 					test_driver.goto(self.test_url)
 
-					if self.machine_index <= self.n_deterministic_machines:
-						# some machines can operate deterministically as a well-defined baseline regression test
-						context = RegressionContext(
-							self.machine_index * 73939133,
-							self.questions,
-							self.settings,
-							self.workarounds,
-							self.admin_lang)
-					else:
-						context = RandomContext(
-							self.questions,
-							self.settings,
-							self.workarounds,
-							self.admin_lang)
+					context = self._create_context()
 
 					exam_driver = test_driver.start(
 						self.username, context, self.questions, self.exam_configuration)
 
-					try:
-						exam_driver.add_protocol(machine_info)
-
-						def report(s):
-							master_report(s)
-							exam_driver.add_protocol(s)
-
-						robot = ExamRobot(exam_driver, context, report, self.questions, self.settings)
-						robot.run(self.settings.test_passes)
-
-					except TiltrException as e:
-						traceback.print_exc()
-						r = self._create_result_with_details(driver, master_report, e, traceback.format_exc())
-						exam_driver.add_protocol_to_result(r)
-						return r
-
-					exam_driver.close()
-
-					result = exam_driver.get_expected_result(self.admin_lang)
-					result.attach_coverage(context.coverage)
+					result = self._take_exam(
+						exam_driver, context, machine_info, master_report,
+						lambda e, trace: self._create_result_with_details(driver, master_report, e, trace))
 
 		except TiltrException as e:
 			traceback.print_exc()
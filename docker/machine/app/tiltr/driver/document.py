@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+import re
+from html.parser import HTMLParser
+
+
+# a minimal DOM for pages that are fetched without a browser (see http_engine.py). it
+# knows enough css (tags, ids, classes, attribute selectors and descendants) and enough
+# form semantics (values, checked states, serialization) to fill in and submit ILIAS forms.
+
+
+_void_tags = set(["area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "wbr"])
+
+# tags that close an open tag of the same kind, e.g. <option>a<option>b.
+_self_closing = set(["option", "li", "p", "tr", "td", "th"])
+
+
+def _normalize(text):
+	return re.sub(r"\s+", " ", text).strip()
+
+
+class Element:
+	def __init__(self, tag, attrs, parent):
+		self.tag = tag
+		self.attrs = attrs
+		self.parent = parent
+		self.children = []  # elements and strings
+		self._value = None  # textarea contents after set_value
+
+	def get(self, name, default=None):
+		return self.attrs.get(name, default)
+
+	@property
+	def classes(self):
+		return (self.attrs.get("class") or "").split()
+
+	def iter(self):
+		# all descendant elements in document order.
+		for child in self.children:
+			if isinstance(child, Element):
+				yield child
+				yield from child.iter()
+
+	def _text(self, parts):
+		for child in self.children:
+			if isinstance(child, Element):
+				if child.tag in ("script", "style"):
+					continue
+				if child.tag == "br":
+					parts.append("\n")
+				child._text(parts)
+			else:
+				parts.append(child)
+
+	@property
+	def raw_text(self):
+		parts = []
+		self._text(parts)
+		return "".join(parts)
+
+	@property
+	def text(self):
+		return _normalize(self.raw_text)
+
+	def select(self, css):
+		return select(self, css)
+
+	def select_one(self, css):
+		elements = select(self, css)
+		return elements[0] if elements else None
+
+	def closest(self, tag):
+		element = self
+		while element is not None and element.tag != tag:
+			element = element.parent
+		return element
+
+	# form semantics.
+
+	@property
+	def is_checkable(self):
+		return self.tag == "input" and self.get("type", "").lower() in ("radio", "checkbox")
+
+	@property
+	def checked(self):
+		if self.tag == "option":
+			return "selected" in self.attrs
+		return self.is_checkable and "checked" in self.attrs
+
+	@property
+	def options(self):
+		return [e for e in self.iter() if e.tag == "option"]
+
+	@property
+	def value(self):
+		if self.tag == "select":
+			options = self.options
+			for option in options:
+				if "selected" in option.attrs:
+					return option.value
+			return options[0].value if options else ""
+		elif self.tag == "option":
+			return self.get("value", self.text)
+		elif self.tag == "textarea":
+			return self._value if self._value is not None else self.raw_text
+		elif self.is_checkable:
+			return self.get("value", "on")
+		else:
+			return self.get("value", "")
+
+	def set_value(self, value):
+		if self.tag == "select":
+			for option in self.options:
+				option.attrs.pop("selected", None)
+			for option in self.options:
+				if option.value == value:
+					option.attrs["selected"] = "selected"
+					break
+		elif self.tag == "textarea":
+			self._value = value
+		else:
+			self.attrs["value"] = value
+
+	def click(self):
+		if not self.is_checkable:
+			return
+		if self.get("type").lower() == "checkbox":
+			if "checked" in self.attrs:
+				del self.attrs["checked"]
+			else:
+				self.attrs["checked"] = "checked"
+		else:
+			form = self.closest("form")
+			root = form if form is not None else self._root()
+			for other in root.iter():
+				if other.tag == "input" and other.get("type", "").lower() == "radio" and other.get("name") == self.get("name"):
+					other.attrs.pop("checked", None)
+			self.attrs["checked"] = "checked"
+
+	def _root(self):
+		element = self
+		while element.parent is not None:
+			element = element.parent
+		return element
+
+
+class _TreeBuilder(HTMLParser):
+	def __init__(self):
+		super().__init__(convert_charrefs=True)
+		self.root = Element("#document", dict(), None)
+		self._stack = [self.root]
+
+	def handle_starttag(self, tag, attrs):
+		attrs = dict((k, v if v is not None else "") for k, v in attrs)
+
+		if tag in _self_closing:
+			for i in range(len(self._stack) - 1, 0, -1):
+				open_tag = self._stack[i].tag
+				if open_tag == tag:
+					del self._stack[i:]
+					break
+				if open_tag in ("table", "select", "ul", "ol", "div", "form"):
+					break
+
+		parent = self._stack[-1]
+		element = Element(tag, attrs, parent)
+		parent.children.append(element)
+		if tag not in _void_tags:
+			self._stack.append(element)
+
+	def handle_startendtag(self, tag, attrs):
+		self.handle_starttag(tag, attrs)
+		if tag not in _void_tags:
+			self._stack.pop()
+
+	def handle_endtag(self, tag):
+		for i in range(len(self._stack) - 1, 0, -1):
+			if self._stack[i].tag == tag:
+				del self._stack[i:]
+				return
+
+	def handle_data(self, data):
+		self._stack[-1].children.append(data)
+
+
+def parse_document(html):
+	builder = _TreeBuilder()
+	builder.feed(html)
+	builder.close()
+	return builder.root
+
+
+# css selectors.
+
+_compound_pattern = re.compile(
+	r'([a-zA-Z][a-zA-Z0-9-]*|\*)|#([\w-]+)|\.([\w-]+)|\[\s*([\w-]+)\s*(?:([\^$*~]?=)\s*(?:"([^"]*)"|\'([^\']*)\'|([^\]\s]+)))?\s*\]')
+
+
+def _parse_compound(text):
+	tag = None
+	tests = []
+	pos = 0
+	while pos < len(text):
+		m = _compound_pattern.match(text, pos)
+		if not m:
+			raise ValueError("unsupported css selector: %s" % text)
+		if m.group(1):
+			tag = None if m.group(1) == "*" else m.group(1).lower()
+		elif m.group(2):
+			tests.append(("id", m.group(2)))
+		elif m.group(3):
+			tests.append(("class", m.group(3)))
+		else:
+			value = m.group(6) if m.group(6) is not None else (m.group(7) if m.group(7) is not None else m.group(8))
+			tests.append(("attr", (m.group(4), m.group(5), value)))
+		pos = m.end()
+	return tag, tests
+
+
+def _split(css, sep):
+	# splits css at sep, but not inside brackets or quotes.
+	parts = []
+	current = []
+	depth = 0
+	quote = None
+	for c in css:
+		if quote:
+			if c == quote:
+				quote = None
+		elif c in "\"'":
+			quote = c
+		elif c == "[":
+			depth += 1
+		elif c == "]":
+			depth -= 1
+		elif depth == 0 and (c == sep or (sep == " " and c.isspace())):
+			if current:
+				parts.append("".join(current))
+			current = []
+			continue
+		current.append(c)
+	if current:
+		parts.append("".join(current))
+	return parts
+
+
+def _matches(element, compound):
+	tag, tests = compound
+	if tag is not None and element.tag != tag:
+		return False
+	for kind, arg in tests:
+		if kind == "id":
+			if element.get("id") != arg:
+				return False
+		elif kind == "class":
+			if arg not in element.classes:
+				return False
+		else:
+			name, op, value = arg
+			actual = element.get(name)
+			if actual is None:
+				return False
+			if op == "=" and actual != value:
+				return False
+			if op == "^=" and not actual.startswith(value):
+				return False
+			if op == "$=" and not actual.endswith(value):
+				return False
+			if op == "*=" and value not in actual:
+				return False
+			if op == "~=" and value not in actual.split():
+				return False
+	return True
+
+
+def _matches_chain(element, chain):
+	if not _matches(element, chain[-1]):
+		return False
+	ancestor = element.parent
+	for compound in reversed(chain[:-1]):
+		while ancestor is not None and not _matches(ancestor, compound):
+			ancestor = ancestor.parent
+		if ancestor is None:
+			return False
+		ancestor = ancestor.parent
+	return True
+
+
+def select(scope, css):
+	# all descendants of scope that match css, in document order. like querySelectorAll,
+	# ancestors outside of scope may match the leading parts of css.
+	chains = [[_parse_compound(part) for part in _split(group.strip(), " ")] for group in _split(css, ",")]
+	return [e for e in scope.iter() if any(_matches_chain(e, chain) for chain in chains)]
+
+
+# forms.
+
+def serialize_form(form, submitter=None):
+	# returns the (name, value) pairs a browser would submit for form.
+	data = []
+	for element in form.iter():
+		name = element.get("name")
+		if not name or "disabled" in element.attrs:
+			continue
+
+		if element.tag == "input":
+			kind = element.get("type", "text").lower()
+			if kind in ("submit", "image", "button", "reset"):
+				if element is submitter:
+					data.append((name, element.value))
+			elif kind == "file":
+				continue
+			elif kind in ("radio", "checkbox"):
+				if element.checked:
+					data.append((name, element.value))
+			else:
+				data.append((name, element.value))
+		elif element.tag == "button":
+			if element is submitter:
+				data.append((name, element.value))
+		elif element.tag == "select":
+			if element.options:
+				data.append((name, element.value))
+		elif element.tag == "textarea":
+			data.append((name, element.value))
+	return data
+
+
+# DomBatch operations (see dom.py) applied to a document.
+
+def _record(document, element, op):
+	r = dict(
+		value=element.value,
+		checked=element.checked,
+		text=element.text,
+		attributes=dict((name, element.get(name)) for name in op["attributes"]))
+	if element.tag == "select":
+		r["options"] = [(option.value, option.text) for option in element.options]
+	if op.get("label"):
+		label = None
+		if element.get("id"):
+			label = document.select_one('label[for="%s"]' % element.get("id"))
+		r["label"] = label.text if label is not None else None
+	if op.get("children"):
+		r["children"] = [_record(document, child, op["children"]) for child in element.select(op["children"]["css"])]
+	return r
+
+
+def run_dom_batch(document, ops):
+	results = []
+	for op in ops:
+		if op["op"] == "read":
+			results.append([_record(document, e, op) for e in document.select(op["css"])])
+			continue
+
+		element = document.select_one(op["css"])
+		if element is None:
+			return dict(missing=op["css"])
+
+		if op["op"] == "set_value":
+			element.set_value(op["value"])
+			results.append(element.value)
+			continue
+
+		if op["op"] == "click" or (op["op"] == "check" and element.checked != op["checked"]):
+			element.click()
+		results.append(element.checked)
+	return dict(results=results)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+from contextlib import contextmanager
+
+from selenium.common.exceptions import NoSuchElementException
+
+from tiltr.data.metrics import get_recorded_counters
+
+
+# applies a list of operations in the browser in one WebDriver roundtrip. operations
+# run in order, so reads that follow clicks see the resulting state.
+_batch_script = """
+	function record(el, op) {
+		var r = {
+			value: el.value,
+			checked: !!el.checked,
+			text: (el.innerText || el.textContent || "").trim(),
+			attributes: {}
+		};
+		op.attributes.forEach(function(name) {
+			r.attributes[name] = el.getAttribute(name);
+		});
+		if (el.tagName.toLowerCase() == "select") {
+			r.options = [];
+			for (var i = 0; i < el.options.length; i++) {
+				r.options.push([el.options[i].value, el.options[i].text]);
+			}
+		}
+		if (op.label) {
+			var label = el.id ? document.querySelector('label[for="' + CSS.escape(el.id) + '"]') : null;
+			r.label = label ? (label.innerText || label.textContent || "").trim() : null;
+		}
+		if (op.children) {
+			r.children = [];
+			el.querySelectorAll(op.children.css).forEach(function(child) {
+				r.children.push(record(child, op.children));
+			});
+		}
+		return r;
+	}
+
+	var results = [];
+	var ops = arguments[0];
+	for (var i = 0; i < ops.length; i++) {
+		var op = ops[i];
+		if (op.op == "read") {
+			var records = [];
+			document.querySelectorAll(op.css).forEach(function(el) {
+				records.push(record(el, op));
+			});
+			results.push(records);
+		} else {
+			var el = document.querySelector(op.css);
+			if (!el) {
+				return {missing: op.css};
+			}
+			if (op.op == "set_value") {
+				if (el.tagName.toLowerCase() == "select") {
+					el.value = op.value;
+					el.dispatchEvent(new Event("change", {bubbles: true}));
+				} else {
+					el.setAttribute("value", op.value);
+				}
+				results.push(el.value);
+				continue;
+			}
+			if (op.op == "click" || (op.op == "check" && !!el.checked != op.checked)) {
+				el.click();
+			}
+			results.push(!!el.checked);
+		}
+	}
+	return {results: results};
+"""
+
+
+class DomBatch:
+	# collects reads, clicks and checks, which are then applied by run() in one
+	# WebDriver command instead of one command per find_element, click, is_selected etc.
+	# drivers that are no browsers (see http_engine.py) can apply the operations themselves
+	# by providing run_dom_batch(ops).
+
+	def __init__(self):
+		self._ops = []
+
+	def read(self, css, attributes=(), label=False, children=None):
+		# reads all elements matching css. each element gives a dict with value, checked,
+		# text, attributes (as requested), label (text of its label[for]), options (value
+		# and text pairs, for selects) and children, if children is given as dict(css=...,
+		# attributes=...). returns the op's index.
+		op = dict(op="read", css=css, attributes=list(attributes), label=label)
+		if children:
+			op["children"] = dict(
+				css=children["css"], attributes=list(children.get("attributes", ())), label=False)
+		return self._add(op)
+
+	def click(self, css):
+		return self._add(dict(op="click", css=css))
+
+	def check(self, css, checked=True):
+		# clicks the element only if its checked state differs.
+		return self._add(dict(op="check", css=css, checked=bool(checked)))
+
+	def set_value(self, css, value):
+		# sets the value of a select (and fires its change event) or an input.
+		return self._add(dict(op="set_value", css=css, value=value))
+
+	def _add(self, op):
+		self._ops.append(op)
+		return len(self._ops) - 1
+
+	def run(self, driver):
+		if not self._ops:
+			return []
+		run_dom_batch = getattr(driver, 'run_dom_batch', None)
+		if run_dom_batch is not None:
+			r = run_dom_batch(self._ops)
+		else:
+			r = driver.execute_script(_batch_script, self._ops)
+		if r.get("missing"):
+			raise NoSuchElementException("no element matches %s" % r["missing"])
+		return r["results"]
+
+
+def read_elements(driver, css, **kwargs):
+	batch = DomBatch()
+	batch.read(css, **kwargs)
+	return batch.run(driver)[0]
+
+
+@contextmanager
+def count_commands(driver, name):
+	# counts the commands the driver sends inside this block (drivers count them in n_commands,
+	# see pandora and http_engine.HttpDriver). the count ends up in the recorded counters (see
+	# metrics.record_metrics) as "commands <name>", i.e. per name there are mean and max commands.
+	n0 = getattr(driver, 'n_commands', None)
+	try:
+		yield
+	finally:
+		counters = get_recorded_counters()
+		if n0 is not None and counters is not None:
+			counters.add("commands %s" % name, driver.n_commands - n0)
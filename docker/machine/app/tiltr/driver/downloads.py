@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+import time
+import tempfile
+
+import requests
+import requests.adapters
+from texttable import Texttable
+
+from tiltr.data.metrics import get_recorded_timings, get_recorded_counters
+
+
+# downloads up to this size stay in memory, larger ones are spooled to disk.
+spool_max_size = 8 * 1024 * 1024
+
+chunk_size = 256 * 1024
+
+# report the progress of large downloads every this many bytes.
+progress_interval = 16 * 1024 * 1024
+
+
+def _format_size(n):
+	return "%.1f MB" % (n / (1024 * 1024))
+
+
+class DownloadManager:
+	# downloads files from ILIAS outside of the browser. uses one requests.Session, which gets
+	# the browser's cookies once (until the next login, see invalidate) and keeps its
+	# connections alive. owned by the UserDriver of a selenium driver, which passes it on to
+	# its TestDrivers and ExamDrivers. download times end up in the recorded timings, their
+	# sizes in bytes in the recorded counters, both as "download <what>" (see
+	# metrics.record_metrics and print_download_status).
+
+	def __init__(self, driver, pool_size=4):
+		self.driver = driver
+		self.pool_size = pool_size
+		self._session = None
+
+	def invalidate(self):
+		# cookies have changed in the browser, e.g. after a login.
+		if self._session is not None:
+			self._session.close()
+			self._session = None
+
+	@property
+	def session(self):
+		if self._session is None:
+			session = requests.Session()
+			adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.pool_size)
+			session.mount('http://', adapter)
+			session.mount('https://', adapter)
+			for cookie in self.driver.get_cookies():
+				session.cookies.set(cookie['name'], cookie['value'])
+			self._session = session
+		return self._session
+
+	def _request(self, method, url, **kwargs):
+		r = self.session.request(method, url, **kwargs)
+		if 'login.php' in r.url:
+			# our session has expired. get the browser's current cookies and try again.
+			r.close()
+			self.invalidate()
+			r = self.session.request(method, url, **kwargs)
+		return r
+
+	def _record(self, what, dt, n_bytes):
+		timings = get_recorded_timings()
+		if timings is not None:
+			timings.add("download %s" % what, dt)
+		counters = get_recorded_counters()
+		if counters is not None:
+			counters.add("download %s" % what, n_bytes)
+
+	def get_text(self, url, what="page", **kwargs):
+		t0 = time.time()
+		r = self._request('GET', url, **kwargs)
+		self._record(what, time.time() - t0, len(r.content))
+		return r.text
+
+	def post(self, url, what="page", **kwargs):
+		t0 = time.time()
+		r = self._request('POST', url, **kwargs)
+		self._record(what, time.time() - t0, len(r.content))
+		return r
+
+	def get_file(self, url, what="file", report=None, **kwargs):
+		# streams the response into a SpooledTemporaryFile, which is returned at position 0.
+		t0 = time.time()
+		r = self._request('GET', url, stream=True, **kwargs)
+		try:
+			r.raise_for_status()
+
+			total = int(r.headers.get('Content-Length', 0))
+			f = tempfile.SpooledTemporaryFile(max_size=spool_max_size)
+			n_bytes = 0
+			next_progress = progress_interval
+
+			try:
+				for chunk in r.iter_content(chunk_size=chunk_size):
+					f.write(chunk)
+					n_bytes += len(chunk)
+					if report and n_bytes >= next_progress:
+						report("downloading %s: %s%s." % (
+							what, _format_size(n_bytes), " of %s" % _format_size(total) if total else ""))
+						next_progress += progress_interval
+			except:
+				f.close()
+				raise
+		finally:
+			r.close()
+
+		dt = time.time() - t0
+		self._record(what, dt, n_bytes)
+		if report:
+			if n_bytes > 0 and dt > 0:
+				report("downloaded %s of %s in %.1fs (%s/s)." % (
+					_format_size(n_bytes), what, dt, _format_size(n_bytes / dt)))
+			else:
+				report("downloaded %s of %s in %.1fs." % (_format_size(n_bytes), what, dt))
+
+		f.seek(0)
+		return f
+
+
+def print_download_status(metrics, report):
+	# one row per kind of download, with its throughput over all downloads of that kind.
+	table = Texttable()
+	table.set_deco(Texttable.HEADER)
+	table.set_cols_dtype(['t', 'i', 'f', 'f', 'f'])
+	table.add_row(['download', 'n', 'MB', 'seconds', 'MB/s'])
+
+	n_rows = 0
+	for what, size in sorted(metrics.counters.items(prefix="download ")):
+		timing = metrics.timings.get("download " + what)
+		dt = timing.total if timing is not None else 0.0
+		mb = size.total / (1024 * 1024)
+		table.add_row([what, size.n, mb, dt, mb / dt if dt > 0 else 0.0])
+		n_rows += 1
+
+	if n_rows > 0:
+		for line in table.draw().split('\n'):
+			report(line)
@@ -10,11 +10,15 @@ import datetime
 import io
 import re
 import json
+import pickle
 import requests
 import traceback
-from urllib.parse import urlparse, parse_qs
+import threading
+import tempfile
+from urllib.parse import urlparse, parse_qs, urljoin
 from decimal import *
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 from zipfile import ZipFile
 import xml.etree.ElementTree as ET
@@ -27,15 +31,50 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
 
 from .utils import *
+from .retry import RetryPolicy
+from .dom import DomBatch, count_commands
+from .tables import parse_table, parse_tables, parse_elements
+from .downloads import DownloadManager
+from .catalog import tests_path, test_xml_pattern, qti_xml_pattern, find_xml, file_sha
 from .exam_configuration import *
 
 from tiltr.data.exceptions import *
+from tiltr.data.metrics import get_recorded_timings
 from tiltr.question import *
+from tiltr.question.qti import parse_qti_questions, get_definition
 from tiltr.data.result import *
 from tiltr.question.protocol import AnswerProtocol
 from tiltr.data.pdf import PDF
 
 
+# number of threads that parse downloaded PDFs in export_pdf.
+pdf_parse_threads = 4
+
+# reads the form around the command row of an ILIAS table, i.e. the form that
+# applies commands like "showDetailedResults" to the selected rows.
+_command_form_script = """
+	var row = document.querySelector(".ilTableCommandRowTop");
+	var form = row ? row.closest("form") : null;
+	if (!form) {
+		return null;
+	}
+	var fields = [];
+	form.querySelectorAll('input[type="hidden"]').forEach(function(el) {
+		if (el.name) {
+			fields.push([el.name, el.value]);
+		}
+	});
+	var select = row.querySelector("select");
+	var submit = row.querySelector('input[type="submit"]');
+	return {
+		action: form.action,
+		fields: fields,
+		select: select ? select.name : null,
+		submit: submit ? [submit.name, submit.value] : null
+	};
+"""
+
+
 UserStat = namedtuple('UserStat', ['score', 'short_mark'])
 
 Mark = namedtuple('Mark', ['level', 'short', 'official'])
@@ -58,6 +97,7 @@ class Marks:
 class Login:
 	def __init__(self, user_driver, username, password):
 		self.driver = user_driver.driver
+		self.downloads = user_driver.downloads
 		self.report = user_driver.report
 		self.url = user_driver.ilias_url
 		self.username = username
@@ -111,6 +151,8 @@ class Login:
 		# in the <html> tag. needed for checking exported XLS contents.
 		self.language = driver.find_element_by_css_selector("html").get_attribute("lang")
 
+		self.downloads.invalidate()
+
 		return self
 
 	def __exit__(self, *args):
@@ -186,31 +228,76 @@ def add_user(driver, username, password):
 		driver.find_element_by_css_selector("input[name='cmd[save]']").click()
 
 
-def delete_users(driver, ilias_url, username_prefix, n):
-	n_clicked = 0
+def _find_user_checkboxes(driver, username_prefix):
+	# returns css selectors for the checkboxes of all listed users whose login starts with
+	# username_prefix, or None if the page source does not look as expected.
+	selectors = []
+	for table in parse_tables(driver.page_source):
+		for row in table.rows:
+			if not any(text.startswith(username_prefix) for cell in row.cells for _, text in cell.links):
+				continue
+			for cell in row.cells:
+				for attrs in cell.inputs:
+					if attrs.get("type") != "checkbox":
+						continue
+					if not attrs.get("name") or attrs.get("value") is None:
+						return None
+					selectors.append('input[type="checkbox"][name="%s"][value="%s"]' % (
+						attrs["name"], attrs["value"]))
+	return selectors
+
+
+def _filter_users(driver, ilias_url, username_prefix):
+	goto_user_administration(driver, ilias_url)
+
+	try:
+		activator = driver.find_element_by_css_selector(".ilTableFilterActivator")
+		activator.click()
+	except WebDriverException:
+		pass
+
+	apply_filter = "input[name='cmd[applyFilter]']"
+	wait_for_css_visible(driver, apply_filter)
+
+	set_element_value_by_css(driver, "input[name='query']", username_prefix)
+	with wait_for_page_load(driver):
+		driver.find_element_by_css_selector(apply_filter).click()
 
-	while n_clicked < n:
-		goto_user_administration(driver, ilias_url)
 
-		try:
-			activator = driver.find_element_by_css_selector(".ilTableFilterActivator")
-			activator.click()
-		except WebDriverException:
-			pass
+def count_users(driver, ilias_url, username_prefix):
+	# number of listed users whose login starts with username_prefix. this only looks at
+	# the first page of the user list, so it is meant for telling if any users are left.
+	_filter_users(driver, ilias_url, username_prefix)
 
-		apply_filter = "input[name='cmd[applyFilter]']"
-		wait_for_css_visible(driver, apply_filter)
+	n = 0
+	for table in parse_tables(driver.page_source):
+		for row in table.rows:
+			if any(text.startswith(username_prefix) for cell in row.cells for _, text in cell.links):
+				n += 1
+	return n
 
-		set_element_value_by_css(driver, "input[name='query']", username_prefix)
-		driver.find_element_by_css_selector(apply_filter).click()
+
+def delete_users(driver, ilias_url, username_prefix, n):
+	n_clicked = 0
+
+	while n_clicked < n:
+		_filter_users(driver, ilias_url, username_prefix)
 		n_clicked_old = n_clicked
 
-		for tr in driver.find_elements_by_css_selector("table tr"):
-			for a in tr.find_elements_by_css_selector("td a"):
-				if a.text.strip().startswith(username_prefix):
-					for checkbox in tr.find_elements_by_css_selector("input[type='checkbox']"):
-						checkbox.click()
-						n_clicked += 1
+		checkboxes = _find_user_checkboxes(driver, username_prefix)
+		if checkboxes is not None:
+			batch = DomBatch()
+			for css in checkboxes:
+				batch.check(css)
+			batch.run(driver)
+			n_clicked += len(checkboxes)
+		else:
+			for tr in driver.find_elements_by_css_selector("table tr"):
+				for a in tr.find_elements_by_css_selector("td a"):
+					if a.text.strip().startswith(username_prefix):
+						for checkbox in tr.find_elements_by_css_selector("input[type='checkbox']"):
+							checkbox.click()
+							n_clicked += 1
 
 		if n_clicked_old == n_clicked:  # error - not all users found.
 			break
@@ -306,6 +393,20 @@ def verify_admin_settings(driver, workarounds, settings, ilias_url, report):
 	return log
 
 
+def is_password_change_on_first_login(driver, ilias_url):
+	# whether ILIAS makes users change their password on their first login (see Login), which
+	# is set in the security settings of the privacy and security administration.
+	goto_administration_page(driver, ilias_url, "mm_adm_ps")
+
+	links = driver.find_elements_by_xpath("//a[contains(@href, 'cmd=showSecurity')]")
+	if links:
+		with wait_for_page_load(driver):
+			links[0].click()
+
+	checkboxes = driver.find_elements_by_id("password_change_on_first_login_enabled")
+	return any(c.is_selected() for c in checkboxes)
+
+
 class TemporaryUser:
 	def __init__(self):
 		self.username = None
@@ -318,16 +419,19 @@ class TemporaryUser:
 		return self.password
 
 
-def create_users_xml(base_url, tmp_users):
+def create_users_xml(base_url, tmp_users, action='Update'):
 	users = Element('Users')
 	SubElement(users, 'UDFDefinitions')
 
 	children = []
 	for tmp_user in tmp_users:
-		user = Element('User', Language='de', Action='Update')
+		user = Element('User', Language='de', Action=action)
 		children.append(user)
 
 		SubElement(user, 'Login').text = tmp_user.get_username()
+		if action == 'Delete':
+			continue  # the login is all ILIAS needs to find the user.
+
 		SubElement(user, 'Password', Type='PLAIN').text = tmp_user.get_password()
 
 		SubElement(user, 'Firstname').text = tmp_user.get_username()
@@ -387,26 +491,32 @@ class UsersBackend:
 
 		return user
 
-	def _create_n_users(self, prefix, n):
+	def _import_users_xml(self, users, action):
+		# one upload of an ILIAS user xml file, in which every user gets the given action.
 		parsed = urlparse(self.driver.current_url)
 		base_url = parsed.scheme + "://" + parsed.netloc + '/'.join(parsed.path.split('/')[:-1])
 
-		xml_path = os.path.abspath(os.path.join("/tiltr/tmp", "users.xml"))
+		xml = create_users_xml(base_url, users, action)
 
-		users = []
-		for i in range(n):
-			users.append(self._create_temporary_user(prefix, i))
-		xml = create_users_xml(base_url, users)
-
-		with open(xml_path, "w") as f:
+		# admin sessions import concurrently (e.g. pool top-ups next to a batch), so each
+		# import needs its own file.
+		with tempfile.NamedTemporaryFile(
+			mode="w", dir="/tiltr/tmp", prefix="users_", suffix=".xml", delete=False) as f:
 			f.write(xml)
+			xml_path = os.path.abspath(f.name)
 
+		try:
+			self._upload_users_xml(xml_path, len(users), action)
+		finally:
+			os.remove(xml_path)
+
+	def _upload_users_xml(self, xml_path, n, action):
 		goto_user_administration(self.driver, self.ilias_url)
 
 		with wait_for_page_load(self.driver):
 			self.driver.find_element_by_xpath("//a[contains(@href, 'cmd=importUserForm')]").click()
 
-		self.report("uploading xml user file with %d users." % n)
+		self.report("uploading xml user file with %d users (%s)." % (n, action.lower()))
 
 		import_button = self.driver.find_element_by_name('cmd[importUserRoleAssignment]')
 
@@ -419,15 +529,40 @@ class UsersBackend:
 			import_users_button = self.driver.find_element_by_name('cmd[importUsers]')
 			interact(self.driver, lambda: import_users_button.click())
 
+	def _create_n_users(self, prefix, n):
+		users = []
+		for i in range(n):
+			users.append(self._create_temporary_user(prefix, i))
+
+		self._import_users_xml(users, 'Update')
+
 		return users
 
 	def _delete_n_users(self, prefix, users):
+		t0 = time.time()
 		try:
-			n = delete_users(self.driver, self.ilias_url, prefix, len(users))
-			self.report("deleted %d user(s)." % n)
+			self._import_users_xml(users, 'Delete')
+
+			# ILIAS might have skipped the deletes, e.g. on a conflict, without telling us.
+			remaining = count_users(self.driver, self.ilias_url, prefix)
+			if remaining > 0:
+				raise InteractionException("%d user(s) still exist after xml import." % remaining)
+			n = len(users)
 		except:
-			self.report("deletion of user failed.")
+			self.report("deleting users through xml import failed, deleting them one by one.")
 			self.report(traceback.format_exc())
+			try:
+				n = delete_users(self.driver, self.ilias_url, prefix, len(users))
+			except:
+				self.report("deletion of user failed.")
+				self.report(traceback.format_exc())
+				return
+
+		dt = time.time() - t0
+		timings = get_recorded_timings()
+		if timings is not None:
+			timings.add("delete users", dt)
+		self.report("deleted %d user(s) in %.1fs." % (n, dt))
 
 	def _create_1_user(self, prefix, unique_id):
 		user = self._create_temporary_user(prefix, unique_id)
@@ -450,37 +585,96 @@ class UsersBackend:
 			self.report(traceback.format_exc())
 
 
+class UserPool:
+	# participant users that live on in ILIAS across batches. they are created in bulk, kept in
+	# the results db and leased to one batch at a time. their results from earlier batches are
+	# gone with delete_all_participants or with the temporary test copy they were taken in.
+
+	_top_up_mutex = threading.Lock()  # one top-up at a time, even across batches
+
+	def __init__(self, ilias_url):
+		self.ilias_url = ilias_url
+
+	@staticmethod
+	def _to_users(rows):
+		users = []
+		for username, password in rows:
+			user = TemporaryUser()
+			user.username = username
+			user.password = password
+			users.append(user)
+		return users
+
+	def _create(self, backend, n, lease=None):
+		# note: like all participant names, these must stay <= 31 chars (see UsersBackend).
+		prefix = datetime.datetime.today().strftime('tp_%y%m%d%H%M%S%f') + '_'
+		users = backend.create(prefix, n)
+		with open_results() as db:
+			db.put_pool_users(self.ilias_url, [(u.username, u.password) for u in users], lease)
+		return users
+
+	def lease(self, lease, n, make_backend, report):
+		with open_results() as db:
+			users = self._to_users(db.lease_pool_users(self.ilias_url, lease, n))
+		report("leased %d of %d users from user pool." % (len(users), n))
+
+		if len(users) < n:
+			users.extend(self._create(make_backend(), n - len(users), lease))
+		return users
+
+	def release(self, lease):
+		with open_results() as db:
+			db.release_pool_users(self.ilias_url, lease)
+
+	def get_free(self):
+		with open_results() as db:
+			return db.count_pool_users(self.ilias_url)[1]
+
+	def top_up(self, make_backend, n, report):
+		# makes sure there are n free users, so that the next batch does not need to wait for them.
+		if not UserPool._top_up_mutex.acquire(blocking=False):
+			return
+		try:
+			missing = n - self.get_free()
+			if missing > 0:
+				report("topping up user pool with %d users." % missing)
+				self._create(make_backend(), missing)
+		finally:
+			UserPool._top_up_mutex.release()
+
+
 class UsersFactory:
-	def __init__(self, test, n):
-		self.test = test
+	def __init__(self, n, pool):
 		self.n = n
+		self.pool = pool
 
 		self.prefix = datetime.datetime.today().strftime('tu_%Y%m%d%H%M%S') + '_'
 		self.users = None
 
-		if self.test.cache.recycled_users:
-			prefix, users = self.test.cache.recycled_users
-			if len(users) == n:
-				self.prefix = prefix
-				self.users = users
-				self.test.cache.recycled_users = None
+		self.recycle = False  # lease users from the pool instead of creating and deleting them
+		self.lease = None
 
-		self.recycle = False
-
-	def acquire(self, make_backend):
+	def acquire(self, make_backend, lease, report):
 		assert self.prefix is not None
-		if not self.users:
+		if self.recycle:
+			self.lease = lease
+			self.users = self.pool.lease(lease, self.n, make_backend, report)
+		else:
 			self.users = make_backend().create(self.prefix, self.n)
 		return self.users
 
+	def needs_top_up(self):
+		return self.lease is not None and self.pool.get_free() < self.n
+
 	def release(self, make_backend):
-		if self.recycle:
-			self.test.cache.recycled_users = (self.prefix, self.users)
-		else:
+		if self.lease is not None:
+			self.pool.release(self.lease)
+		elif self.users:
 			make_backend().destroy(self.prefix, self.users)
 
 		self.users = None
 		self.prefix = None
+		self.lease = None
 
 
 class MeasureTime:
@@ -500,8 +694,9 @@ def measure_time(dts):
 
 
 class ExamDriver:
-	def __init__(self, driver, ilias_url, username, report, context, questions, exam_configuration):
+	def __init__(self, driver, ilias_url, username, report, context, questions, exam_configuration, downloads=None):
 		self.driver = driver
+		self.downloads = downloads or DownloadManager(driver)
 
 		self.ilias_url = ilias_url
 		parsed_url = urlparse(self.ilias_url)
@@ -702,7 +897,8 @@ class ExamDriver:
 	def get_sequence_id(self, allow_reload=False):
 		exc = []
 
-		for _ in range(3):
+		retry = RetryPolicy("get_sequence_id", 3)
+		for _ in retry:
 			url = None
 			try:
 				url = self.driver.current_url
@@ -727,12 +923,10 @@ class ExamDriver:
 
 				self.report('is_resumed = %s' % is_resumed)
 
-				if not is_resumed:
-					if not allow_reload:
-						time.sleep(1)
-					else:
-						with wait_for_page_load(self.driver):
-							self.driver.refresh()
+				if not is_resumed and allow_reload:
+					with wait_for_page_load(self.driver):
+						self.driver.refresh()
+					retry.retry_now()
 
 		self.report('get_sequence_id failed: %s' % '\n\n'.join(exc))
 
@@ -740,24 +934,24 @@ class ExamDriver:
 
 	def _get_debug_info(self, question_title):
 		base_url = self.ilias_base_url + '/Customizing/uni-regensburg/extensions/'
-		cookies = dict((cookie['name'], cookie['value']) for cookie in self.driver.get_cookies())
+		downloads = self.downloads
 
 		info = dict()
 
 		try:
-			r = requests.get(base_url + 'Versions/debug.php', cookies=cookies, params=dict(
-				client_id=self.client_id,
-				question=question_title
-			))
-			info['version_log.html'] = r.text
+			info['version_log.html'] = downloads.get_text(
+				base_url + 'Versions/debug.php', what="debug info", params=dict(
+					client_id=self.client_id,
+					question=question_title
+				))
 		except:
 			pass
 
 		try:
-			r = requests.get(base_url + 'RequestLog/debug.php', cookies=cookies, params=dict(
-				client_id=self.client_id
-			))
-			info['request_log.html'] = r.text
+			info['request_log.html'] = downloads.get_text(
+				base_url + 'RequestLog/debug.php', what="debug info", params=dict(
+					client_id=self.client_id
+				))
 		except:
 			pass
 
@@ -798,8 +992,9 @@ class ExamDriver:
 			self.create_answer()
 		answer = self.answers[sequence_id]
 		self.report('answering question "%s" [%d].' % (answer.question.title, sequence_id))
-		valid = answer.randomize(self.context)
-		answer.verify(self.context, after_crash=False)
+		with count_commands(self.driver, answer.__class__.__name__):
+			valid = answer.randomize(self.context)
+			answer.verify(self.context, after_crash=False)
 		return valid
 
 	def verify_answer(self, after_crash=False):
@@ -811,7 +1006,8 @@ class ExamDriver:
 		answer = self.answers[sequence_id]
 		self.report('verifying question "%s" [%d].' % (answer.question.title, sequence_id))
 
-		interact(self.driver, lambda: answer.verify(self.context, after_crash))
+		with count_commands(self.driver, "%s verify" % answer.__class__.__name__):
+			interact(self.driver, lambda: answer.verify(self.context, after_crash))
 
 	def add_protocol_to_result(self, result):
 
@@ -862,17 +1058,93 @@ class ExamDriver:
 
 
 class TestCache:
-	def __init__(self):
+	# caches of packaged tests get persisted in cache_path (see PackagedTest.load_cache). the
+	# key is (archive sha, ILIAS version, ILIAS url); questions and exam configuration stay
+	# valid as long as the archive and ILIAS version do, the link also needs the same ILIAS.
+
+	cache_path = "/tiltr/tmp/tests"
+
+	# caches hold pickled questions and exam configurations. bump this whenever their classes
+	# change, so that caches from older versions of TiltR get parsed again.
+	format_version = 1
+
+	# pipelined batches share their test's cache and update and save it from their own
+	# threads. one lock for all caches, as caches for the same test share one file.
+	lock = threading.RLock()
+
+	def __init__(self, path=None, key=None):
 		self.cached_link = None
-		self.recycled_users = None
 		self.questions = None
 		self.exam_configuration = None
+		self.path = path
+		self.key = key
 
 	def transfer_invariants(self, cache):
 		# transfer those attributes from "cache" that are invariant wrt
 		# test runs (i.e. won't change on reimports).
-		self.questions = cache.questions
-		self.exam_configuration = cache.exam_configuration
+		with TestCache.lock:
+			self.questions = cache.questions
+			self.exam_configuration = cache.exam_configuration
+
+	def save(self):
+		if self.path is None:
+			return
+
+		with TestCache.lock:
+			data = dict(
+				version=TestCache.format_version,
+				key=self.key,
+				cached_link=self.cached_link,
+				questions=self.questions,
+				exam_configuration=self.exam_configuration)
+
+			try:
+				os.makedirs(os.path.dirname(self.path), exist_ok=True)
+				tmp_path = self.path + ".tmp"
+				with open(tmp_path, "wb") as f:
+					pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+				os.replace(tmp_path, self.path)
+			except:
+				print("could not write test cache %s." % self.path)
+				traceback.print_exc()
+
+	@staticmethod
+	def load(path, key):
+		cache = TestCache(path, key)
+
+		try:
+			with open(path, "rb") as f:
+				data = pickle.load(f)
+		except FileNotFoundError:
+			return cache
+		except:
+			print("could not read test cache %s, parsing test again." % path)
+			traceback.print_exc()
+			return cache
+
+		if not isinstance(data, dict) or data.get("version") != TestCache.format_version:
+			return cache  # written by another version of TiltR.
+
+		stored_key = data.get("key")
+		if stored_key is None or tuple(stored_key[:2]) != tuple(key[:2]):
+			return cache  # archive or ILIAS version changed.
+
+		questions = data.get("questions")
+		try:
+			if questions is not None:
+				for question in questions.values():
+					question.get_maximum_score()
+		except:
+			print("test cache %s has broken questions, parsing test again." % path)
+			traceback.print_exc()
+			return cache
+
+		cache.questions = questions
+		cache.exam_configuration = data.get("exam_configuration")
+		if tuple(stored_key) == tuple(key):
+			cache.cached_link = data.get("cached_link")
+
+		return cache
 
 
 class AbstractTest:
@@ -882,6 +1154,13 @@ class AbstractTest:
 	def get_title(self):
 		raise NotImplementedError()
 
+	def load_cache(self, ilias_url, ilias_version):
+		pass
+
+	def read_qti(self):
+		# QTI xml of the test's questions, if available.
+		return None
+
 
 class PackagedTest(AbstractTest):
 	def __init__(self, test_id):
@@ -889,14 +1168,10 @@ class PackagedTest(AbstractTest):
 
 		self.test_id = test_id
 		self.path = os.path.abspath(os.path.join(
-			"/tiltr/tests", test_id + ".zip"))
+			tests_path, test_id + ".zip"))
 
 		with ZipFile(self.path, 'r') as zf:
-			main = None
-			for name in zf.namelist():
-				if re.match(r"^[^/]*/[^/]+_tst_[^/]+\.xml$", name):
-					main = name
-					break
+			main = find_xml(zf, test_xml_pattern)
 
 			if main is None:
 				raise RuntimeError("did not find test xml in zip")
@@ -914,30 +1189,37 @@ class PackagedTest(AbstractTest):
 	def get_title(self):
 		return self.title
 
-	@staticmethod
-	def list():
-		tests = dict()
+	def get_sha(self):
+		return file_sha(self.path)
 
-		for filename in os.listdir("/tiltr/tests"):
-			if filename.endswith(".zip"):
-				try:
-					test = PackagedTest(os.path.splitext(filename)[0])
-					tests[test.get_title()] = test.get_id()
-				except:
-					print("could not inspect Test %s." % filename)
-					traceback.print_exc()
+	def load_cache(self, ilias_url, ilias_version):
+		# replaces the cache with the persisted one for this archive and ILIAS.
+		key = (self.get_sha(), ilias_version, ilias_url)
+		if self.cache.key != key:
+			self.cache = TestCache.load(
+				os.path.join(TestCache.cache_path, self.test_id + ".pickle"), key)
 
-		return tests
+	def read_qti(self):
+		with ZipFile(self.path, 'r') as zf:
+			name = find_xml(zf, qti_xml_pattern)
+			return zf.read(name) if name else None
 
 
 class ImportedTest(AbstractTest):
-	def __init__(self, title):
+	def __init__(self, title, source=None):
 		super().__init__()
 		self.title = title
+		self.source = source  # the test this one is a copy of, if any
 
 	def get_title(self):
 		return self.title
 
+	def read_qti(self):
+		# a copy only differs from its source in its title.
+		if self.source is None:
+			return None
+		return self.source.read_qti()
+
 
 class TestDriver:
 	def __init__(self, user_driver, test):
@@ -950,6 +1232,7 @@ class TestDriver:
 		self.client_id = user_driver.client_id
 
 		self.report = user_driver.report
+		self.downloads = user_driver.downloads
 		self.autosave_time = 5
 		self.allow_resume = False
 
@@ -1124,9 +1407,7 @@ class TestDriver:
 
 		self.report("downloading exported %s." % format)
 
-		cookies = dict((cookie['name'], cookie['value']) for cookie in self.driver.get_cookies())
-		result = requests.get(url, cookies=cookies)
-		return result.content
+		return self.downloads.get_file(url, what=format, report=self.report)
 
 	def export_xmlres(self):
 		return self._export("xmlres", "zip")
@@ -1134,11 +1415,88 @@ class TestDriver:
 	def export_xls(self):
 		return self._export("csv", "xlsx")
 
-	def export_pdf(self):
-		self.report("exporting PDFs.")
+	def _show_all_participants(self, ref_id):
+		# set filter to display up to 800 participants.
+		driver = self.driver
+		dropdown = driver.find_element_by_id("ilAdvSelListAnchorText_sellst_rows_tst_participants_%d" % ref_id)
+		dropdown.click()
+		with wait_for_page_load(driver):
+			driver.find_element_by_id("sellst_rows_tst_participants_%d_800" % ref_id).click()
+
+	def _resolve_pdf_requests(self, ref_id, user_ids):
+		# reads all participants and the table's command form in one pass. returns the form's
+		# action and, for each user in user_ids, the form data that opens this user's detailed
+		# results. other participants (e.g. of earlier runs on the same test copy) are skipped.
+		table = parse_table(self.driver.page_source, "tst_participants_%d" % ref_id)
+		form = self.driver.execute_script(_command_form_script)
+		if table is None or not form or not form["select"] or not form["submit"]:
+			return None, None
+
+		requests_data = dict()
+		for row in table.rows:
+			if len(row.cells) < 3:
+				continue
+
+			labels = row.cells[2].labels
+			if not labels:
+				return None, None
+			if labels[0] not in user_ids:
+				continue
+
+			active_ids = [attrs.get("value") for cell in row.cells
+				for attrs in cell.inputs if attrs.get("name") == "chbUser[]"]
+			if not active_ids:
+				return None, None
+
+			data = list(form["fields"])
+			data.append((form["select"], "showDetailedResults"))
+			data.append(tuple(form["submit"]))
+			data.append(("chbUser[]", active_ids[0]))
+			requests_data[labels[0]] = data
+
+		return form["action"], requests_data
+
+	def _download_pdfs(self, action, requests_data):
+		# ILIAS keeps the selected participant in the session, so selecting a participant and
+		# downloading its PDF must not interleave with other participants. downloads go one
+		# after another over one keep-alive session, while the PDFs get parsed concurrently.
+		futures = dict()
+		with ThreadPoolExecutor(pdf_parse_threads) as executor:
+			for user_id, data in requests_data.items():
+				r = self.downloads.post(action, what="results page", data=data)
+				if r.status_code != 200:
+					continue
+
+				url = None
+				for navbar in parse_elements(r.text, "navbar-form"):
+					if 'PDF' in navbar.text and navbar.links:
+						url = urljoin(r.url, navbar.links[0][0])
+						break
+				if url is None:
+					continue
+
+				self.report("downloading PDF for %s." % user_id)
+				try:
+					f = self.downloads.get_file(url, what="pdf")
+				except requests.exceptions.RequestException:
+					continue
+				if f.read(4) == b'%PDF':
+					f.seek(0)
+					futures[user_id] = executor.submit(PDF, f)
+				else:
+					f.close()
+
+			pdfs = dict()
+			for user_id, future in futures.items():
+				try:
+					pdfs[user_id] = future.result()
+				except:
+					# export_pdf retries this user row by row.
+					self.report("could not read PDF for %s: %s" % (user_id, traceback.format_exc()))
+			return pdfs
 
+	def _export_pdfs_per_row(self, ref_id, user_ids):
 		driver = self.driver
-		ref_id = self._get_ref_id()
 
 		pdfs = dict()
 		row_index = 0
@@ -1146,10 +1504,7 @@ class TestDriver:
 			with wait_for_page_load(driver):
 				self.goto_participants()
 
-			# set filter to display up to 800 participants.
-			dropdown = driver.find_element_by_id("ilAdvSelListAnchorText_sellst_rows_tst_participants_%d" % ref_id)
-			dropdown.click()
-			driver.find_element_by_id("sellst_rows_tst_participants_%d_800" % ref_id).click()
+			self._show_all_participants(ref_id)
 
 			trs = list(driver.find_elements_by_css_selector("#tst_participants_%d tbody tr" % ref_id))
 			if row_index >= len(trs):
@@ -1164,6 +1519,10 @@ class TestDriver:
 			user_id = tds[2].find_element_by_css_selector("label").text.strip()
 			assert user_id not in pdfs
 
+			if user_ids is not None and user_id not in user_ids:
+				row_index += 1
+				continue
+
 			tr.find_element_by_css_selector("input[name='chbUser[]']").click()
 
 			with wait_for_page_load(driver):
@@ -1179,25 +1538,88 @@ class TestDriver:
 				self.report("downloading PDF for %s." % user_id)
 
 				url = navbar.find_element_by_css_selector("a").get_attribute("href")
-				cookies = dict((cookie['name'], cookie['value']) for cookie in driver.get_cookies())
-				result = requests.get(url, cookies=cookies)
-
-				pdfs[user_id] = PDF(result.content)
+				pdfs[user_id] = PDF(self.downloads.get_file(url, what="pdf"))
 				break
 
 			row_index += 1
 
 		return pdfs
 
+	def export_pdf(self, user_ids):
+		# returns user id -> PDF for all participants in user_ids.
+		self.report("exporting PDFs.")
+
+		driver = self.driver
+		ref_id = self._get_ref_id()
+
+		with wait_for_page_load(driver):
+			self.goto_participants()
+		self._show_all_participants(ref_id)
+
+		action, requests_data = self._resolve_pdf_requests(ref_id, set(user_ids))
+		if requests_data is None:
+			self.report("unexpected participants table, exporting PDFs row by row.")
+			pdfs = self._export_pdfs_per_row(ref_id, set(user_ids))
+		else:
+			pdfs = self._download_pdfs(action, requests_data)
+
+			# participants not even found in the table are missing as well.
+			missing = set(user_ids) - set(pdfs.keys())
+			if missing:
+				self.report("bulk PDF export failed for %s, retrying row by row." % ", ".join(sorted(missing)))
+				pdfs.update(self._export_pdfs_per_row(ref_id, missing))
+
+		missing = set(user_ids) - set(pdfs.keys())
+		if missing:
+			raise InteractionException("could not export PDFs for %s." % ", ".join(sorted(missing)))
+
+		return pdfs
+
+	def _read_statistics_header(self):
+		# maps column names (reached, mark, login) to the index of their sort link.
+		table = parse_table(self.driver.page_source, "tst_eval_all")
+		if table is not None:
+			index = dict()
+			links = [href for cell in table.header for href, _ in cell.links]
+			for i, href in enumerate(links):
+				nav = http_get_parameters(href or "").get("tst_eval_all_table_nav")
+				if nav:
+					index[nav.split(":")[0]] = i
+			if all(k in index for k in ("reached", "mark", "login")):
+				return index
+
+		# unexpected page source structure, ask the live DOM.
+		index = dict()
+		for i, a in enumerate(self.driver.find_elements_by_css_selector("#tst_eval_all thead th a")):
+			nav = http_get_parameters(a.get_attribute("href"))["tst_eval_all_table_nav"].split(":")
+			index[nav[0]] = i
+		return index
+
+	def _read_statistics_rows(self, columns_index):
+		# returns a list of (login, reached, mark) texts, one per participant row.
+		n_columns = max(columns_index.values()) + 1
+
+		table = parse_table(self.driver.page_source, "tst_eval_all")
+		if table is not None and all(len(row.cells) >= n_columns for row in table.rows):
+			return [tuple(
+				row.cells[columns_index[k]].text for k in ("login", "reached", "mark"))
+				for row in table.rows]
+
+		self.report("unexpected statistics table structure, reading it cell by cell.")
+
+		rows = []
+		for tr in self.driver.find_elements_by_css_selector("#tst_eval_all tbody tr"):
+			columns_list = list(tr.find_elements_by_css_selector("td"))
+			columns = dict((k, columns_list[i]) for k, i in columns_index.items())
+			rows.append(tuple(columns[k].text for k in ("login", "reached", "mark")))
+		return rows
+
 	def get_statistics_from_web_gui(self, user_ids):
 		def fetch_scores():
 			with wait_for_page_load(self.driver):
 				self.goto_statistics()
 
-			index = dict()
-			for i, a in enumerate(self.driver.find_elements_by_css_selector("#tst_eval_all thead th a")):
-				nav = http_get_parameters(a.get_attribute("href"))["tst_eval_all_table_nav"].split(":")
-				index[nav[0]] = i
+			index = self._read_statistics_header()
 
 			if all(k in index for k in ("reached", "mark", "login")):
 				return index
@@ -1221,20 +1643,17 @@ class TestDriver:
 		stats = dict()
 		unassigned = dict(("[%s]" % name, name) for name in user_ids)
 
-		for tr in self.driver.find_elements_by_css_selector("#tst_eval_all tbody tr"):
-			columns_list = list(tr.find_elements_by_css_selector("td"))
-			columns = dict((k, columns_list[i]) for k, i in columns_index.items())
-
-			key = columns["login"].text.strip()
+		for login, reached, mark in self._read_statistics_rows(columns_index):
+			key = login.strip()
 			user_id = unassigned.get(key)
 			if user_id:
 				del unassigned[key]
 
-				score_data = re.split(r"\s+", columns["reached"].text)
+				score_data = re.split(r"\s+", reached.strip())
 
 				stats[user_id] = UserStat(
 					score=Decimal(score_data[0]),
-					short_mark=columns["mark"].text.strip())
+					short_mark=mark.strip())
 
 		if len(unassigned) > 0:
 			raise InteractionException(
@@ -1256,7 +1675,40 @@ class TestDriver:
 
 		return settings
 
-	def parse_question_definitions(self, settings):
+	def parse_questions(self, settings):
+		# reads question definitions from the test's QTI, which needs no page loads, and
+		# only falls back to parsing them from the UI if that is not possible.
+		t0 = time.time()
+		try:
+			data = self.test.read_qti()
+			questions = parse_qti_questions(data, settings) if data is not None else None
+		except Exception as e:
+			# whatever goes wrong with the archive or its QTI, the UI still has the questions.
+			self.report("cannot read questions from QTI (%s), parsing them from UI." % repr(e))
+			if not isinstance(e, NotImplementedException):
+				traceback.print_exc()
+		else:
+			if questions is not None:
+				self.report("read %d questions from QTI in %.1f ms." % (len(questions), (time.time() - t0) * 1000))
+				if self._cross_check_questions(questions, settings):
+					return questions
+
+		return self.parse_question_definitions(settings)
+
+	def _cross_check_questions(self, questions, settings):
+		# compares the first qti_cross_check questions parsed from the UI to those from QTI.
+		n = int(settings.qti_cross_check)
+		if n < 1:
+			return True
+
+		for title, question in self.parse_question_definitions(settings, limit=n).items():
+			if title not in questions or get_definition(questions[title]) != get_definition(question):
+				self.report('QTI differs from UI for "%s", parsing all questions from UI.' % title)
+				return False
+
+		return True
+
+	def parse_question_definitions(self, settings, limit=None):
 		driver = self.driver
 
 		self.goto_questions()
@@ -1304,6 +1756,9 @@ class TestDriver:
 				self.report('parsing "%s" as %s.' % (title, constructor.__name__))
 				questions[title] = constructor(driver, title, settings)
 
+				if limit is not None and len(questions) >= limit:
+					break
+
 		return questions
 
 	def delete_all_participants(self):
@@ -1343,7 +1798,7 @@ class TestDriver:
 		self.user_driver.search_test(self.test.get_title())
 
 		driver = self.driver
-		for i in range(10):
+		for i in RetryPolicy("find test link", 10, max_delay=2):
 			for link in driver.find_elements_by_partial_link_text(self.test.get_title()):
 				if link.is_displayed():
 					if link.text.strip() == self.test.get_title():
@@ -1351,7 +1806,6 @@ class TestDriver:
 							link.click()
 						self.test.cache.cached_link = driver.current_url
 						return True
-			time.sleep(1)
 
 		return False
 
@@ -1391,7 +1845,9 @@ class TestDriver:
 		if not self._try_start_or_resume():
 			raise InteractionException("user does not have rights to start this test. aborting.")
 		self.skip_list_of_questions()
-		return ExamDriver(self.driver, self.ilias_url, username, self.report, context, questions, exam_configuration)
+		return ExamDriver(
+			self.driver, self.ilias_url, username, self.report, context, questions, exam_configuration,
+			downloads=self.downloads)
 
 
 class UserDriver:
@@ -1404,6 +1860,7 @@ class UserDriver:
 		self.client_id = parse_qs(parsed_url.query)['client_id'][0]
 
 		self.report = report
+		self.downloads = DownloadManager(driver)
 
 	def login(self, username, password):
 		return Login(self, username, password)
@@ -1458,7 +1915,12 @@ class UserDriver:
 
 		self.report("done importing test.")
 
-	def delete_test(self, test_name):
+		# ILIAS shows the imported test, so this is its ref id.
+		ref_id = http_get_parameters(driver.current_url).get("ref_id")
+		return int(ref_id) if ref_id and ref_id.isdigit() else None
+
+	def delete_test(self, test_name, ref_id=None):
+		# if ref_id is given, only deletes the test if it is the one with that ref id.
 		self.search_test(test_name)
 
 		self.report('deleting test "%s".' % test_name)
@@ -1472,13 +1934,18 @@ class UserDriver:
 		if link_text != test_name:
 			raise InteractionException("link text mismatch")
 
+		if ref_id is not None:
+			href = row.find_element_by_css_selector("a.il_ContainerItemTitle").get_attribute("href") or ""
+			if not re.search(r"(ref_id=|_)%d(\D|$)" % ref_id, href):
+				raise InteractionException('test "%s" is not the one with ref id %d.' % (test_name, ref_id))
+
 		button = row.find_element_by_css_selector(".dropdown-toggle")
 		button.click()
 
 		#wait_for_css_visible(self.driver, "ul.dropdown-menu")  # let's hope there's only one
 
 		found_link = False
-		for _ in range(5):
+		for _ in RetryPolicy("find delete link", 5, max_delay=2):
 			menu = row.find_element_by_css_selector("ul.dropdown-menu")
 			for link in menu.find_elements_by_css_selector("a"):
 				if "cmd=delete" in link.get_attribute("href"):
@@ -1488,7 +1955,6 @@ class UserDriver:
 					break
 			if found_link:
 				break
-			time.sleep(1)
 
 		delete_button = self.driver.find_element_by_css_selector('input[name="cmd[performDelete]"]')
 		with wait_for_page_load(self.driver):
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+import time
+import traceback
+from urllib.parse import urljoin
+
+import requests
+import requests.adapters
+from selenium.common.exceptions import NoSuchElementException
+
+from tiltr.data.exceptions import *
+from tiltr.data.metrics import get_recorded_timings
+from tiltr.question.protocol import AnswerProtocol
+
+from .document import parse_document, serialize_form, run_dom_batch
+from .drivers import ExamDriver, measure_time
+from .retry import response_times
+from .utils import http_get_parameters
+
+
+# participants that take their exam through plain HTTP requests instead of a browser. they
+# use the same answer classes as browser participants, whose DomBatch operations (see dom.py)
+# get applied to the fetched pages. this needs no javascript, so only answers that are built
+# on DomBatch are supported. there is no autosave either, so crashes cannot be simulated.
+
+
+class HttpDriver:
+	# stands in for a selenium driver. every request and every DomBatch is one command,
+	# counted in n_commands like pandora's drivers do (see dom.count_commands).
+
+	def __init__(self, timeout=60):
+		self.session = requests.Session()
+		adapter = requests.adapters.HTTPAdapter(pool_maxsize=1)
+		self.session.mount('http://', adapter)
+		self.session.mount('https://', adapter)
+		self.timeout = timeout
+		self.current_url = None
+		self.page_source = ""
+		self.document = parse_document("")
+		self.n_commands = 0
+
+	def execute(self, command, params):
+		self.n_commands += 1
+		if command == "request":
+			return dict(value=self._request(**params))
+		elif command == "dom batch":
+			return dict(value=run_dom_batch(self.document, params["ops"]))
+		else:
+			raise NotImplementedException("command %s is not available without a browser." % command)
+
+	def _request(self, method, url, data=None):
+		t0 = time.time()
+		if method == "GET":
+			r = self.session.get(url, params=data, timeout=self.timeout)
+		else:
+			r = self.session.post(url, data=data, timeout=self.timeout)
+		dt = time.time() - t0
+
+		response_times.observe(dt)
+		timings = get_recorded_timings()
+		if timings is not None:
+			timings.add("http %s" % method, dt)
+
+		if r.status_code >= 400:
+			raise InteractionException("%s %s failed with status %d." % (method, url, r.status_code))
+
+		self.current_url = r.url
+		self.page_source = r.text
+		self.document = parse_document(r.text)
+		return r.status_code
+
+	def get(self, url):
+		self.execute("request", dict(method="GET", url=urljoin(self.current_url or url, url)))
+
+	def submit(self, form, submitter=None, values=None):
+		# submits form like a browser would, with values overriding or adding fields.
+		data = serialize_form(form, submitter)
+		if values:
+			data = [(k, v) for k, v in data if k not in values] + list(values.items())
+
+		action = urljoin(self.current_url, form.get("action") or self.current_url)
+		method = (form.get("method") or "get").upper()
+		self.execute("request", dict(method="POST" if method == "POST" else "GET", url=action, data=data))
+
+	def run_dom_batch(self, ops):
+		return self.execute("dom batch", dict(ops=ops))["value"]
+
+	def find(self, css):
+		return self.document.select_one(css)
+
+	def find_element_by_css_selector(self, css):
+		element = self.document.select_one(css)
+		if element is None:
+			raise NoSuchElementException("no element matches %s" % css)
+		return element
+
+	def find_elements_by_css_selector(self, css):
+		return self.document.select(css)
+
+	def get_cookies(self):
+		return [dict(name=cookie.name, value=cookie.value) for cookie in self.session.cookies]
+
+	def quit(self):
+		self.session.close()
+
+
+class HttpLogin:
+	def __init__(self, driver, ilias_url, username, password, report):
+		self.driver = driver
+		self.url = ilias_url
+		self.username = username
+		self.password = password
+		self.report = report
+		self.language = None
+
+	def __enter__(self):
+		driver = self.driver
+
+		self.report("opening login page.")
+		driver.get(self.url)
+
+		form = driver.find_element_by_css_selector("form[name='formlogin']")
+		form.select_one("input[name='username']").set_value(self.username)
+		form.select_one("input[name='password']").set_value(self.password)
+
+		self.report("logging in as " + self.username + "/" + self.password + ".")
+		driver.submit(form, form.select_one("input[name='cmd[doStandardAuthentication]']"))
+
+		if driver.find("form[name='formlogin']") is not None:
+			raise InteractionException("login as %s failed." % self.username)
+
+		if driver.find("#il_prop_cont_current_password") is not None:
+			# will only happen if admin setting "change password on first login" is enabled.
+			self.report("changing password.")
+
+			button = driver.find_element_by_css_selector("input[name='cmd[savePassword]']")
+			form = button.closest("form")
+			driver.submit(form, button, dict(
+				current_password=self.password,
+				new_password=self.password + "_",
+				new_password_retype=self.password + "_"))
+
+		html = driver.find("html")
+		self.language = html.get("lang") if html is not None else None
+
+		return self
+
+	def __exit__(self, *args):
+		try:
+			logout = self.driver.find("a[href*='logout.php']")
+			if logout is not None:
+				self.driver.get(logout.get("href"))
+				self.report("logged out.")
+		except:
+			self.report("logout failed.")
+			self.report(traceback.format_exc())
+
+
+def start_or_resume(driver, allow_resume=False):
+	resume_player = driver.find("input[name='cmd[resumePlayer]']")
+	if resume_player is not None:
+		if not allow_resume:
+			raise InteractionException("test has already been started by this user. aborting.")
+		driver.submit(resume_player.closest("form"), resume_player)
+		return True
+
+	start_player = driver.find("input[name='cmd[startPlayer]']")
+	if start_player is None:
+		return False
+	driver.submit(start_player.closest("form"), start_player)
+	return True
+
+
+class HttpExamDriver(ExamDriver):
+	# navigates the test player by submitting its question form with the next command,
+	# just like the player's javascript does when a navigation link gets clicked.
+
+	supported_answers = ("SingleChoiceAnswer", "MultipleChoiceAnswer", "KPrimAnswer", "ClozeAnswer")
+
+	def _navigate(self, nextcmd):
+		link = self.driver.find('a[data-nextcmd="%s"]' % nextcmd)
+		if link is None:
+			return False
+
+		form = self.driver.find("#taForm")
+		with measure_time(self.dts):
+			if form is not None:
+				self.driver.submit(form, values=dict(
+					nextcmd=nextcmd, nextparm=link.get("data-nextparm", "")))
+			else:
+				self.driver.get(link.get("href"))
+		return True
+
+	def close(self):
+		self.report("finishing test.")
+
+		if not self._navigate("finishTest"):
+			raise InteractionException("failed to properly finish test")
+
+		confirm = self.driver.find('input[name="cmd[confirmFinish]"]')
+		if confirm is not None:
+			self.driver.submit(confirm.closest("form"), confirm)
+
+		self.protocol.append((time.time(), "test", "finished test."))
+
+	def simulate_crash(self, wait):
+		# a crash tests ILIAS' autosave, which is javascript.
+		self.report("skipping simulated crash, there is no autosave without a browser.")
+
+	def confirm_save(self):
+		pass
+
+	def goto_first_question(self):
+		while self.has_previous_question():
+			self.report("goto previous question.")
+			self._navigate("previousQuestion")
+
+	def goto_next_question(self):
+		self.protocol.append((time.time(), "test", "goto next question."))
+
+		if self.has_next_question():
+			self.report("goto next question.")
+			return self._navigate("nextQuestion")
+		else:
+			return False
+
+	def goto_next_or_previous_question(self, context, random_dir=False):
+		self.protocol.append((time.time(), "test", "goto next or previous question."))
+
+		options = ('next', 'previous')
+		if random_dir and context.random.random() < 0.5:
+			options = reversed(options)
+
+		for command in options:
+			if self._navigate("%sQuestion" % command):
+				self.report("goto %s question." % command)
+				return True
+
+		return False
+
+	def get_sequence_id(self, allow_reload=False):
+		for _ in range(2):
+			try:
+				return int(http_get_parameters(self.driver.current_url)["sequence"])
+			except (KeyError, ValueError, TypeError):
+				self.report('get_sequence_id failed on url %s' % self.driver.current_url)
+				if not start_or_resume(self.driver, allow_resume=True):
+					break
+
+		raise InteractionException("no question sequence in url %s" % self.driver.current_url)
+
+	def create_answer(self):
+		page_title = self.driver.find(".ilc_page_title_PageTitle")
+		if page_title is None:
+			raise InteractionException("no question title found.")
+
+		title = page_title.text
+
+		if title not in self.questions:
+			raise InteractionException("no question content found for '%s'." % title)
+
+		self.report('entering question "' + title + '"')
+
+		answer = self.questions[title].create_answer(
+			self.driver, AnswerProtocol(title, self._get_debug_info))
+
+		if answer.__class__.__name__ not in self.supported_answers:
+			raise NotImplementedException(
+				"%s cannot be given without a browser." % answer.__class__.__name__)
+
+		sequence_id = self.get_sequence_id()
+		assert sequence_id not in self.answers
+		self.answers[sequence_id] = answer
+
+		return answer
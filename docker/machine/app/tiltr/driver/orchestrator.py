@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+import asyncio
+import base64
+import json
+import time
+import traceback
+from urllib.parse import urlencode
+
+import tornado.ioloop
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+
+from tiltr.data.exceptions import *
+from tiltr.data.result import Result, Origin
+
+
+# read timeout for event streams from machines. machines close their streams
+# after 30 seconds, so this only triggers on dead connections.
+stream_read_timeout = 90
+
+# number of seconds to wait for a busy machine to free up a runner.
+busy_timeout = 60
+
+# number of machines a participant gets tried on before it counts as failed.
+max_attempts = 3
+
+
+class _MachineFailure(Exception):
+	# a machine could not run (or finish running) a participant, e.g. since it is unreachable or
+	# stays busy. the participant can still run on another machine.
+	pass
+
+
+class _EventStream:
+	# splits the chunks of a machine's event stream into messages and handles
+	# them as soon as they arrive.
+
+	def __init__(self, origin, report, events):
+		self.origin = origin
+		self.report = report
+		self.events = events
+		self.cursor = 0
+		self.result_json = None
+		self.files = dict()  # files of the result, which arrive before it
+		self.error = None
+		self._buffer = b''
+
+	def __call__(self, chunk):
+		self._buffer += chunk
+		*lines, self._buffer = self._buffer.split(b'\n')
+		for line in lines:
+			if line:
+				self._handle(*json.loads(line.decode('utf8')))
+
+	def _handle(self, command, payload, sent_time, seq):
+		self.events.received(self.origin, sent_time)
+		self.cursor = seq + 1
+
+		if command == "ECHO":
+			self.report(self.origin, payload)
+		elif command == "FILE":
+			name, data = payload
+			self.files[name] = base64.b64decode(data)
+		elif command == "DONE":
+			self.result_json = payload
+		elif command == "ERROR":
+			self.error = Exception(payload)
+		else:
+			self.error = InteractionException("unknown command %s" % command)
+
+	@property
+	def is_done(self):
+		return self.result_json is not None or self.error is not None
+
+
+class Orchestrator:
+	# runs the exams of a batch on all machines concurrently on the master's IOLoop. all
+	# machines share one pooled async http client, so there is no thread per participant.
+
+	def __init__(self, ioloop=None, max_clients=1000):
+		self.ioloop = ioloop or tornado.ioloop.IOLoop.current()
+		self.max_clients = max_clients
+		self._client = None
+
+	def _get_client(self):
+		# must be called on the IOLoop.
+		if self._client is None:
+			self._client = AsyncHTTPClient(force_instance=True, max_clients=self.max_clients)
+		return self._client
+
+	async def _abort(self, machine, batch_id, index):
+		try:
+			await self._get_client().fetch(
+				"http://%s:8888/abort/%s/%d" % (machine, batch_id, index),
+				method="POST", body="", request_timeout=10)
+		except:
+			traceback.print_exc()
+
+	async def take_exam(self, command, batch_id, report, events, origin):
+		machine = command.machine
+		index = command.machine_index
+		client = self._get_client()
+
+		report("master", "passing take_exam to %s." % machine)
+
+		started = False
+		try:
+			body = urlencode(dict(command_json=command.to_json()))
+			t1 = time.time() + busy_timeout
+			while True:
+				r = await client.fetch(
+					"http://%s:8888/start/%s/%d" % (machine, batch_id, index),
+					method="POST", body=body, raise_error=False)
+				if r.code != 503 or time.time() > t1:
+					break
+				await asyncio.sleep(1)  # runners of the last batch are still shutting down.
+
+			if r.code == 599 and r.error:
+				raise _MachineFailure("start call failed: %s" % r.error)
+			elif r.code != 200:
+				raise _MachineFailure("start call failed: %s" % r.code)
+
+			report("master", "test started on %s." % machine)
+			started = True
+
+			stream = _EventStream(origin, report, events)
+
+			while not stream.is_done:
+				# the machine pushes its messages through this stream as soon as they happen. streams
+				# get closed after some idle time, in which case we simply reconnect at our cursor.
+				r = await client.fetch(
+					"http://%s:8888/stream/%s/%d/%d" % (machine, batch_id, index, stream.cursor),
+					streaming_callback=stream, request_timeout=stream_read_timeout,
+					raise_error=False)
+
+				if r.code == 599 and r.error:
+					raise _MachineFailure("stream call failed: %s" % r.error)
+				elif r.code != 200:
+					raise _MachineFailure("stream call failed: %s" % r.code)
+
+			if stream.error:
+				raise stream.error
+
+		except asyncio.CancelledError:
+			report("master", "aborting test on %s." % machine)
+			await self._abort(machine, batch_id, index)
+			raise
+
+		except (_MachineFailure, ConnectionError, IOError, HTTPClientError) as e:
+			# the machine could not be reached or got lost. don't leave a half run exam behind.
+			traceback.print_exc()
+			if started:
+				await self._abort(machine, batch_id, index)
+			if isinstance(e, _MachineFailure):
+				raise
+			raise _MachineFailure(str(e) or type(e).__name__)
+
+		except TiltrException as e:
+			traceback.print_exc()
+			self._report_failure(report, machine)
+			return Result.from_error(Origin.recorded, e.get_error_domain(), traceback.format_exc())
+
+		except:
+			traceback.print_exc()
+			self._report_failure(report, machine)
+			return Result.from_error(Origin.recorded, ErrorDomain.integrity, traceback.format_exc())
+
+		report("master", "received take_exam results from %s." % machine)
+		result = Result(from_json=stream.result_json)
+		result.files.update(stream.files)
+		return result
+
+	@staticmethod
+	def _report_failure(report, machine):
+		try:
+			report("error", "machine %s failed." % machine)
+			report("traceback", traceback.format_exc())
+		except:
+			print("report failed.")
+
+	async def _get_capacity(self, machine):
+		# number of (browser, http) participants a machine can run at once. a machine we cannot
+		# reach gets no participants.
+		try:
+			r = await self._get_client().fetch(
+				"http://%s:8888/status.json" % machine, request_timeout=10)
+			status = json.loads(r.body.decode('utf8'))
+			capacity = max(1, int(status["capacity"]))
+			return capacity, max(0, int(status.get("http_capacity", capacity)))
+		except:
+			traceback.print_exc()
+			return 0, 0
+
+	async def _take_exams(
+		self, commands, origins, machines, batch_id, report, events, max_per_machine, on_dispatch, is_available):
+		# participants are queued and handed out to machines as soon as one of their runners
+		# frees up, so the number of participants does not depend on the number of machines.
+		# browser and http participants have queues of their own, since machines run far more
+		# http participants than browser participants. if a machine fails to run a participant,
+		# the participant goes back into its queue for another machine, and the machine's
+		# runner stops taking participants.
+
+		queues = dict(browser=asyncio.Queue(), http=asyncio.Queue())
+		for i, (command, origin) in enumerate(zip(commands, origins)):
+			queues[command.engine].put_nowait((i, command, origin))
+
+		results = [None] * len(commands)
+		attempts = [0] * len(commands)
+		remaining = len(commands)  # participants without result
+		workers = []  # (engine, coroutine)
+
+		def finish(i, result):
+			nonlocal remaining
+			results[i] = result
+			remaining -= 1
+			if remaining == 0:
+				for engine, _ in workers:
+					queues[engine].put_nowait(None)  # wakes up waiting runners, so they can stop.
+
+		async def work(machine, queue):
+			while remaining > 0:
+				item = await queue.get()
+				if item is None:
+					break
+				i, command, origin = item
+
+				if is_available and not is_available(machine):
+					queue.put_nowait(item)
+					report("master", "machine %s is gone, not scheduling any more participants on it." % machine)
+					break
+
+				attempts[i] += 1
+				command.machine = machine
+				if on_dispatch:
+					on_dispatch(origin, machine, command.machine_index)
+
+				try:
+					result = await self.take_exam(command, batch_id, report, events, origin)
+				except _MachineFailure as e:
+					if attempts[i] < max_attempts:
+						report("master", "machine %s failed to run %s, trying another machine: %s" % (
+							machine, origin, e))
+						queue.put_nowait(item)
+					else:
+						self._report_failure(report, machine)
+						finish(i, Result.from_error(
+							Origin.recorded, ErrorDomain.interaction,
+							"%s failed on %d machines: %s" % (origin, attempts[i], e)))
+					break
+
+				finish(i, result)
+
+		capacities = await asyncio.gather(*[self._get_capacity(machine) for machine in machines])
+
+		for engine, k in (("browser", 0), ("http", 1)):
+			n = queues[engine].qsize()
+			if n == 0:
+				continue
+			runners = []
+			for machine, capacity in zip(machines, capacities):
+				capacity = capacity[k]
+				if engine == "browser" and max_per_machine > 0:
+					capacity = min(capacity, max_per_machine)
+				runners.append([machine] * min(capacity, n))
+			# interleave machines, so that participants get spread over all of them.
+			for i in range(max([len(r) for r in runners] + [0])):
+				for r in runners:
+					if i < len(r):
+						workers.append((engine, work(r[i], queues[engine])))
+
+		report("master", "scheduling %d participants on %d machines (%d runners)." % (
+			len(commands), len([c for c in capacities if sum(c) > 0]), len(workers)))
+
+		await asyncio.gather(*[worker for _, worker in workers])
+
+		for queue in queues.values():
+			while not queue.empty():
+				# all machines went away.
+				item = queue.get_nowait()
+				if item is None:
+					continue
+				i, command, origin = item
+				results[i] = Result.from_error(
+					Origin.recorded, ErrorDomain.interaction, "no machine left to run %s." % origin)
+
+		return results
+
+	def take_exams(
+		self, commands, origins, machines, batch_id, report, events,
+		max_per_machine=0, on_dispatch=None, is_available=None):
+
+		# may be called from any thread. returns a concurrent.futures.Future with the
+		# results in the order of commands. cancelling it aborts the exams on all machines.
+		return asyncio.run_coroutine_threadsafe(
+			self._take_exams(
+				commands, origins, machines, batch_id, report, events,
+				max_per_machine, on_dispatch, is_available),
+			self.ioloop.asyncio_loop)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+import time
+import random
+import threading
+
+from tiltr.data.metrics import get_recorded_timings, get_recorded_histograms
+
+
+class ResponseTimes:
+	# exponentially weighted moving average of how long ILIAS takes to answer
+	# (i.e. page loads). retry delays scale with it.
+
+	def __init__(self, alpha=0.2, initial=1.0):
+		self.alpha = alpha
+		self._mean = initial
+		self._mutex = threading.Lock()
+
+	def observe(self, dt):
+		with self._mutex:
+			self._mean += self.alpha * (dt - self._mean)
+
+	@property
+	def mean(self):
+		with self._mutex:
+			return self._mean
+
+
+response_times = ResponseTimes()
+
+
+class RetryPolicy:
+	# exponential backoff based on the observed response times, with jitter so that many machines
+	# retrying at the same time don't stay in sync. iterating gives the attempt numbers and sleeps
+	# in between. the number of retries (0 if the first attempt did it) ends up in the recorded
+	# histograms as "retry <operation>" (see metrics.record_metrics), as does the time slept
+	# between retries in the recorded timings. operation should therefore be a stable name
+	# (e.g. "find"), not something like a selector.
+
+	def __init__(self, operation, n_tries=5, min_delay=0.1, max_delay=8.0):
+		self.operation = operation
+		self.n_tries = n_tries
+		self.min_delay = min_delay
+		self.max_delay = max_delay
+		self._random = random.Random()
+		self._skip_delay = False
+
+	def retry_now(self):
+		# the next attempt needs no delay, e.g. since we just reloaded the page.
+		self._skip_delay = True
+
+	def delay(self, attempt):
+		base = max(self.min_delay, response_times.mean) * (2 ** attempt)
+		return min(self.max_delay, base) * self._random.uniform(0.5, 1.0)
+
+	def __iter__(self):
+		slept = 0.0
+		retries = 0
+		try:
+			for attempt in range(self.n_tries):
+				if attempt > 0:
+					if not self._skip_delay:
+						dt = self.delay(attempt - 1)
+						time.sleep(dt)
+						slept += dt
+					self._skip_delay = False
+					retries = attempt
+				yield attempt
+		finally:
+			histograms = get_recorded_histograms()
+			if histograms is not None:
+				histograms.add("retry %s" % self.operation, retries)
+			timings = get_recorded_timings()
+			if timings is not None and retries > 0:
+				timings.add("retry %s" % self.operation, slept)
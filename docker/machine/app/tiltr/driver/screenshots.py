@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+import io
+import time
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from tiltr.data.metrics import get_recorded_timings
+
+
+# a UI client counts as watching for this many seconds after it last asked for a screenshot.
+watch_time = 15
+
+
+def encode_screenshot(png, max_width=0, jpeg_quality=0):
+	# downscales png to max_width (if > 0) and encodes it as JPEG (if jpeg_quality > 0).
+	if max_width <= 0 and jpeg_quality <= 0:
+		return png
+
+	image = Image.open(io.BytesIO(png))
+	if 0 < max_width < image.width:
+		image = image.resize(
+			(max_width, max(1, image.height * max_width // image.width)), Image.BILINEAR)
+
+	out = io.BytesIO()
+	if jpeg_quality > 0:
+		image.convert("RGB").save(out, "JPEG", quality=jpeg_quality)
+	else:
+		image.save(out, "PNG")
+	return out.getvalue()
+
+
+def screenshot_data_uri(data):
+	# data is PNG or JPEG, as produced by encode_screenshot.
+	mime = "image/jpeg" if data[:2] == b"\xff\xd8" else "image/png"
+	return "data:%s;base64,%s" % (mime, base64.b64encode(data).decode("ascii"))
+
+
+class Screenshots:
+	# takes screenshots of a selenium driver, but only while someone is watching (see watch)
+	# and not more often than every min_interval seconds. taking the screenshot is a WebDriver
+	# command and happens on the calling thread; downscaling and encoding happens on a
+	# background thread, which passes the result to publish(data). times end up in the
+	# recorded timings as "screenshot capture" and "screenshot encode".
+
+	def __init__(self, publish, min_interval, max_width=0, jpeg_quality=0, is_watched=None):
+		self.publish = publish
+		self.min_interval = min_interval
+		self.max_width = max_width
+		self.jpeg_quality = jpeg_quality
+		self._is_watched = is_watched
+		self._watched_until = 0.0
+		self._next_time = 0.0
+		self._key = None
+		self._executor = ThreadPoolExecutor(max_workers=1)
+		self._pending = None
+		self._closed = False
+		self._mutex = threading.Lock()
+
+	def watch(self):
+		self._watched_until = time.time() + watch_time
+
+	@property
+	def watched(self):
+		if self._is_watched is not None:
+			return self._is_watched()
+		return time.time() < self._watched_until
+
+	def capture(self, driver, get_key=None):
+		# get_key() identifies what is shown, e.g. the url. an unchanged key needs no new
+		# screenshot. it is only called if a screenshot is due, as it might cost a WebDriver
+		# roundtrip.
+		now = time.time()
+		if now < self._next_time or not self.watched:
+			return False
+
+		with self._mutex:
+			if self._closed:
+				return False  # e.g. a background session that outlives its batch.
+			if self._pending is not None and not self._pending.done():
+				return False  # still encoding the last one.
+
+		key = get_key() if get_key is not None else None
+		if key is not None and key == self._key:
+			return False
+
+		t0 = time.time()
+		png = driver.get_screenshot_as_png()
+		timings = get_recorded_timings()
+		if timings is not None:
+			timings.add("screenshot capture", time.time() - t0)
+
+		self._key = key
+		self._next_time = now + self.min_interval
+
+		with self._mutex:
+			if self._closed:
+				return False  # e.g. a background session that outlives its batch.
+			self._pending = self._executor.submit(self._encode, png, timings)
+		return True
+
+	def _encode(self, png, timings):
+		t0 = time.time()
+		data = encode_screenshot(png, self.max_width, self.jpeg_quality)
+		if timings is not None:
+			timings.add("screenshot encode", time.time() - t0)
+		self.publish(data)
+
+	def close(self):
+		# waits for a pending screenshot to be published.
+		with self._mutex:
+			self._closed = True
+		self._executor.shutdown(wait=True)
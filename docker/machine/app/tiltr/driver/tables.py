@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+import re
+from html.parser import HTMLParser
+from collections import namedtuple
+
+
+# parses the tables of ILIAS list views (statistics, participants, users) from the page
+# source, so that reading a large table costs one WebDriver command instead of several
+# per cell.
+
+
+Cell = namedtuple('Cell', ['text', 'links', 'labels', 'inputs'])  # links are (href, text) pairs
+Row = namedtuple('Row', ['cells'])
+Table = namedtuple('Table', ['id', 'header', 'rows'])  # header is a list of Cells
+
+
+def _normalize(text):
+	return re.sub(r"\s+", " ", text).strip()
+
+
+class _Builder:
+	def __init__(self):
+		self.text = []
+		self.links = []
+		self.labels = []
+		self.inputs = []
+
+	def build(self):
+		return Cell(
+			text=_normalize("".join(self.text)),
+			links=[(href, _normalize("".join(text))) for href, text in self.links],
+			labels=[_normalize("".join(text)) for text in self.labels],
+			inputs=self.inputs)
+
+
+class _TableParser(HTMLParser):
+	def __init__(self):
+		super().__init__(convert_charrefs=True)
+		self.tables = []
+		self._stack = []  # open tables as [table, section, row, cell builder, link, label]
+		self._skip = 0  # inside script or style
+
+	def handle_starttag(self, tag, attrs):
+		attrs = dict(attrs)
+
+		if tag in ("script", "style"):
+			self._skip += 1
+			return
+
+		if tag == "table":
+			self._stack.append([Table(attrs.get("id"), [], []), None, None, None, None, None])
+			return
+
+		if not self._stack:
+			return
+		top = self._stack[-1]
+
+		if tag in ("thead", "tbody", "tfoot"):
+			self._end_row(top)
+			top[1] = tag
+		elif tag == "tr":
+			self._end_row(top)
+			top[2] = []
+		elif tag in ("td", "th"):
+			self._end_cell(top)
+			if top[2] is None:
+				top[2] = []
+			top[3] = _Builder()
+		elif top[3] is not None:
+			cell = top[3]
+			if tag == "a":
+				top[4] = (attrs.get("href"), [])
+				cell.links.append(top[4])
+			elif tag == "label":
+				top[5] = []
+				cell.labels.append(top[5])
+			elif tag in ("input", "select", "textarea", "button"):
+				cell.inputs.append(attrs)
+			elif tag == "br":
+				self.handle_data(" ")
+
+	def handle_endtag(self, tag):
+		if tag in ("script", "style"):
+			self._skip = max(0, self._skip - 1)
+			return
+
+		if not self._stack:
+			return
+		top = self._stack[-1]
+
+		if tag == "table":
+			self._end_row(top)
+			self.tables.append(top[0])
+			self._stack.pop()
+		elif tag == "tr":
+			self._end_row(top)
+		elif tag in ("td", "th"):
+			self._end_cell(top)
+		elif tag == "a":
+			top[4] = None
+		elif tag == "label":
+			top[5] = None
+
+	def handle_data(self, data):
+		if not self._stack or self._skip:
+			return
+		top = self._stack[-1]
+		if top[3] is not None:
+			top[3].text.append(data)
+			if top[4] is not None:
+				top[4][1].append(data)
+			if top[5] is not None:
+				top[5].append(data)
+
+	def _end_cell(self, top):
+		if top[3] is not None:
+			top[2].append(top[3].build())
+			top[3] = None
+			top[4] = None
+			top[5] = None
+
+	def _end_row(self, top):
+		self._end_cell(top)
+		if top[2] is not None:
+			table = top[0]
+			if top[1] == "thead":
+				table.header.extend(top[2])
+			else:
+				table.rows.append(Row(top[2]))
+			top[2] = None
+
+
+def parse_tables(html):
+	# returns all tables in html, nested tables before the tables that contain them.
+	parser = _TableParser()
+	parser.feed(html)
+	parser.close()
+	return parser.tables
+
+
+def parse_table(html, table_id):
+	# returns the table with the given id or None.
+	for table in parse_tables(html):
+		if table.id == table_id:
+			return table
+	return None
+
+
+_void_tags = set(["area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "wbr"])
+
+# tags whose end tag html allows to omit: starting one of the keys implicitly closes an open
+# element of the given tags, unless one of the scoping tags is nearer on the stack.
+_implicitly_closed = {
+	"li": (("li",), ("ul", "ol")),
+	"dt": (("dt", "dd"), ("dl",)),
+	"dd": (("dt", "dd"), ("dl",)),
+	"option": (("option",), ("select", "datalist")),
+	"optgroup": (("option", "optgroup"), ("select",)),
+	"tr": (("tr", "td", "th"), ("table",)),
+	"td": (("td", "th"), ("tr", "table")),
+	"th": (("td", "th"), ("tr", "table")),
+	"thead": (("thead", "tbody", "tfoot", "tr", "td", "th"), ("table",)),
+	"tbody": (("thead", "tbody", "tfoot", "tr", "td", "th"), ("table",)),
+	"tfoot": (("thead", "tbody", "tfoot", "tr", "td", "th"), ("table",)),
+}
+
+# block elements that implicitly close an open <p>.
+_closes_p = set([
+	"address", "article", "aside", "blockquote", "details", "div", "dl", "fieldset", "figcaption",
+	"figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "main", "menu",
+	"nav", "ol", "p", "pre", "section", "table", "ul"])
+
+
+class _ElementParser(HTMLParser):
+	def __init__(self, class_name):
+		super().__init__(convert_charrefs=True)
+		self.class_name = class_name
+		self.elements = []
+		self._stack = []  # open elements as (tag, builder), builder is None unless it has class_name
+		self._link = None
+		self._skip = 0
+
+	def handle_starttag(self, tag, attrs):
+		attrs = dict(attrs)
+
+		if tag in ("script", "style"):
+			self._skip += 1
+			return
+
+		self._close_implicitly(tag)
+
+		builders = self._builders()
+		if builders:
+			builder = builders[-1]
+			if tag == "a":
+				self._link = (attrs.get("href"), [])
+				builder.links.append(self._link)
+			elif tag in ("input", "select", "textarea", "button"):
+				builder.inputs.append(attrs)
+
+		if tag in _void_tags:
+			return
+
+		if self.class_name in (attrs.get("class") or "").split():
+			self._stack.append((tag, _Builder()))
+		else:
+			self._stack.append((tag, None))
+
+	def handle_startendtag(self, tag, attrs):
+		self.handle_starttag(tag, attrs)
+		if tag not in _void_tags:
+			self.handle_endtag(tag)
+
+	def handle_endtag(self, tag):
+		if tag in ("script", "style"):
+			self._skip = max(0, self._skip - 1)
+			return
+
+		if tag in _void_tags:
+			return
+
+		if tag == "a":
+			self._link = None
+
+		# an end tag closes the nearest open element of that tag and everything opened after
+		# it. stray end tags without an open element are ignored, as browsers do.
+		for i in range(len(self._stack) - 1, -1, -1):
+			if self._stack[i][0] == tag:
+				self._close(i)
+				break
+
+	def handle_data(self, data):
+		if self._skip:
+			return
+		for builder in self._builders():
+			builder.text.append(data)
+		if self._link is not None:
+			self._link[1].append(data)
+
+	def close(self):
+		super().close()
+		self._close(0)
+
+	def _builders(self):
+		return [builder for _, builder in self._stack if builder is not None]
+
+	def _close(self, i):
+		while len(self._stack) > i:
+			tag, builder = self._stack.pop()
+			if tag == "a":
+				self._link = None
+			if builder is not None:
+				self.elements.append(builder.build())
+
+	def _close_implicitly(self, tag):
+		if tag in _closes_p:
+			self._close_open(("p",), ("button", "table", "td", "th"))
+		if tag in _implicitly_closed:
+			self._close_open(*_implicitly_closed[tag])
+
+	def _close_open(self, tags, scope):
+		for i in range(len(self._stack) - 1, -1, -1):
+			open_tag = self._stack[i][0]
+			if open_tag in tags:
+				self._close(i)
+				return
+			if open_tag in scope:
+				return
+
+
+def parse_elements(html, class_name):
+	# returns a Cell (text, links, labels, inputs) for each element of the given css class.
+	parser = _ElementParser(class_name)
+	parser.feed(html)
+	parser.close()
+	return parser.elements
@@ -6,7 +6,10 @@
 #
 
 from urllib.parse import urlparse, parse_qs
+import os
+import sys
 import time
+import uuid
 import itertools
 import http
 import urllib3
@@ -21,6 +24,9 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.remote.command import Command
 
 from tiltr.data.exceptions import *
+from tiltr.data.metrics import get_recorded_timings
+
+from .retry import RetryPolicy, response_times
 
 
 @contextmanager
@@ -33,36 +39,85 @@ def run_interaction():
 
 
 def interact(driver, action, refresh=False):
-	n_retries = 5
-	while True:
+	retry = RetryPolicy("interact", n_tries=6)
+	for attempt in retry:
 		try:
 			return action()
 		except (WebDriverException, SessionNotCreatedException):
-			if n_retries < 1:
+			if attempt >= retry.n_tries - 1:
 				raise
-			n_retries -= 1
 			if refresh:
 				with wait_for_page_load(driver):
 					driver.refresh()
+			# like before, retry at once; a flaky click shouldn't wait for a backoff.
+			retry.retry_now()
 
 
 def is_loaded(driver):
 	return driver.execute_script("return document.readyState") == "complete"
 
 
-@contextmanager
-def wait_for_page_load(driver, timeout=30):
-	for i in range(5):
-		try:
-			old_page = driver.find_element_by_tag_name('html')
-			break
-		except SessionNotCreatedException:
-			time.sleep(1)
-		except NoSuchElementException:
-			time.sleep(1)
+def _call_site():
+	# name of the code that called wait_for_page_load, e.g. "drivers.py:goto_scoring_adjustment".
+	frame = sys._getframe(1)
+	while frame and frame.f_globals.get('__name__') in (__name__, 'contextlib'):
+		frame = frame.f_back
+	if frame is None:
+		return "unknown"
+	return "%s:%s" % (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+
+
+def _mark_page(driver):
+	# tags the current document, so that we can recognize a new one later.
+	token = uuid.uuid4().hex
+	driver.execute_script("window.__tiltr_page = arguments[0];", token)
+	return token
 
-	yield
 
+def _is_unload_error(e):
+	# whether e says that a script got interrupted by the page navigating away, e.g.
+	# "Document was unloaded" (Firefox) or "document unloaded while waiting for result" (Chrome).
+	message = (e.msg or "").lower()
+	return "unload" in message or "navigat" in message
+
+
+def _wait_for_new_page(driver, token, timeout):
+	# waits inside the browser until a new, fully loaded document has replaced the marked one. this
+	# needs one WebDriver roundtrip instead of polling over WebDriver every 500 ms. the script
+	# keeps its own deadline, so the driver's script timeout (see pandora.script_timeout) stays.
+	t1 = time.time() + timeout
+	while True:
+		try:
+			loaded = driver.execute_async_script("""
+				var token = arguments[0];
+				var deadline = Date.now() + arguments[1] * 1000;
+				var done = arguments[arguments.length - 1];
+				(function check() {
+					if (window.__tiltr_page !== token && document.readyState === "complete") {
+						done(true);
+					} else if (Date.now() > deadline) {
+						done(false);
+					} else {
+						setTimeout(check, 25);
+					}
+				}());
+				""", token, max(0, t1 - time.time()))
+			if not loaded:
+				raise TimeoutException("page did not load")
+			return
+		except TimeoutException:
+			raise
+		except WebDriverException as e:
+			if not _is_unload_error(e):
+				raise  # e.g. a dead session, which retrying won't fix.
+			# the old document got unloaded while our script was running in it. try again
+			# in the new one.
+			if time.time() > t1:
+				raise TimeoutException("page did not load")
+			time.sleep(0.05)
+
+
+def _wait_for_stale_page(driver, old_page, timeout):
 	try:
 		WebDriverWait(driver, timeout).until(staleness_of(old_page))
 
@@ -92,6 +147,42 @@ def wait_for_page_load(driver, timeout=30):
 		time.sleep(3)
 
 
+@contextmanager
+def wait_for_page_load(driver, timeout=30):
+	call_site = _call_site()
+
+	token = None
+	old_page = None
+
+	try:
+		token = _mark_page(driver)
+	except WebDriverException:
+		# no scriptable page. fall back to watching the old html element.
+		for i in range(5):
+			try:
+				old_page = driver.find_element_by_tag_name('html')
+				break
+			except SessionNotCreatedException:
+				time.sleep(1)
+			except NoSuchElementException:
+				time.sleep(1)
+
+	yield
+
+	t0 = time.time()
+	try:
+		if token is not None:
+			_wait_for_new_page(driver, token, timeout)
+		else:
+			_wait_for_stale_page(driver, old_page, timeout)
+	finally:
+		dt = time.time() - t0
+		response_times.observe(dt)
+		timings = get_recorded_timings()
+		if timings is not None:
+			timings.add("page load " + call_site, dt)
+
+
 def wait_for_css(driver, css, timeout=30):
 	interact(driver, lambda: WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.CSS_SELECTOR, css))))
 
@@ -188,18 +279,18 @@ def create_detailed_exception(driver):
 def try_submit(driver, css, f, allow_reload=True, allow_empty=True, n_tries=7, max_sleep_time=8):
 	button = None
 
-	for i in range(n_tries):
+	retry = RetryPolicy("find", n_tries, max_delay=max_sleep_time)
+	for i in retry:
 		try:
 			button = driver.find_element_by_css_selector(css)
 			break
 		except (TimeoutException, ElementClickInterceptedException, ElementNotInteractableException):
-			time.sleep(min(max_sleep_time, 2 ** i))
+			pass
 		except NoSuchElementException:
 			if allow_reload:
 				with wait_for_page_load(driver):
 					driver.refresh()
-			else:
-				time.sleep(min(max_sleep_time, 2 ** i))
+				retry.retry_now()
 
 	if not button:
 		if allow_empty:
@@ -209,7 +300,7 @@ def try_submit(driver, css, f, allow_reload=True, allow_empty=True, n_tries=7, m
 	old_url = None
 	unknown_url = "[unknown url]"
 
-	for i in range(n_tries):
+	for i in RetryPolicy("submit", n_tries, max_delay=max_sleep_time):
 		try:
 			url = driver.current_url
 		except:
@@ -230,7 +321,6 @@ def try_submit(driver, css, f, allow_reload=True, allow_empty=True, n_tries=7, m
 		except (TimeoutException, ElementClickInterceptedException, ElementNotInteractableException) as e:
 			if i >= n_tries - 1:
 				raise create_detailed_exception(driver) from e
-			time.sleep(min(max_sleep_time, 2 ** i))
 		except NoSuchElementException:
 			# we've seen css before, and now it's gone. usually this means that
 			# we succeeded.
@@ -15,4 +15,12 @@ def parse_args():
 	parser.add_argument('--tiltr-port')
 	parser.add_argument('--ext-ilias-port', nargs='?')
 
+	parser.add_argument('--machine-hostname', default='machine')  # docker DNS name of the machine service
+	parser.add_argument('--machine-runners', type=int, default=1)
+	parser.add_argument('--machine-http-runners', type=int, default=200)  # concurrent http participants
+	parser.add_argument('--machine-worker-jobs', type=int, default=10)  # recycle workers after this many exams
+	parser.add_argument('--compress-frames', action='store_true')  # compress large worker messages
+	parser.add_argument('--machine-log-size', type=int, default=1000)  # runner messages held in memory
+	parser.add_argument('--browser-max-uses', type=int, default=20)  # 0 disables browser pooling
+
 	return parser.parse_args()
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 #
-# Copyright (c) 2018-2019-2019 Rechenzentrum, Universitaet Regensburg
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
 # GPLv3, see LICENSE
 #
 
@@ -10,7 +10,21 @@ import os
 import requests
 import time
 import json
+import socket
+import asyncio
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.ioloop
+from tornado.httpclient import AsyncHTTPClient
+
+
+# seconds between two heartbeats.
+heartbeat_interval = 10
+
+# number of failed heartbeats after which a machine gets evicted.
+max_heartbeat_failures = 3
 
 
 def verify_hello(machine):
@@ -26,8 +40,10 @@ def verify_hello(machine):
 	return False
 
 
+machines_path = os.path.realpath(os.path.join("/tiltr/tmp", "machines.json"))
+
+
 def detect_machines(max_wait_time=30):
-	machines_path = os.path.realpath(os.path.join("/tiltr/tmp", "machines.json"))
 	t0 = time.time()
 	while not os.path.isfile(machines_path):
 		if time.time() - t0 > max_wait_time:
@@ -38,8 +54,145 @@ def detect_machines(max_wait_time=30):
 	return machines
 
 
+def _read_machines_json():
+	try:
+		with open(machines_path, "r") as f:
+			return json.loads(f.read())
+	except (IOError, ValueError):
+		return dict()
+
+
+class Membership:
+	# the live table of responsive machines. a periodic heartbeat evicts machines that stopped
+	# answering and adds new ones, e.g. after "docker-compose --scale", which are found through
+	# machines.json or through the docker DNS name of the machine service. it can be used like
+	# a dict from machine names to ips.
+
+	def __init__(self, machines, hostname=None):
+		self._mutex = threading.Lock()
+		self._members = dict(machines)  # name -> ip
+		self._names = dict((ip, name) for name, ip in machines.items())  # ip -> name, for all ever seen
+		self._failures = dict()
+		self._hostname = hostname
+		self._client = None
+		self._busy = False
+		self._heartbeat = None
+
+	def _snapshot(self):
+		with self._mutex:
+			return dict(self._members)
+
+	def items(self):
+		return self._snapshot().items()
+
+	def keys(self):
+		return self._snapshot().keys()
+
+	def values(self):
+		return self._snapshot().values()
+
+	def get(self, name, default=None):
+		return self._snapshot().get(name, default)
+
+	def __getitem__(self, name):
+		return self._snapshot()[name]
+
+	def __contains__(self, name):
+		return name in self._snapshot()
+
+	def __iter__(self):
+		return iter(self._snapshot())
+
+	def __len__(self):
+		with self._mutex:
+			return len(self._members)
+
+	def is_member(self, ip):
+		return ip in self.values()
+
+	def _name_for(self, ip):
+		# caller holds the mutex.
+		if ip not in self._names:
+			used = set(self._names.values())
+			i = 1
+			while ("machine_%d" % i) in used:
+				i += 1
+			self._names[ip] = "machine_%d" % i
+		return self._names[ip]
+
+	def _update(self, ip, alive):
+		with self._mutex:
+			name = self._name_for(ip)
+			if alive:
+				self._failures[ip] = 0
+				if name not in self._members:
+					self._members[name] = ip
+					print("machine %s (%s) joined." % (name, ip))
+			else:
+				self._failures[ip] = self._failures.get(ip, 0) + 1
+				if name in self._members and self._failures[ip] >= max_heartbeat_failures:
+					del self._members[name]
+					print("machine %s (%s) was evicted." % (name, ip))
+
+	def _resolve(self):
+		try:
+			infos = socket.getaddrinfo(self._hostname, 8888, socket.AF_INET, socket.SOCK_STREAM)
+			return set(info[4][0] for info in infos)
+		except socket.gaierror:
+			return set()
+
+	async def _find_candidates(self):
+		with self._mutex:
+			candidates = set(self._names.keys())
+
+		candidates.update(_read_machines_json().values())
+
+		if self._hostname:
+			candidates.update(await tornado.ioloop.IOLoop.current().run_in_executor(None, self._resolve))
+
+		return sorted(candidates)
+
+	async def _hello(self, ip):
+		try:
+			r = await self._client.fetch(
+				"http://%s:8888/hello/" % ip, method="POST", body="",
+				request_timeout=5, raise_error=False)
+			return r.code == 200 and r.body == b"HelloToo"
+		except:
+			return False
+
+	async def heartbeat(self):
+		if self._busy:
+			return  # last heartbeat still running.
+		self._busy = True
+		try:
+			if self._client is None:
+				self._client = AsyncHTTPClient(force_instance=True)
+
+			candidates = await self._find_candidates()
+			alive = await asyncio.gather(*[self._hello(ip) for ip in candidates])
+			for ip, is_alive in zip(candidates, alive):
+				self._update(ip, is_alive)
+		except:
+			traceback.print_exc()
+		finally:
+			self._busy = False
+
+	def start_heartbeat(self):
+		if self._heartbeat is None:
+			self._heartbeat = tornado.ioloop.PeriodicCallback(
+				self.heartbeat, heartbeat_interval * 1000)
+			self._heartbeat.start()
+
+	def stop_heartbeat(self):
+		if self._heartbeat is not None:
+			self._heartbeat.stop()
+			self._heartbeat = None
+
+
 class Machines:
-	def __init__(self):
+	def __init__(self, hostname="machine"):
+		self.hostname = hostname
 		self.process = None
 		self.parallel = False
 
@@ -62,11 +215,14 @@ class Machines:
 
 		print("waiting for machines to start up.")
 
+		responsive = dict()
 		try:
-			responsive = dict()
-			for name, ip in machines.items():
-				if verify_hello(ip):
-					responsive[name] = ip
+			if machines:
+				with ThreadPoolExecutor(len(machines)) as executor:
+					names = list(machines.keys())
+					for name, ok in zip(names, executor.map(verify_hello, (machines[n] for n in names))):
+						if ok:
+							responsive[name] = machines[name]
 		except:
 			traceback.print_exc()
 
@@ -75,7 +231,8 @@ class Machines:
 
 		print("%d machines are up and running." % len(responsive))
 
-		return responsive
+		# in parallel mode, machines can come and go later on.
+		return Membership(responsive, hostname=self.hostname if self.parallel else None)
 
 	def __exit__(self, *args):
 		if not self.parallel:
@@ -83,5 +240,5 @@ class Machines:
 				self.process.terminate()
 
 
-def connect_machines():
-	return Machines()
\ No newline at end of file
+def connect_machines(hostname="machine"):
+	return Machines(hostname)
\ No newline at end of file
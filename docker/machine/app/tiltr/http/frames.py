@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+import struct
+import time
+import zlib
+from enum import IntEnum
+
+# binary frames for messages from machine workers to the machine process. each frame
+# is a fixed header (type, flags, creation time, payload length) followed by the raw
+# payload, i.e. screenshots and result files travel as raw bytes and need neither base64
+# nor JSON.
+
+
+class FrameType(IntEnum):
+	ECHO = 1
+	SCREENSHOT = 2
+	DONE = 3
+	ERROR = 4
+	FILE = 5  # one file of the result, sent before DONE
+
+
+FLAG_COMPRESSED = 1
+
+_header = struct.Struct('!BBdI')
+
+# payloads larger than this get compressed, if compression is requested.
+compress_threshold = 16 * 1024
+
+
+def pack_frame(frame_type, payload, compress=False, sent_time=None):
+	if isinstance(payload, str):
+		payload = payload.encode('utf8')
+
+	flags = 0
+	if compress and len(payload) > compress_threshold:
+		payload = zlib.compress(payload, 1)
+		flags |= FLAG_COMPRESSED
+
+	return _header.pack(
+		int(frame_type), flags, time.time() if sent_time is None else sent_time, len(payload)) + payload
+
+
+def pack_file(name, data):
+	# payload of a FILE frame.
+	return name.encode('utf8') + b'\0' + data
+
+
+def unpack_file(payload):
+	name, data = payload.split(b'\0', 1)
+	return name.decode('utf8'), data
+
+
+def unpack_frame(data):
+	frame_type, flags, sent_time, length = _header.unpack_from(data)
+	payload = data[_header.size:_header.size + length]
+
+	if len(payload) != length:
+		raise ValueError("truncated frame")
+
+	if flags & FLAG_COMPRESSED:
+		payload = zlib.decompress(payload)
+
+	return FrameType(frame_type), payload, sent_time
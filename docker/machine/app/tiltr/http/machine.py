@@ -10,9 +10,15 @@ import traceback
 import sys
 import json
 import time
+import base64
 import os
+import signal
+import datetime
+import multiprocessing
 
 import tornado.ioloop
+import tornado.iostream
+import tornado.locks
 import tornado.web
 
 import pandora
@@ -22,108 +28,389 @@ from tiltr.data.exceptions import InteractionException
 from tiltr.data.result import Result, Origin
 
 from ..driver.commands import TakeExamCommand
+from ..driver.screenshots import Screenshots, screenshot_data_uri, watch_time
 from .utils import clear_tmp
+from .frames import FrameType, pack_frame, unpack_frame, pack_file, unpack_file
+from .messages import MessageLog
 from .args import parse_args
 
 
+# number of seconds after which an idle event stream is closed. clients reconnect
+# with their current index then, so this is only a safety net against stale
+# connections and not a polling interval.
+stream_timeout = 30
+
+
+def _run_job(conn, command, browser_pool, compress, watched_until):
+	write_mutex = threading.Lock()  # screenshots get written from their encoding thread
+
+	def write(frame_type, payload):
+		# every frame carries the time it was created, so that the master
+		# can measure the end-to-end lag of events.
+		frame = pack_frame(frame_type, payload, compress)
+		with write_mutex:
+			conn.send_bytes(frame)
+
+	screenshots = Screenshots(
+		lambda data: write(FrameType.SCREENSHOT, data),
+		float(command.settings.screenshot_refresh_time),
+		int(command.settings.screenshot_max_width),
+		int(command.settings.screenshot_jpeg_quality),
+		is_watched=lambda: time.time() < watched_until.value)
+
+	try:
+		try:
+			browser_args = dict(
+				browser=command.settings.browser,
+				pool=browser_pool,
+				wait_time=command.wait_time,
+				resolution=command.settings.resolution)
+
+			with pandora.Browser(**browser_args) as browser:
+				def report(*args):
+					try:
+						screenshots.capture(browser.driver)
+					except:
+						pass  # screenshot failed
+
+					write(FrameType.ECHO, " ".join("%s" % arg for arg in args))
+
+				report("machine browser has wait time %d." % command.wait_time)
+				report('running on user agent', browser.driver.execute_script('return navigator.userAgent'))
+
+				expected_result = command.run(browser, report)
+		except WebDriverException as webdriver_error:
+			# we end up here in case our browser / selenium does not start and fails to close down.
+			e = InteractionException(str(webdriver_error))
+			traceback.print_exc()
+			expected_result = Result.from_error(Origin.recorded, e.get_error_domain(), traceback.format_exc())
+		finally:
+			screenshots.close()  # no screenshot frames after the result.
+
+		if expected_result is None:
+			write(FrameType.ERROR, "no result obtained")
+		else:
+			# files go as raw bytes in frames of their own, the result itself without them.
+			for name, data in expected_result.files.items():
+				write(FrameType.FILE, pack_file(name, data))
+			write(FrameType.DONE, expected_result.to_json(with_files=False))
+	except SystemExit:
+		# SIGTERM from Runner.abort: tell the runner, then let the worker wind down.
+		try:
+			write(FrameType.ERROR, "job aborted.")
+		except:
+			pass  # runner is gone already
+		raise
+	except Exception:
+		traceback.print_exc()
+		write(FrameType.ERROR, traceback.format_exc())
+
+
+def _worker_main(conn, watched_until, max_jobs, browser_max_uses, compress):
+	# runs inside a pre-forked worker process and takes exam jobs from the machine process. the
+	# worker keeps its browser session warm between jobs.
+
+	aborted = False
+
+	def abort(signum, frame):
+		# unwind normally so that the browser session gets closed.
+		nonlocal aborted
+		aborted = True
+		sys.exit(1)
+
+	signal.signal(signal.SIGTERM, abort)
+
+	browser_pool = pandora.BrowserPool(max_uses=browser_max_uses, max_idle=1) if browser_max_uses > 0 else None
+
+	try:
+		for _ in range(max_jobs):
+			command_json = conn.recv()
+			if command_json is None:
+				break
+			_run_job(conn, TakeExamCommand(from_json=command_json), browser_pool, compress, watched_until)
+			if aborted:
+				break
+	except (EOFError, SystemExit):
+		pass
+	finally:
+		if browser_pool:
+			browser_pool.clear()
+
+
+class Worker:
+	def __init__(self, context, max_jobs, browser_max_uses, compress):
+		self.conn, child_conn = context.Pipe()
+		self.watched_until = context.Value('d', 0.0, lock=False)  # see Runner.watch
+		self.process = context.Process(
+			target=_worker_main, args=(child_conn, self.watched_until, max_jobs, browser_max_uses, compress), daemon=True)
+		self.process.start()
+		child_conn.close()
+		self.jobs = 0
+
+	@property
+	def pid(self):
+		return self.process.pid
+
+	def is_alive(self):
+		return self.process.is_alive()
+
+	def stop(self):
+		try:
+			self.conn.send(None)
+		except:
+			pass  # worker is gone already
+		self.process.join(10)
+		if self.process.is_alive():
+			self.process.terminate()
+			self.process.join()
+		self.conn.close()
+
+
+class WorkerPool:
+	# long lived worker processes that run exams. this still isolates selenium from our main process
+	# (chrome zombie processes used to pile up in the selenium containers without it), but
+	# we don't pay the process startup for each exam. workers get replaced after max_jobs
+	# jobs or if they crash.
+
+	def __init__(self, size, max_jobs=10, browser_max_uses=20, compress=False):
+		self.size = max(1, size)
+		self.max_jobs = max(1, max_jobs)
+		self.browser_max_uses = browser_max_uses
+		self.compress = compress
+
+		# workers are forked from a clean server process that has our modules preloaded, not from
+		# our multithreaded tornado process.
+		self._context = multiprocessing.get_context('forkserver')
+		self._context.set_forkserver_preload(['tiltr.http.machine'])
+
+		self._mutex = threading.Lock()
+		self._idle = []
+
+	def _spawn(self):
+		return Worker(self._context, self.max_jobs, self.browser_max_uses, self.compress)
+
+	def start(self):
+		workers = [self._spawn() for _ in range(self.size)]
+		with self._mutex:
+			self._idle.extend(workers)
+
+	def acquire(self):
+		with self._mutex:
+			while self._idle:
+				worker = self._idle.pop()
+				if worker.is_alive():
+					return worker
+		return self._spawn()
+
+	def release(self, worker, reuse=True):
+		worker.jobs += 1
+
+		if reuse and worker.jobs < self.max_jobs and worker.is_alive():
+			with self._mutex:
+				self._idle.append(worker)
+			return
+
+		worker.stop()
+
+		# keep the pool warm.
+		with self._mutex:
+			n_idle = len(self._idle)
+		if n_idle < self.size:
+			replacement = self._spawn()
+			with self._mutex:
+				self._idle.append(replacement)
+
+
 class GlobalState:
-	def __init__(self):
-		self.runner = None
+	def __init__(self, workers, max_runners=1, max_http_runners=200, log_size=1000):
+		self.workers = workers
+		self.runners = dict()  # (batch, index) -> Runner
+		self.max_runners = max(1, max_runners)  # browser participants
+		self.max_http_runners = max(0, max_http_runners)  # http participants, see HttpRunner
+		self.log_size = log_size
+
+	def get_runner(self, batch, index):
+		return self.runners.get((batch, int(index)))
+
+	def get_active_runners(self, engine=None):
+		return [runner for runner in self.runners.values()
+			if runner.is_alive() and (engine is None or runner.command.engine == engine)]
+
+	def start_runner(self, batch, index, command):
+		index = int(index)
+		runner = self.runners.get((batch, index))
+		if runner and runner.is_alive():
+			return True  # already running
+
+		# forget runners that are done and belong to older batches. runners of the current
+		# batch are kept, since the master might still need to stream their results.
+		for key, runner in list(self.runners.items()):
+			if key[0] != batch and not runner.is_alive():
+				runner.close()
+				del self.runners[key]
+
+		if command.engine == "http":
+			runner_class, max_runners = HttpRunner, self.max_http_runners
+		else:
+			runner_class, max_runners = Runner, self.max_runners
+
+		if len(self.get_active_runners(command.engine)) >= max_runners:
+			return False
+
+		if not self.get_active_runners():
+			clear_tmp()
+
+		runner = runner_class(self, batch, index, command)
+		self.runners[(batch, index)] = runner
+		runner.start()
+		return True
 
 
 class Runner(threading.Thread):
-	def __init__(self, state, batch, command):
+	def __init__(self, state, batch, index, command):
 		threading.Thread.__init__(self)
-		clear_tmp()
 
 		self.state = state
-		self.wait_time = command.wait_time
 		self.batch = batch
+		self.index = index
 		self.command = command
 
-		self.messages = []
+		self.messages = MessageLog(state.log_size)
+		self.finished = False
+		self.aborted = False
+		self.worker = None
 		self.screenshot = None
-		self.screenshot_valid_time = time.time()
-		self.screenshot_refresh_time = float(command.settings.screenshot_refresh_time)
+
+		# runners are created from request handlers, i.e. on the IOLoop thread. the
+		# condition lets event streams wait for new messages without polling.
+		self.ioloop = tornado.ioloop.IOLoop.current()
+		self.changed = tornado.locks.Condition()
 
 	def get_batch(self):
 		return self.batch
 
 	def run(self):
-		# isolate the selenium driver from our main process through a fork. this fixes severe problems with
-		# chrome zomie processes piling up inside the selenium chrome docker container.
-
-		pipein, pipeout = os.pipe()
-		if os.fork() == 0:
+		worker = self.state.workers.acquire()
+		self.worker = worker
 
-			os.close(pipein)
+		has_result = False
 
-			def write(*args):
-				os.write(pipeout, (json.dumps(args) + "\n").encode('utf8'))
+		try:
+			worker.conn.send(self.command.to_json())
 
-			try:
+			while not has_result:
 				try:
-					with self._create_browser() as browser:
-						def report(*args):
-							if time.time() > self.screenshot_valid_time:
-								try:
-									screenshot = browser.driver.get_screenshot_as_base64()
-									self.screenshot_valid_time = time.time() + self.screenshot_refresh_time
-									write("SCREENSHOT", screenshot)
-								except:
-									pass  # screenshot failed
-
-							write("ECHO", " ".join("%s" % arg for arg in args))
-
-						report("machine browser has wait time %d." % self.wait_time)
-						report('running on user agent', browser.driver.execute_script('return navigator.userAgent'))
-
-						expected_result = self.command.run(browser, report)
-				except WebDriverException as webdriver_error:
-					# we end up here in case our browser / selenium does not start and fails to close down.
-					e = InteractionException(str(webdriver_error))
-					traceback.print_exc()
-					expected_result = Result.from_error(Origin.recorded, e.get_error_domain(), traceback.format_exc())
-
-				if expected_result is None:
-					write("ERROR", "no result obtained")
+					frame_type, payload, sent_time = unpack_frame(worker.conn.recv_bytes())
+				except EOFError:
+					break  # worker died.
+
+				if frame_type == FrameType.SCREENSHOT:
+					self.screenshot = payload  # raw png or jpeg, only encoded if someone asks for it.
+				elif frame_type == FrameType.FILE:
+					self._add_file(*unpack_file(payload), sent_time)
 				else:
-					write("DONE", expected_result.to_json())
-			except:
-				traceback.print_exc()
-				write("ERROR", traceback.format_exc())
+					has_result = frame_type in (FrameType.DONE, FrameType.ERROR)
+					self._add_message([frame_type.name, payload.decode('utf8'), sent_time])
+		except:
+			traceback.print_exc()
+		finally:
+			self.state.workers.release(worker, reuse=has_result and not self.aborted)
 
-			sys.exit(0)
+			if not has_result:
+				# the worker died without telling us. make sure the master does not wait forever.
+				self._add_message(["ERROR", "machine runner exited without result", time.time()])
+			self.finished = True
+			self.ioloop.add_callback(self.changed.notify_all)
 
-		else:
-			os.close(pipeout)
+	def _add_message(self, data):
+		self.messages.append(data)
+		self.ioloop.add_callback(self.changed.notify_all)
 
-			try:
-				with os.fdopen(pipein) as fdpipein:
-					while True:
-						line = fdpipein.readline()[:-1]
-						if not line:
-							break
-						data = json.loads(line)
-						if data[0] == 'SCREENSHOT':
-							self.screenshot = data[1]
-						else:
-							self.messages.append(data)
-			finally:
-				os.close(pipein)
-
-	def _create_browser(self):
-		return pandora.Browser(
-			browser=self.command.settings.browser,
-			wait_time=self.command.wait_time,
-			resolution=self.command.settings.resolution)
-
-	def get_messages(self, index):
-		return self.messages[index:]
+	def _add_file(self, name, data, sent_time):
+		# the event stream to the master is text, so this is where files get encoded.
+		self._add_message(["FILE", [name, base64.b64encode(data).decode('ascii')], sent_time])
+
+	def get_messages(self, cursor):
+		return self.messages.read(cursor)
+
+	def ack_messages(self, cursor):
+		self.messages.ack(cursor)
+
+	def is_finished(self, cursor):
+		return self.finished and cursor >= self.messages.end
+
+	def close(self):
+		self.messages.close()
+
+	def wait_for_messages(self, timeout):
+		return self.changed.wait(timeout=datetime.timedelta(seconds=timeout))
 
 	def get_screenshot(self):
 		return self.screenshot
 
+	def watch(self):
+		# tells the worker that someone watches its screenshots.
+		worker = self.worker
+		if worker is not None:
+			worker.watched_until.value = time.time() + watch_time
+
+	def abort(self):
+		worker = self.worker
+		if worker is not None and not self.finished:
+			self.aborted = True
+			try:
+				os.kill(worker.pid, signal.SIGTERM)
+			except ProcessLookupError:
+				pass  # already gone
+
+
+class _Aborted(Exception):
+	pass
+
+
+class HttpRunner(Runner):
+	# runs an http participant (see driver/http_engine.py) on its own thread of the machine process.
+	# it needs neither a browser nor a worker process, so that a machine can run far more of these
+	# (see GlobalState.max_http_runners) than browser participants.
+
+	def run(self):
+		has_result = False
+
+		def report(*args):
+			if self.aborted:
+				raise _Aborted()  # unwinds the exam at its next step.
+			self._add_message(["ECHO", " ".join("%s" % arg for arg in args), time.time()])
+
+		try:
+			result = self.command.run(None, report)
+
+			if self.aborted:
+				self._add_message(["ERROR", "job aborted.", time.time()])
+			elif result is None:
+				self._add_message(["ERROR", "no result obtained", time.time()])
+			else:
+				for name, data in result.files.items():
+					self._add_file(name, data, time.time())
+				self._add_message(["DONE", result.to_json(with_files=False), time.time()])
+			has_result = True
+		except _Aborted:
+			self._add_message(["ERROR", "job aborted.", time.time()])
+			has_result = True
+		except:
+			traceback.print_exc()
+		finally:
+			if not has_result:
+				self._add_message(["ERROR", "machine runner exited without result", time.time()])
+			self.finished = True
+			self.ioloop.add_callback(self.changed.notify_all)
+
+	def watch(self):
+		pass  # no browser, hence no screenshots.
+
+	def abort(self):
+		if not self.finished:
+			self.aborted = True
+
 
 class HelloHandler(tornado.web.RequestHandler):
 	def post(self):
@@ -135,72 +422,144 @@ class StartHandler(tornado.web.RequestHandler):
 	def initialize(self, state):
 		self.state = state	
 
-	def post(self, batch):
-		if self.state.runner and not self.state.runner.is_alive():
-			self.state.runner = None
+	def post(self, batch, index):
+		command_json = self.get_argument("command_json")
+		command = TakeExamCommand(from_json=command_json)
 
-		if self.state.runner is None:
-			command_json = self.get_argument("command_json")
-			command = TakeExamCommand(from_json=command_json)
-			self.state.runner = Runner(self.state, batch, command)
-			self.state.runner.start()
+		if not self.state.start_runner(batch, index, command):
+			# all runners busy, the master needs to try again later.
+			raise tornado.web.HTTPError(503)
 
 		self.finish()
 
 
+class StatusHandler(tornado.web.RequestHandler):
+	def initialize(self, state):
+		self.state = state
+
+	def get(self):
+		self.write(json.dumps(dict(
+			runners=len(self.state.get_active_runners()),
+			capacity=self.state.max_runners,
+			http_capacity=self.state.max_http_runners)))
+		self.finish()
+
+
 class AbortHandler(tornado.web.RequestHandler):
 	def initialize(self, state):
 		self.state = state	
 
-	def get(self, index):
-		pass
+	def post(self, batch, index=None):
+		if index is None:
+			runners = [r for (b, _), r in self.state.runners.items() if b == batch]
+		else:
+			runner = self.state.get_runner(batch, index)
+			runners = [runner] if runner else []
+
+		if not runners:
+			raise tornado.web.HTTPError(404)
+
+		for runner in runners:
+			runner.abort()
+
+		self.finish()
 
 
 class MonitorHandler(tornado.web.RequestHandler):
 	def initialize(self, state):
 		self.state = state	
 
-	def get(self, batch, index):
-		runner = self.state.runner
+	def get(self, batch, index, cursor):
+		runner = self.state.get_runner(batch, index)
 
-		if runner and runner.get_batch() == batch:
-			self.write(json.dumps(runner.get_messages(int(index))))
+		if runner:
+			self.write(json.dumps([message for _, message in runner.get_messages(int(cursor))]))
 		else:
 			self.write(json.dumps([]))
 
 		self.finish()
 
 
+class StreamHandler(tornado.web.RequestHandler):
+	# pushes the messages of a runner to the master as newline delimited JSON,
+	# starting at the given cursor, as soon as they arrive.
+
+	def initialize(self, state):
+		self.state = state
+
+	async def get(self, batch, index, cursor):
+		runner = self.state.get_runner(batch, index)
+
+		if not runner:
+			self.send_error(404)
+			return
+
+		# the master reconnects at the first message it has not seen yet.
+		cursor = int(cursor)
+		runner.ack_messages(cursor)
+
+		t1 = time.time() + stream_timeout
+
+		self.set_header('Content-Type', 'application/x-ndjson')
+
+		try:
+			while True:
+				messages = runner.get_messages(cursor)
+				if messages:
+					for seq, message in messages:
+						self.write(json.dumps(message + [seq]) + "\n")
+					cursor = messages[-1][0] + 1
+					await self.flush()
+
+				if runner.is_finished(cursor) or time.time() >= t1:
+					break
+
+				await runner.wait_for_messages(t1 - time.time())
+		except tornado.iostream.StreamClosedError:
+			return  # master went away; it will reconnect.
+
+		self.finish()
+
+
 class ScreenshotHandler(tornado.web.RequestHandler):
 	def initialize(self, state):
 		self.state = state	
 
-	def get(self, batch):
-		runner = self.state.runner
+	def get(self, batch, index):
+		runner = self.state.get_runner(batch, index)
 
-		if runner and runner.get_batch() == batch and runner.get_screenshot():
-			self.write(runner.get_screenshot())
+		if runner:
+			runner.watch()
+			if runner.get_screenshot():
+				self.write(screenshot_data_uri(runner.get_screenshot()))
 
 		self.finish()
 
 
-def make_app():
-	state = GlobalState()
+def make_app(workers, max_runners=1, max_http_runners=200, log_size=1000):
+	state = GlobalState(workers, max_runners, max_http_runners, log_size)
 
 	return tornado.web.Application([
 		(r"/hello/", HelloHandler),
-		(r"/start/(?P<batch>[^/]+)", StartHandler, dict(state=state)),
-		(r"/abort/", AbortHandler, dict(state=state)),
-		(r"/monitor/(?P<batch>[^/]+)/(?P<index>[0-9]+)", MonitorHandler, dict(state=state)),
-		(r"/screenshot/(?P<batch>[^/]+)", ScreenshotHandler, dict(state=state))
+		(r"/status.json", StatusHandler, dict(state=state)),
+		(r"/start/(?P<batch>[^/]+)/(?P<index>[0-9]+)", StartHandler, dict(state=state)),
+		(r"/abort/(?P<batch>[^/]+)", AbortHandler, dict(state=state)),
+		(r"/abort/(?P<batch>[^/]+)/(?P<index>[0-9]+)", AbortHandler, dict(state=state)),
+		(r"/monitor/(?P<batch>[^/]+)/(?P<index>[0-9]+)/(?P<cursor>[0-9]+)", MonitorHandler, dict(state=state)),
+		(r"/stream/(?P<batch>[^/]+)/(?P<index>[0-9]+)/(?P<cursor>[0-9]+)", StreamHandler, dict(state=state)),
+		(r"/screenshot/(?P<batch>[^/]+)/(?P<index>[0-9]+)", ScreenshotHandler, dict(state=state))
 	])
 
 
 def run_machine():
 	print("starting machine.")
-	parse_args()  # ignored right now
+	args = parse_args()
+
+	workers = WorkerPool(
+		args.machine_runners, args.machine_worker_jobs, args.browser_max_uses, args.compress_frames)
+	workers.start()
 
-	app = make_app()
+	app = make_app(workers, args.machine_runners, args.machine_http_runners, args.machine_log_size)
 	app.listen(8888)
 
 	print("HELLO.")
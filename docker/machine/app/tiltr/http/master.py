@@ -6,12 +6,14 @@
 #
 
 import os
+import asyncio
 import requests
 import io
 import re
 import json
 import threading
 import time
+import datetime
 import humanize
 import shutil
 import traceback
@@ -25,8 +27,10 @@ import tornado.websocket
 from .discovery import connect_machines
 from .utils import clear_tmp
 from .args import parse_args
-from tiltr.driver.batch import Batch
+from tiltr.driver.batch import Batch, TestCopyPool, admin_session
+from tiltr.driver.orchestrator import Orchestrator
 from tiltr.driver.drivers import PackagedTest
+from tiltr.driver.catalog import TestCatalog
 from tiltr.data.result import open_results
 from tiltr.data.settings import Settings, Workarounds
 from tiltr.data.database import DB
@@ -86,6 +90,23 @@ class FetchILIASVersion(threading.Thread):
 				n_tries += 1
 
 
+class DeleteStaleTestCopies(threading.Thread):
+	def __init__(self, state, before):
+		super().__init__(daemon=True)
+		self.state = state
+		self.before = before
+
+	def run(self):
+		while self.state.ilias_version is None:  # wait for ILIAS to come up
+			time.sleep(5)
+
+		try:
+			TestCopyPool.delete_stale(self.state.in_admin_session, self.state.ilias_url, self.before)
+		except:
+			print("could not delete stale test copies.")
+			traceback.print_exc()
+
+
 class Looper(threading.Thread):
 	def __init__(self, state, test, settings, workarounds, wait_time):
 		super().__init__()
@@ -96,9 +117,10 @@ class Looper(threading.Thread):
 		self.wait_time = wait_time
 		self.done = False
 		self.consecutive_interaction_fails = 0
+		self.analyzing = None  # previous batch that still verifies its results.
 
-	def _check_success(self):
-		success = self.state.batch.get_success()
+	def _check_success(self, batch):
+		success = batch.get_success()
 		if success == ('FAIL', 'interaction'):
 			self.consecutive_interaction_fails += 1
 		else:
@@ -114,11 +136,27 @@ class Looper(threading.Thread):
 			# container. shut down in this case.
 			sys.exit(1)
 
+	def _is_pipelined(self):
+		try:
+			return int(self.settings.pipeline_batches) > 0
+		except ValueError:
+			return False
+
 	def run(self):
 		while self.state.is_looping:
 			try:
-				if self.state.batch and self.state.batch.is_done():
-					self._check_success()
+				if self.analyzing and self.analyzing.is_done():
+					self._check_success(self.analyzing)
+					self.analyzing = None
+
+				batch = self.state.batch
+				if batch and batch.is_done():
+					self._check_success(batch)
+					self.state.batch = None
+				elif batch and self.analyzing is None and self._is_pipelined() and batch.is_exams_done():
+					# machines are idle now, so start the next batch while this one verifies
+					# its results. we never run more than one batch behind.
+					self.analyzing = batch
 					self.state.batch = None
 
 				if not self.state.is_looping:
@@ -138,19 +176,43 @@ class Looper(threading.Thread):
 
 class GlobalState:
 	def __init__(self, machines, args):
-		self.machines = machines
+		self.machines = machines  # live Membership, see discovery.py
+		self.machines.start_heartbeat()
 		self.batch = None
+		self.batches = dict()  # batch id -> batch, for all batches that are not done yet
 		self.looper = None
 		self._is_looping = False
 		self.args = args
 		self.ilias_url = args.ilias_url
+		self.orchestrator = Orchestrator(tornado.ioloop.IOLoop.current())
+		self.browser_pool = pandora.BrowserPool(
+			max_uses=args.browser_max_uses) if args.browser_max_uses > 0 else None
+
+		self.catalog = TestCatalog()
 
 		self.ilias_version = None
 		FetchILIASVersion(self).start()
 
+		# test copies that earlier runs of this master imported are in no TestCopyPool and would pile up.
+		DeleteStaleTestCopies(self, datetime.datetime.now()).start()
+
 	def get_ilias_url(self):
 		return self.ilias_url
 
+	def in_admin_session(self, settings=None):
+		# an admin session that is owned by the master, not by a batch. reports go to stdout.
+		return admin_session(
+			self.ilias_url, self.args.ilias_admin_user, self.args.ilias_admin_password,
+			settings or Settings(), self.browser_pool, lambda text: print("[admin] %s" % text))
+
+	def get_batch(self, batch_id):
+		# the batch might not be self.batch anymore, e.g. if it still verifies its
+		# results while the looper already started the next one.
+		for done_id, batch in list(self.batches.items()):
+			if batch.is_done():
+				self.batches.pop(done_id, None)
+		return self.batches.get(batch_id)
+
 	def get_ilias_version(self):
 		return self.ilias_version
 
@@ -194,9 +256,12 @@ class GlobalState:
 		if self.batch is None:
 			clear_tmp()
 
-			self.batch = Batch(self.machines, ilias_version, test, settings, workarounds, wait_time)
+			self.batch = Batch(
+				self.machines, ilias_version, test, settings, workarounds, wait_time,
+				self.orchestrator, self.browser_pool, lambda: self.in_admin_session(settings))
 			self.batch.configure(self.args)
 			self.batch.set_recycle_users(self.is_looping)
+			self.batches[self.batch.get_id()] = self.batch
 
 			self.batch.start()
 
@@ -259,12 +324,37 @@ class StatusHandler(tornado.web.RequestHandler):
 		self.flush()
 
 
+async def _wait_for_catalog(catalog):
+	# on a fresh start, the first listings wait for the initial index instead of being empty.
+	future = catalog.wait_for_index()
+	if future is not None:
+		await asyncio.wrap_future(future)
+
+
 class TestsHandler(tornado.web.RequestHandler):
 	def initialize(self, state):
 		self.state = state
 
-	def get(self):
-		self.write(json.dumps(PackagedTest.list()))
+	async def get(self):
+		await _wait_for_catalog(self.state.catalog)
+		self.write(json.dumps(self.state.catalog.list(self.get_arguments("type"))))
+		self.flush()
+
+
+class CatalogHandler(tornado.web.RequestHandler):
+	# metadata of all tests (or of those with all of the given QTI question types) or one test.
+	def initialize(self, state):
+		self.state = state
+
+	async def get(self, test_id=None):
+		await _wait_for_catalog(self.state.catalog)
+		if test_id is None:
+			self.write(json.dumps(self.state.catalog.query(self.get_arguments("type"))))
+		else:
+			entry = self.state.catalog.get(test_id)
+			if entry is None:
+				raise tornado.web.HTTPError(404)
+			self.write(json.dumps(entry))
 		self.flush()
 
 
@@ -294,19 +384,35 @@ class StartBatchHandler(tornado.web.RequestHandler):
 		self.flush()
 
 
+class CancelBatchHandler(tornado.web.RequestHandler):
+	def initialize(self, state):
+		self.state = state
+
+	def post(self, batch):
+		batch = self.state.get_batch(batch)
+		if batch:
+			batch.cancel()
+			self.write("ok")
+		else:
+			self.write("error")
+		self.flush()
+
+
 class WebSocketHandler(tornado.websocket.WebSocketHandler):
 	def initialize(self, state):
 		self.state = state
+		self.batch = None
 
 	def open(self, batch):
-		if self.state.batch and self.state.batch.get_id() == batch:
-			self.state.batch.add_socket(self)
+		self.batch = self.state.get_batch(batch)
+		if self.batch:
+			self.batch.add_socket(self)
 		else:
 			self.close()  # reject this connection
 
 	def on_close(self):
-		if self.state.batch:
-			self.state.batch.remove_socket(self)
+		if self.batch:
+			self.batch.remove_socket(self)
 
 	def on_message(self, message):
 		pass
@@ -317,20 +423,24 @@ class ScreenshotHandler(tornado.web.RequestHandler):
 		self.state = state
 
 	def get(self, machine):
-		if self.state.batch:
+		batch_id = self.get_argument("batch", None)
+		batch = self.state.get_batch(batch_id) if batch_id else self.state.batch
+
+		if batch:
 			if machine == "master":
 				try:
-					screenshot = self.state.batch.get_screenshot_as_base64()
+					screenshot = batch.get_screenshot()
 					if screenshot:
 						self.write(screenshot)
 				except:
 					print("screenshot on master failed.")
 			else:
-				machine_ip = self.state.machines[machine]
-
-				r = requests.get("http://%s:8888/screenshot/%s" %
-					(machine_ip, self.state.batch.get_id()), data={})
-				self.write(r.text)
+				participant = batch.get_participant(machine)
+				if participant:
+					machine_ip, index = participant
+					r = requests.get("http://%s:8888/screenshot/%s/%d" %
+						(machine_ip, batch.get_id(), index), data={})
+					self.write(r.text)
 
 		self.finish()
 
@@ -370,6 +480,8 @@ class ResultsJsonHandler(tornado.web.RequestHandler):
 				data = db.get_performance_data()
 			elif what == "longterm":
 				data = db.get_longterm_data()
+			elif what == "events":
+				data = db.get_event_data()
 
 			self.write(json.dumps(data))
 
@@ -458,11 +570,14 @@ def make_app(machines, args):
 		(r"/report", ReportHandler, dict(state=state)),
 
 		(r"/start", StartBatchHandler, dict(state=state)),
+		(r"/cancel/(?P<batch>[^/]+)", CancelBatchHandler, dict(state=state)),
 		(r"/websocket/(?P<batch>[^/]+)", WebSocketHandler, dict(state=state)),
 		(r"/screenshot/(?P<machine>.+)", ScreenshotHandler, dict(state=state)),
 		(r"/preferences.json", PreferencesHandler, dict(state=state)),
 
 		(r"/tests.json", TestsHandler, dict(state=state)),
+		(r"/catalog.json", CatalogHandler, dict(state=state)),
+		(r"/catalog/(?P<test_id>[^/]+)\.json", CatalogHandler, dict(state=state)),
 		(r"/status.json", StatusHandler, dict(state=state)),
 		(r"/results-(.*?).json", ResultsJsonHandler),
 		(r"/result/(?P<batch>[^/]+)", ResultsHandler),
@@ -494,7 +609,12 @@ def run_master():
 			print('%s: %s' % (k, v))
 		else:
 			print('%s: ***' % k)
-	with connect_machines() as machines:
+
+	# batches do not survive a restart, neither do their leases of pool users.
+	with open_results() as db:
+		db.release_pool_users(args.ilias_url)
+
+	with connect_machines(args.machine_hostname) as machines:
 		expose_port = 8080
 		print("found %d machines." % len(machines))
 		app = make_app(machines, args)
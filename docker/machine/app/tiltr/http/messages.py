@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+import json
+import tempfile
+import threading
+from collections import deque
+
+
+class MessageLog:
+	# a bounded log of runner messages. every message gets a sequence number, so
+	# readers can resume from a cursor. at most max_size messages are held in
+	# memory; older ones are either written to a spill file (and can still be
+	# read from there) or dropped. acknowledged messages are released from memory.
+
+	def __init__(self, max_size=1000, spill=True):
+		self.max_size = max(1, max_size)
+
+		self._mutex = threading.Lock()
+		self._entries = deque()
+		self._first = 0  # sequence number of self._entries[0]
+
+		self._spill = tempfile.TemporaryFile() if spill else None
+		self._spilled = []  # file offsets, indexed by sequence number
+
+	@property
+	def end(self):
+		# sequence number of the next message.
+		with self._mutex:
+			return self._first + len(self._entries)
+
+	def append(self, message):
+		with self._mutex:
+			self._entries.append(message)
+			while len(self._entries) > self.max_size:
+				self._evict()
+			return self._first + len(self._entries) - 1
+
+	def _evict(self):
+		message = self._entries.popleft()
+		if self._spill is not None and self._first == len(self._spilled):
+			self._spill.seek(0, 2)
+			self._spilled.append(self._spill.tell())
+			self._spill.write((json.dumps(message) + "\n").encode('utf8'))
+		self._first += 1
+
+	def ack(self, cursor):
+		# the reader has everything before cursor, so we don't need to keep it in memory.
+		with self._mutex:
+			while self._entries and self._first < cursor:
+				self._evict()
+
+	def read(self, cursor):
+		# returns (seq, message) pairs starting at cursor. messages that have been dropped are
+		# skipped, i.e. the first sequence number might be greater than cursor.
+		with self._mutex:
+			result = []
+
+			if cursor < self._first and self._spill is not None:
+				n_spilled = len(self._spilled)
+				if cursor < n_spilled:
+					self._spill.seek(self._spilled[cursor])
+					for seq in range(cursor, n_spilled):
+						result.append((seq, json.loads(self._spill.readline().decode('utf8'))))
+				cursor = n_spilled
+
+			offset = max(0, cursor - self._first)
+			for i in range(offset, len(self._entries)):
+				result.append((self._first + i, self._entries[i]))
+
+			return result
+
+	def close(self):
+		with self._mutex:
+			if self._spill is not None:
+				self._spill.close()
+				self._spill = None
+			self._spilled = []
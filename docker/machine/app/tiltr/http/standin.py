@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+import uuid
+import asyncio
+import threading
+from decimal import Decimal
+from html import escape
+
+import tornado.ioloop
+import tornado.web
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+
+from tiltr.data.settings import Settings, Workarounds
+from tiltr.driver.commands import TakeExamCommand
+from tiltr.driver.drivers import Mark
+from tiltr.driver.exam_configuration import ExamConfiguration
+from tiltr.question.questions.single_choice import SingleChoiceQuestion
+from tiltr.question.questions.multiple_choice import MultipleChoiceQuestion, MultipleChoiceItem
+from tiltr.question.questions.kprim import KPrimQuestion, KPrimScoring, KPrimChoice
+from tiltr.question.questions.cloze import ClozeQuestion, ClozeScoring, ClozeType, ClozeComparator, \
+	TextualGapScoring, NumericGapScoring
+
+
+# a local stand-in for the parts of ILIAS that http participants (see driver/http_engine.py)
+# talk to: login, test start, the test player with single choice, multiple choice, KPrim and
+# cloze questions, and finishing the test. it keeps the answers it receives, so that a run of the
+# http engine can be checked against the result it records, without any ILIAS instance (see
+# tests/test_standin.py).
+
+
+_username = "standin"
+_password = "standin"
+
+
+def _create_questions():
+	# questions are usually parsed from the ILIAS UI, so bypass their constructors.
+	sc = object.__new__(SingleChoiceQuestion)
+	sc.title = "Standin Single Choice"
+	sc.choices = dict([("Rome", Decimal(2)), ("Paris", Decimal(0)), ("Madrid", Decimal("0.5"))])
+
+	mc = object.__new__(MultipleChoiceQuestion)
+	mc.title = "Standin Multiple Choice"
+	mc.choices = dict([
+		("red", MultipleChoiceItem(Decimal(1), Decimal(0))),
+		("green", MultipleChoiceItem(Decimal(0), Decimal(1))),
+		("blue", MultipleChoiceItem(Decimal("1.5"), Decimal("-0.5")))])
+
+	kprim = object.__new__(KPrimQuestion)
+	kprim.title = "Standin KPrim"
+	kprim.scoring = KPrimScoring(halfpoints=True, score=Decimal(4), choices=[
+		KPrimChoice(name="A", is_correct=True),
+		KPrimChoice(name="B", is_correct=False),
+		KPrimChoice(name="C", is_correct=True),
+		KPrimChoice(name="D", is_correct=False)])
+
+	cloze = object.__new__(ClozeQuestion)
+	cloze.title = "Standin Cloze"
+	cloze.scoring = ClozeScoring(identical_scoring=True, comparator=ClozeComparator.ignore_case, gaps=[
+		TextualGapScoring(cloze_type=ClozeType.text, size=12, options=dict([
+			("Hochzeit", Decimal(1)), ("Feier", Decimal("0.5"))])),
+		TextualGapScoring(cloze_type=ClozeType.select, size=None, options=dict([
+			("Vogel", Decimal(1)), ("Prinz", Decimal(0)), ("Kämmerer", Decimal(0))])),
+		NumericGapScoring(
+			cloze_type=ClozeType.numeric, value=Decimal("3.14"),
+			lower=Decimal("3.1"), upper=Decimal("3.2"), score=Decimal(1))])
+	cloze._create_gaps()
+
+	return dict((q.title, q) for q in (sc, mc, kprim, cloze))
+
+
+class _Exam:
+	def __init__(self, questions):
+		self.sequence = list(questions.values())
+		self.sessions = dict()  # session id -> username
+		self.answers = dict()  # username -> sequence id -> posted form fields
+		self.finished = set()
+
+
+class _Handler(tornado.web.RequestHandler):
+	def initialize(self, exam):
+		self.exam = exam
+
+	def get_user(self):
+		return self.exam.sessions.get(self.get_cookie("PHPSESSID"))
+
+	def page(self, body):
+		self.write(
+			'<!DOCTYPE html><html lang="en"><head><title>ILIAS</title></head><body>'
+			'<a href="/logout.php">Logout</a>%s</body></html>' % body)
+
+	def prepare(self):
+		if self.get_user() is None and not isinstance(self, _LoginHandler):
+			self.redirect("/login.php?client_id=standin")
+
+
+class _LoginHandler(_Handler):
+	def get(self):
+		self.write(
+			'<!DOCTYPE html><html lang="en"><body>'
+			'<form name="formlogin" method="post" action="/login.php?client_id=standin">'
+			'<input type="text" name="username"><input type="password" name="password">'
+			'<input type="submit" name="cmd[doStandardAuthentication]" value="Login">'
+			'</form></body></html>')
+
+	def post(self):
+		if self.get_argument("username") != _username or self.get_argument("password") != _password:
+			self.redirect("/login.php?client_id=standin")
+			return
+		session_id = uuid.uuid4().hex
+		self.exam.sessions[session_id] = _username
+		self.set_cookie("PHPSESSID", session_id)
+		self.redirect("/ilias.php")
+
+
+class _LogoutHandler(_Handler):
+	def get(self):
+		self.exam.sessions.pop(self.get_cookie("PHPSESSID"), None)
+		self.clear_cookie("PHPSESSID")
+		self.redirect("/login.php?client_id=standin")
+
+
+class _HomeHandler(_Handler):
+	def get(self):
+		self.page('<h1>Personal Desktop</h1>')
+
+
+class _TestHandler(_Handler):
+	def get(self):
+		user = self.get_user()
+		if user in self.exam.finished:
+			self.page('<p>test finished.</p>')
+			return
+		command = "resumePlayer" if user in self.exam.answers else "startPlayer"
+		self.page(
+			'<form method="post" action="/goto.php?target=tst_1">'
+			'<input type="submit" name="cmd[%s]" value="Start"></form>' % command)
+
+	def post(self):
+		self.exam.answers.setdefault(self.get_user(), dict())
+		self.redirect("/player.php?sequence=1")
+
+
+def _render_question(question, fields):
+	# mimics the markup of ILIAS' question output, as far as the answers read it.
+	kind = question.__class__.__name__
+	html = []
+
+	def checked(name, value):
+		return ' checked="checked"' if fields.get(name) == value else ''
+
+	if kind == "SingleChoiceQuestion":
+		html.append('<div class="ilc_question_SingleChoice">')
+		for i, label in enumerate(question.choices.keys()):
+			html.append(
+				'<div class="ilc_qanswer_Answer"><input type="radio" id="answer_%d" name="multiple_choice_result" value="%d"%s>'
+				'<label for="answer_%d">%s</label></div>' % (
+					i, i, checked("multiple_choice_result", str(i)), i, escape(label)))
+	elif kind == "MultipleChoiceQuestion":
+		html.append('<div class="ilc_question_MultipleChoice">')
+		for i, label in enumerate(question.choices.keys()):
+			name = "multiple_choice_result_%d" % i
+			html.append(
+				'<div class="ilc_qanswer_Answer"><input type="checkbox" id="answer_%d" name="%s" value="%d"%s>'
+				'<label for="answer_%d">%s</label></div>' % (
+					i, name, i, checked(name, str(i)), i, escape(label)))
+	elif kind == "KPrimQuestion":
+		html.append('<div class="ilc_question_KprimChoice"><table>')
+		for i, choice in enumerate(question.scoring.choices):
+			name = "kprim_choice_result_%d" % i
+			html.append(
+				'<tr><td>%s</td><td><input type="radio" name="%s" value="1"%s></td>'
+				'<td><input type="radio" name="%s" value="0"%s></td></tr>' % (
+					escape(choice.name), name, checked(name, "1"), name, checked(name, "0")))
+		html.append('</table>')
+	elif kind == "ClozeQuestion":
+		html.append('<div class="ilc_question_ClozeTest"><p>')
+		for i, gap in enumerate(question.scoring.gaps):
+			name = "gap_%d" % i
+			if gap.cloze_type == ClozeType.select:
+				html.append('<select class="ilc_qinput_ClozeGapSelect" name="%s"><option value="-1">-- select --</option>' % name)
+				for j, option in enumerate(gap.options.keys()):
+					selected = ' selected="selected"' if fields.get(name) == str(j) else ''
+					html.append('<option value="%d"%s>%s</option>' % (j, selected, escape(option)))
+				html.append('</select>')
+			else:
+				html.append('<input type="text" class="ilc_qinput_TextInput" name="%s" value="%s">' % (
+					name, escape(fields.get(name, ""))))
+		html.append('</p>')
+
+	html.append('</div>')
+	return "".join(html)
+
+
+class _PlayerHandler(_Handler):
+	def _sequence(self):
+		sequence = int(self.get_argument("sequence"))
+		if not 1 <= sequence <= len(self.exam.sequence):
+			raise tornado.web.HTTPError(404)
+		return sequence
+
+	def get(self):
+		sequence = self._sequence()
+		question = self.exam.sequence[sequence - 1]
+		fields = self.exam.answers[self.get_user()].get(sequence, dict())
+
+		links = []
+		if sequence > 1:
+			links.append(('previousQuestion', sequence - 1))
+		if sequence < len(self.exam.sequence):
+			links.append(('nextQuestion', sequence + 1))
+		links.append(('finishTest', None))
+
+		self.page(
+			'<form id="taForm" method="post" action="/player.php?sequence=%d">'
+			'<div class="ilc_page_title_PageTitle">%s</div>%s'
+			'<input type="hidden" name="nextcmd" value=""><input type="hidden" name="nextparm" value="">'
+			'</form>%s' % (
+				sequence, escape(question.title), _render_question(question, fields), "".join(
+					'<a href="%s" data-nextcmd="%s" data-nextparm="">%s</a>' % (
+						"/player.php?sequence=%d" % target if target else "/finish.php", command, command)
+					for command, target in links)))
+
+	def post(self):
+		sequence = self._sequence()
+
+		# like ILIAS, an answer is saved as a whole.
+		self.exam.answers[self.get_user()][sequence] = dict(
+			(name, self.get_body_argument(name)) for name in self.request.body_arguments.keys()
+			if name not in ("nextcmd", "nextparm"))
+
+		command = self.get_body_argument("nextcmd", "")
+		if command == "nextQuestion":
+			sequence += 1
+		elif command == "previousQuestion":
+			sequence -= 1
+		elif command == "finishTest":
+			self.redirect("/finish.php")
+			return
+		self.redirect("/player.php?sequence=%d" % sequence)
+
+
+class _FinishHandler(_Handler):
+	def get(self):
+		self.page(
+			'<form method="post" action="/finish.php">'
+			'<input type="submit" name="cmd[confirmFinish]" value="Finish"></form>')
+
+	def post(self):
+		self.exam.finished.add(self.get_user())
+		self.redirect("/ilias.php")
+
+
+def _make_app(exam):
+	args = dict(exam=exam)
+	return tornado.web.Application([
+		(r"/login.php", _LoginHandler, args),
+		(r"/logout.php", _LogoutHandler, args),
+		(r"/ilias.php", _HomeHandler, args),
+		(r"/goto.php", _TestHandler, args),
+		(r"/player.php", _PlayerHandler, args),
+		(r"/finish.php", _FinishHandler, args),
+	])
+
+
+def _stored_answers(exam, username, language):
+	# the answers the stand-in received, in the form of Result.get_answers().
+	answers = dict()
+	for sequence, fields in exam.answers.get(username, dict()).items():
+		question = exam.sequence[sequence - 1]
+		kind = question.__class__.__name__
+		if kind == "SingleChoiceQuestion":
+			answers[question.title] = dict(
+				(label, 1 if fields.get("multiple_choice_result") == str(i) else 0)
+				for i, label in enumerate(question.choices.keys()))
+		elif kind == "MultipleChoiceQuestion":
+			answers[question.title] = dict(
+				(label, 1 if "multiple_choice_result_%d" % i in fields else 0)
+				for i, label in enumerate(question.choices.keys()))
+		elif kind == "KPrimQuestion":
+			answers[question.title] = dict(
+				(choice.name, int(fields.get("kprim_choice_result_%d" % i, "0")))
+				for i, choice in enumerate(question.scoring.choices))
+		elif kind == "ClozeQuestion":
+			gaps = dict()
+			for i, gap in enumerate(question.scoring.gaps):
+				value = fields.get("gap_%d" % i, "")
+				if gap.cloze_type == ClozeType.select:
+					value = list(gap.options.keys())[int(value)] if value not in ("", "-1") else ""
+				gaps[question.gaps[i].get_export_name(language)] = value
+			answers[question.title] = gaps
+	return answers
+
+
+class StandIn:
+	# serves the stand-in on a local port, from a thread of its own.
+
+	username = _username
+	password = _password
+
+	def __init__(self):
+		self.questions = _create_questions()
+		self.exam = _Exam(self.questions)
+
+		sockets = bind_sockets(0, "127.0.0.1")
+		self.base_url = "http://127.0.0.1:%d" % sockets[0].getsockname()[1]
+		self._ioloop = None
+		started = threading.Event()
+
+		def serve():
+			asyncio.set_event_loop(asyncio.new_event_loop())
+			server = HTTPServer(_make_app(self.exam))
+			server.add_sockets(sockets)
+			self._ioloop = tornado.ioloop.IOLoop.current()
+			started.set()
+			self._ioloop.start()
+
+		threading.Thread(target=serve, daemon=True).start()
+		started.wait()
+
+	def create_command(self):
+		# a TakeExamCommand for an http participant, as machines get it from the master.
+		exam_configuration = ExamConfiguration()
+		exam_configuration.marks = [
+			Mark(level=Decimal(0), short="5.0", official="failed"),
+			Mark(level=Decimal(50), short="1.0", official="passed")]
+
+		command = TakeExamCommand(
+			ilias_url=self.base_url + "/login.php?client_id=standin",
+			machine=None,
+			machine_index=1,
+			username=self.username,
+			password=self.password,
+			test_id="standin",
+			test_url=self.base_url + "/goto.php?target=tst_1",
+			questions=self.questions,
+			exam_configuration=exam_configuration,
+			settings=Settings(),
+			workarounds=Workarounds(),
+			wait_time=0,
+			admin_lang="en",
+			engine="http")
+
+		return TakeExamCommand(from_json=command.to_json())
+
+	def stored_answers(self, language="en"):
+		return _stored_answers(self.exam, self.username, language)
+
+	def is_finished(self):
+		return self.username in self.exam.finished
+
+	def stop(self):
+		self._ioloop.add_callback(self._ioloop.stop)
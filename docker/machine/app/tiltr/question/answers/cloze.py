@@ -10,8 +10,8 @@ import re
 
 from .answer import Answer, Validness
 from ..questions.cloze import ClozeType
-from tiltr.driver.utils import set_element_value
 from tiltr.data.exceptions import InteractionException
+from tiltr.driver.dom import DomBatch
 
 
 Gap = namedtuple('Gap', ['selector', 'name', 'index', 'text'])
@@ -19,11 +19,9 @@ gap_name_pattern = re.compile("^gap_([0-9]+)$")
 
 
 class ClozeAnswerGap(object):
-	def __init__(self, driver, element):
-		self.driver = driver
-
-		self.name = element.get_attribute("name")
-		self._value = element.get_attribute("value")
+	def __init__(self, record):
+		self.name = record["attributes"]["name"]
+		self._value = record["value"]
 
 		match = gap_name_pattern.match(self.name)
 		if not match:
@@ -36,39 +34,35 @@ class TextOrNumericAnswerGap(ClozeAnswerGap):
 	def value(self):
 		return self._value
 
-	@value.setter
-	def value(self, new_value):
-		match = self.driver.find_element_by_name(self.name)
-		set_element_value(self.driver, match, new_value)
+	def get_ui_value(self, new_value):
+		return new_value
+
+	def set_value(self, new_value):
 		self._value = new_value
 
 
 class SelectAnswerGap(ClozeAnswerGap):
+	def __init__(self, record):
+		super().__init__(record)
+		self.options = [(value, text.strip()) for value, text in record["options"]]
+
 	@property
 	def value(self):
-		match = self.driver.find_element_by_name(self.name)
-		for option in match.find_elements_by_tag_name('option'):
-			if int(option.get_attribute("value")) == int(self._value):
-				return option.text.strip()
+		for option_value, option_text in self.options:
+			if int(option_value) == int(self._value):
+				return option_text
 
 		return None
 
-	@value.setter
-	def value(self, new_value):
-		match = self.driver.find_element_by_name(self.name)
-		found = False
-		option_values = []
-		for option in match.find_elements_by_tag_name('option'):
-			option_value = option.text.strip()
-			if option_value == new_value:
-				option.click()
-				found = True
-				break
-			option_values.append(option_value)
-		if not found:
-			raise InteractionException(
-				'option "%s" not found in %s.' % (new_value, option_values))
-		self._value = new_value
+	def get_ui_value(self, new_value):
+		for option_value, option_text in self.options:
+			if option_text == new_value:
+				return option_value
+		raise InteractionException(
+			'option "%s" not found in %s.' % (new_value, [text for _, text in self.options]))
+
+	def set_value(self, new_value):
+		self._value = self.get_ui_value(new_value)
 
 
 class ClozeAnswer(Answer):
@@ -89,22 +83,38 @@ class ClozeAnswer(Answer):
 		ui = self._parse_ui()
 		assert len(answers) == len(ui) and len(ui) == len(self.question.gaps)
 
+		values = dict()
 		for gap in self.question.gaps.values():
 			self.protocol.choose(gap.get_export_name("de"), answers[gap.index])
-			ui[gap.index].value = answers[gap.index]
+			ui_gap = ui[gap.index]
+			values[ui_gap.name] = ui_gap.get_ui_value(answers[gap.index])
+
+		batch = DomBatch()
+		for name, value in values.items():
+			batch.set_value('.ilc_question_ClozeTest [name="%s"]' % name, value)
+		batch.run(self.driver)
+
+		for gap in self.question.gaps.values():
+			ui[gap.index].set_value(answers[gap.index])
 
 		self.current_answers = answers
 		self.current_score = score
 
 	def _parse_ui(self):
-		root = self.driver.find_element_by_css_selector(".ilc_question_ClozeTest")
 		gaps = []
 
-		for element in root.find_elements_by_css_selector('input[type="text"].ilc_qinput_TextInput'):
-			gaps.append(TextOrNumericAnswerGap(self.driver, element))
-
-		for element in root.find_elements_by_css_selector("select.ilc_qinput_ClozeGapSelect"):
-			gaps.append(SelectAnswerGap(self.driver, element))
+		# reads all gaps in one WebDriver roundtrip.
+		batch = DomBatch()
+		text_inputs = batch.read(
+			'.ilc_question_ClozeTest input[type="text"].ilc_qinput_TextInput', attributes=("name",))
+		selects = batch.read(
+			'.ilc_question_ClozeTest select.ilc_qinput_ClozeGapSelect', attributes=("name",))
+		results = batch.run(self.driver)
+
+		for record in results[text_inputs]:
+			gaps.append(TextOrNumericAnswerGap(record))
+		for record in results[selects]:
+			gaps.append(SelectAnswerGap(record))
 
 		indexed = dict((gap.index, gap) for gap in gaps)
 		assert len(gaps) == len(indexed)  # all unique?
@@ -6,9 +6,9 @@
 #
 
 import json
-from selenium.webdriver.common.action_chains import ActionChains
 
 from .answer import Answer, Validness
+from tiltr.driver.dom import DomBatch, read_elements
 
 
 class KPrimAnswer(Answer):
@@ -23,27 +23,33 @@ class KPrimAnswer(Answer):
 		return Validness()
 
 	def _set_answers(self, answers, score):
-		ui = self._parse_ui()
-		chain = ActionChains(self.driver)
+		batch = DomBatch()
 
 		assert len(answers) == self.n_rows
-		for index, radios, answer in zip(range(self.n_rows), ui, answers):
+		for index, answer in zip(range(self.n_rows), answers):
 			self.protocol.choose(index, answer)
-			chain.click(radios[answer])
+			batch.click(self._radio_selector(index, answer))
 
-		chain.perform()
+		batch.run(self.driver)
 
 		self.current_answers = answers
 		self.current_score = score
 
+	@staticmethod
+	def _radio_selector(index, answer):
+		return '.ilc_question_KprimChoice input[name="kprim_choice_result_%d"][value="%d"]' % (index, int(answer))
+
 	def _parse_ui(self):
-		root = self.driver.find_element_by_css_selector(".ilc_question_KprimChoice")
-		ui = []
-		for i in range(self.n_rows):
-			radios = dict()
-			for radio in root.find_elements_by_name("kprim_choice_result_%d" % i):
-				radios[bool(int(radio.get_attribute("value")))] = radio
-			ui.append(radios)
+		# for each row, maps True and False to whether the respective radio is checked.
+		ui = [dict() for _ in range(self.n_rows)]
+		radios = read_elements(
+			self.driver,
+			'.ilc_question_KprimChoice input[name^="kprim_choice_result_"]',
+			attributes=("name", "value"))
+		for radio in radios:
+			i = int(radio["attributes"]["name"][len("kprim_choice_result_"):])
+			if i < self.n_rows:
+				ui[i][bool(int(radio["attributes"]["value"]))] = radio["checked"]
 		return ui
 
 	def _get_binary_answers(self):
@@ -57,7 +63,7 @@ class KPrimAnswer(Answer):
 			self.protocol.verify(
 				str(i),
 				self.current_answers[i],
-				ui[i][True].is_selected(),
+				ui[i][True],
 				after_crash=after_crash)
 
 		context.coverage.case_occurred(
@@ -11,14 +11,36 @@ from selenium.webdriver.common.action_chains import ActionChains
 from .answer import Answer, Validness
 from tiltr.data.exceptions import *
 from tiltr.driver.utils import wait_for_css_visible
+from tiltr.driver.dom import DomBatch, read_elements
 
 
-def _check_label(kind, element, stored):
-	displayed = element.find_element_by_css_selector('.ilc_qanswer_Answer').text
-	if displayed.strip() != stored:
+_term_css = '.ilc_question_MatchingQuestion #sourceArea .draggable[data-type="term"]'
+_definition_css = '.ilc_question_MatchingQuestion #targetArea .droparea[data-type="definition"]'
+
+
+def _check_label(kind, displayed, stored):
+	if displayed is None or displayed.strip() != stored:
 		raise IntegrityException('displayed %s label "%s" != "%s"' % (kind, displayed, stored))
 
 
+def _read_labels(driver):
+	# reads the displayed labels of all terms and definitions in one go.
+	batch = DomBatch()
+	terms = batch.read(
+		_term_css, attributes=("data-id",), children=dict(css='.ilc_qanswer_Answer'))
+	definitions = batch.read(
+		_definition_css, attributes=("data-id",),
+		children=dict(css='.ilMatchingQuestionDefinition .ilc_qanswer_Answer'))
+	results = batch.run(driver)
+
+	def labels(records):
+		return dict(
+			(r["attributes"]["data-id"], r["children"][0]["text"] if r["children"] else None)
+			for r in records)
+
+	return labels(results[terms]), labels(results[definitions])
+
+
 def _robust_drag_and_drop(chain, source_element, target_element):
 	chain.move_to_element(source_element)
 	chain.pause(1)
@@ -43,7 +65,7 @@ class MatchingAnswer(Answer):
 		self._set_answer(*self.question.get_random_answer(context))
 		return Validness()
 
-	def _try_drag_terms(self, source_area, target_element, definition_id, term_ids):
+	def _try_drag_terms(self, target_element, definition_id, term_ids):
 		term_ids = set(list(term_ids))  # copy
 		n_retries = 0
 
@@ -61,13 +83,8 @@ class MatchingAnswer(Answer):
 						self.question.get_term_label(term_id), term_id,
 						self.question.get_definition_label(definition_id), definition_id))
 
-				source_element = source_area.find_element_by_css_selector(
-					'.draggable[data-type="term"][data-id="%s"]' % term_id)
-
-				_check_label(
-					'term',
-					source_element,
-					self.question.get_term_label(term_id))
+				source_element = self.driver.find_element_by_css_selector(
+					'%s[data-id="%s"]' % (_term_css, term_id))
 
 				chain = ActionChains(self.driver)
 				if n_retries == 0:
@@ -78,13 +95,9 @@ class MatchingAnswer(Answer):
 				chain.perform()
 
 				if self.debug:
-					print(
-						"drag_and_drop:",
-						source_element.get_attribute('id'),
-						target_element.get_attribute('id'))
+					print("drag_and_drop:", term_id, definition_id)
 
-			for term in target_element.find_elements_by_css_selector('.draggable[data-type="term"]'):
-				term_ids.remove(term.get_attribute('data-id'))
+			term_ids.difference_update(self._parse_ui().get(definition_id, set()))
 
 		return True
 
@@ -102,21 +115,26 @@ class MatchingAnswer(Answer):
 
 			self._reset_answer_ui()
 
-			root = self.driver.find_element_by_css_selector('.ilc_question_MatchingQuestion')
-			source_area = root.find_element_by_css_selector('#sourceArea')
-			target_area = root.find_element_by_css_selector('#targetArea')
+			term_labels, definition_labels = _read_labels(self.driver)
 
-			success = True
 			for definition_id, term_ids in answer.items():
-				target_element = target_area.find_element_by_css_selector(
-					'.droparea[data-type="definition"][data-id="%s"]' % definition_id)
-
 				_check_label(
 					'definition',
-					target_element.find_element_by_css_selector('.ilMatchingQuestionDefinition'),
+					definition_labels.get(definition_id),
 					self.question.get_definition_label(definition_id))
 
-				if not self._try_drag_terms(source_area, target_element, definition_id, term_ids):
+				for term_id in term_ids:
+					_check_label(
+						'term',
+						term_labels.get(term_id),
+						self.question.get_term_label(term_id))
+
+			success = True
+			for definition_id, term_ids in answer.items():
+				target_element = self.driver.find_element_by_css_selector(
+					'%s[data-id="%s"]' % (_definition_css, definition_id))
+
+				if not self._try_drag_terms(target_element, definition_id, term_ids):
 					success = False
 					break
 
@@ -174,17 +192,15 @@ class MatchingAnswer(Answer):
 	def _parse_ui(self):
 		answers = dict()
 
-		root = self.driver.find_element_by_css_selector('.ilc_question_MatchingQuestion')
-		target_area = root.find_element_by_css_selector('#targetArea')
-
-		for definition in target_area.find_elements_by_css_selector('.droparea[data-type="definition"]'):
-			term_ids = set()
+		definitions = read_elements(
+			self.driver, _definition_css, attributes=("data-id",),
+			children=dict(css='.draggable[data-type="term"]', attributes=("data-id",)))
 
-			for term in definition.find_elements_by_css_selector('.draggable[data-type="term"]'):
-				term_ids.add(term.get_attribute('data-id'))
+		for definition in definitions:
+			term_ids = set(term["attributes"]["data-id"] for term in definition["children"])
 
 			if term_ids:
-				definition_id = definition.get_attribute('data-id')
+				definition_id = definition["attributes"]["data-id"]
 				answers[definition_id] = term_ids
 
 		return answers
@@ -6,9 +6,9 @@
 #
 
 import json
-from selenium.webdriver.common.action_chains import ActionChains
 
 from .answer import Answer, Validness, Choice
+from tiltr.driver.dom import DomBatch, read_elements
 
 
 class MultipleChoiceAnswer(Answer):
@@ -22,28 +22,28 @@ class MultipleChoiceAnswer(Answer):
 		return Validness()
 
 	def _set_answers(self, answers, score):
-		chain = ActionChains(self.driver)
+		batch = DomBatch()
 
 		for choice in self._parse_ui():
-			checkbox = self.driver.find_element_by_css_selector(choice.selector)
 			self.protocol.choose(choice.label, answers[choice.label])
-			if answers[choice.label] != checkbox.is_selected():
-				chain.click(checkbox)
+			batch.check(choice.selector, answers[choice.label])
 
-		chain.perform()
+		batch.run(self.driver)
 
 		self.current_answers = answers
 		self.current_score = score
 
 	def _parse_ui(self):
 		choices = []
-		for answer in self.driver.find_elements_by_css_selector('.ilc_question_MultipleChoice .ilc_qanswer_Answer'):
-			checkbox = answer.find_element_by_css_selector('input[type="checkbox"]')
-			label = answer.find_element_by_css_selector('label[for="%s"]' % checkbox.get_attribute("id"))
+		checkboxes = read_elements(
+			self.driver,
+			'.ilc_question_MultipleChoice .ilc_qanswer_Answer input[type="checkbox"]',
+			attributes=("id",), label=True)
+		for checkbox in checkboxes:
 			choices.append(Choice(
-				selector="#" + checkbox.get_attribute("id"),
-				label=label.text.strip(),
-				checked=checkbox.is_selected()))
+				selector="#" + checkbox["attributes"]["id"],
+				label=checkbox["label"],
+				checked=checkbox["checked"]))
 		return choices
 
 	def _get_binary_answers(self):
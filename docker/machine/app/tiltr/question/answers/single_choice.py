@@ -6,6 +6,7 @@
 #
 
 from .answer import Answer, Validness, Choice
+from tiltr.driver.dom import DomBatch, read_elements
 
 
 class SingleChoiceAnswer(Answer):
@@ -23,7 +24,9 @@ class SingleChoiceAnswer(Answer):
 		for choice in self._parse_ui():
 			self.protocol.choose(choice.label, choice.label == answer)
 			if choice.label == answer:
-				self.driver.find_element_by_css_selector(choice.selector).click()
+				batch = DomBatch()
+				batch.click(choice.selector)
+				batch.run(self.driver)
 				self.current_answer = answer
 				self.current_score = score
 				self.protocol.add("on _set_answer: current_answer == '%s'" % answer)
@@ -34,13 +37,15 @@ class SingleChoiceAnswer(Answer):
 
 	def _parse_ui(self):
 		choices = []
-		for answer in self.driver.find_elements_by_css_selector('.ilc_question_SingleChoice .ilc_qanswer_Answer'):
-			radio = answer.find_element_by_css_selector('input[type="radio"]')
-			label = answer.find_element_by_css_selector('label[for="%s"]' % radio.get_attribute("id"))
+		radios = read_elements(
+			self.driver,
+			'.ilc_question_SingleChoice .ilc_qanswer_Answer input[type="radio"]',
+			attributes=("id",), label=True)
+		for radio in radios:
 			choices.append(Choice(
-				selector="#" + radio.get_attribute("id"),
-				label=label.text.strip(),
-				checked=radio.is_selected()))
+				selector="#" + radio["attributes"]["id"],
+				label=radio["label"],
+				checked=radio["checked"]))
 		return choices
 
 	def verify(self, context, after_crash=False):
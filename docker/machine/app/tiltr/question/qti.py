@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018-2019 Rechenzentrum, Universitaet Regensburg
+# GPLv3, see LICENSE
+#
+
+import xml.etree.ElementTree as ET
+from decimal import *
+
+from tiltr.data.exceptions import *
+from .questions.question import Question
+from .questions.single_choice import SingleChoiceQuestion
+from .questions.multiple_choice import MultipleChoiceQuestion, MultipleChoiceItem
+from .questions.kprim import KPrimQuestion, KPrimScoring, KPrimChoice
+from .questions.cloze import ClozeQuestion, ClozeScoring, ClozeType, ClozeComparator, \
+	TextualGapScoring, NumericGapScoring
+from .questions.matching import MatchingQuestion, MatchingMultiplicity
+from .questions.longtext import LongTextQuestion
+
+
+# builds question definitions from the QTI xml of an ILIAS test export, i.e. without opening
+# each question's edit page in ILIAS. the resulting questions are the same as those that
+# get parsed from the UI (see TestDriver.parse_question_definitions), which stays the
+# reference: question types that are not supported here need to be parsed from the UI.
+
+
+def _create(cls, title):
+	# question constructors parse the UI, so bypass them.
+	question = object.__new__(cls)
+	Question.__init__(question, title)
+	return question
+
+
+def _metadata(item):
+	fields = dict()
+	for field in item.iter('qtimetadatafield'):
+		fields[field.findtext('fieldlabel')] = field.findtext('fieldentry') or ''
+	return fields
+
+
+def _labels(response):
+	# ident -> text of all response labels, in order.
+	labels = dict()
+	for label in response.iter('response_label'):
+		labels[label.get('ident')] = label.findtext('material/mattext') or ''
+	return labels
+
+
+def _conditions(item):
+	# yields (condition, score) for all respconditions, where condition is the
+	# conditionvar's only child and score is the setvar's value (or None).
+	for respcondition in item.iter('respcondition'):
+		children = list(respcondition.find('conditionvar'))
+		if len(children) != 1:
+			continue
+		setvar = respcondition.findtext('setvar')
+		yield children[0], (Decimal(setvar) if setvar is not None else None)
+
+
+def _varequal_scores(item, respident):
+	# value -> score of all unnegated varequal conditions on respident, in order.
+	scores = dict()
+	for condition, score in _conditions(item):
+		if condition.tag == 'varequal' and condition.get('respident') == respident:
+			scores[condition.text or ''] = score
+	return scores
+
+
+def _parse_single_choice(item, title, settings):
+	labels = _labels(item.find('.//response_lid'))
+	scores = _varequal_scores(item, 'MCSR')
+
+	question = _create(SingleChoiceQuestion, title)
+	question.choices = dict((text, scores[ident]) for ident, text in labels.items())
+	return question
+
+
+def _parse_multiple_choice(item, title, settings):
+	labels = _labels(item.find('.//response_lid'))
+	checked = _varequal_scores(item, 'MCMR')
+
+	unchecked = dict()
+	for condition, score in _conditions(item):
+		if condition.tag == 'not':
+			varequal = condition.find('varequal')
+			if varequal is not None and varequal.get('respident') == 'MCMR':
+				unchecked[varequal.text] = score
+
+	question = _create(MultipleChoiceQuestion, title)
+	question.choices = dict(
+		(text, MultipleChoiceItem(checked[ident], unchecked[ident])) for ident, text in labels.items())
+	return question
+
+
+def _parse_kprim(item, title, settings):
+	labels = _labels(item.find('.//response_lid'))
+	if len(labels) != 4:
+		raise InteractionException('KPrim question "%s" has %d choices.' % (title, len(labels)))
+
+	correct = dict()
+	for condition, _ in _conditions(item):
+		if condition.tag == 'varequal':
+			correct[condition.get('respident')] = condition.text == '1'
+
+	decvar = item.find('.//outcomes/decvar')
+	halfpoints = _metadata(item).get('score_partsol_enabled', decvar.get('minvalue'))
+
+	question = _create(KPrimQuestion, title)
+	question.scoring = KPrimScoring(
+		halfpoints=halfpoints == '1',
+		score=Decimal(decvar.get('maxvalue')),
+		choices=[KPrimChoice(text, correct[ident]) for ident, text in labels.items()])
+	return question
+
+
+def _parse_cloze(item, title, settings):
+	metadata = _metadata(item)
+
+	fixed_text_length = metadata.get('fixedTextLength', '').strip()
+	fixed_text_length = int(fixed_text_length) if fixed_text_length else None
+
+	gaps = list()
+	for response in item.find('presentation').iter():
+		if response.tag not in ('response_str', 'response_num'):
+			continue
+
+		gap_index = len(gaps)
+		respident = response.get('ident')
+		if respident != 'gap_%d' % gap_index:
+			raise InteractionException('unexpected gap %s in "%s".' % (respident, title))
+
+		options = _varequal_scores(item, respident)
+		if not options:
+			raise InteractionException("did not find gap options (%d)" % gap_index)
+
+		seen = set()
+		for key in options.keys():
+			if key.strip() in seen:
+				raise InteractionException("the gap has multiple identical options named '%s'. unsupported." % key)
+			seen.add(key.strip())
+
+		if response.tag == 'response_num':
+			fib = response.find('render_fib')
+			(value, score), = options.items()
+			gaps.append(NumericGapScoring(
+				cloze_type=ClozeType.numeric,
+				value=Decimal(value),
+				lower=Decimal(fib.get('minnumber')),
+				upper=Decimal(fib.get('maxnumber')),
+				score=score))
+		elif response.find('render_choice') is not None:
+			gaps.append(TextualGapScoring(
+				cloze_type=ClozeType.select, size=None, options=options))
+		else:
+			size = int(response.find('render_fib').get('maxchars') or 0)
+			gaps.append(TextualGapScoring(
+				cloze_type=ClozeType.text, size=size if size > 0 else fixed_text_length, options=options))
+
+	question = _create(ClozeQuestion, title)
+	question.scoring = ClozeScoring(
+		identical_scoring=metadata.get('identicalScoring') == '1',
+		comparator=ClozeComparator(metadata.get('textgaprating')),
+		gaps=gaps)
+	question._create_gaps()
+	return question
+
+
+def _parse_matching(item, title, settings):
+	modes = {'1:1': MatchingMultiplicity.ONE_TO_ONE, 'n:n': MatchingMultiplicity.MANY_TO_MANY}
+	mode = _metadata(item).get('matching_mode')
+	if mode not in modes:
+		raise NotImplementedException('unknown matching mode %s' % mode)
+
+	# definitions are the labels that terms get matched to.
+	definitions = dict()
+	terms = dict()
+	for label in item.find('.//response_grp').iter('response_label'):
+		items = definitions if label.get('match_group') is not None else terms
+		items[label.get('ident')] = label.findtext('material/mattext') or ''
+
+	scores = dict()
+	for condition, score in _conditions(item):
+		if condition.tag == 'varsubset':
+			term, definition = condition.text.split(',')
+			scores[(definition, term)] = score
+
+	question = _create(MatchingQuestion, title)
+	question.multiplicity = modes[mode]
+	question.definitions = definitions
+	question.terms = terms
+	question.scores = scores
+	return question
+
+
+def _parse_longtext(item, title, settings):
+	if _metadata(item).get('termrelation') != 'non':
+		raise NotImplementedException(
+			"only manual scoring is currently supported for tests with LongTextQuestions")
+
+	question = _create(LongTextQuestion, title)
+	question.length = int(settings.max_long_text_length)
+	question._maximum_score = Decimal(item.find('.//outcomes/decvar').get('maxvalue'))
+	return question
+
+
+_parsers = {
+	'SINGLE CHOICE QUESTION': _parse_single_choice,
+	'MULTIPLE CHOICE QUESTION': _parse_multiple_choice,
+	'KPRIM CHOICE QUESTION': _parse_kprim,
+	'CLOZE QUESTION': _parse_cloze,
+	'MATCHING QUESTION': _parse_matching,
+	'TEXT QUESTION': _parse_longtext,
+}
+
+
+def parse_qti_questions(data, settings):
+	# returns title -> question for all items in the QTI xml data. raises NotImplementedException
+	# if some question cannot be parsed from QTI, in which case the UI needs to be used.
+	questions = dict()
+
+	for item in ET.fromstring(data).iter('item'):
+		title = item.get('title')
+		if title in questions:
+			# our data structures use question titles as a primary key for questions.
+			raise InteractionException('duplicate question titled "%s" is not allowed.' % title)
+
+		question_type = _metadata(item).get('QUESTIONTYPE')
+		parse = _parsers.get(question_type)
+		if parse is None:
+			raise NotImplementedException('question type %s is not supported in QTI.' % question_type)
+
+		try:
+			questions[title] = parse(item, title, settings)
+		except (KeyError, ValueError, AttributeError, TypeError, InvalidOperation) as e:
+			raise NotImplementedException('could not parse "%s" from QTI: %s' % (title, repr(e)))
+
+	return questions
+
+
+def get_question_types(data):
+	# the QTI question type (e.g. "CLOZE QUESTION") of each item in the QTI xml data.
+	return [_metadata(item).get('QUESTIONTYPE') for item in ET.fromstring(data).iter('item')]
+
+
+def get_definition(question):
+	# the attributes that define a question, for comparing questions parsed from QTI and UI.
+	definition = dict(vars(question))
+	definition.pop('gaps', None)  # derived from scoring
+	return (question.__class__.__name__, definition)